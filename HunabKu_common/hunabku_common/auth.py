@@ -0,0 +1,135 @@
+from flask import g, has_request_context, request
+from hashlib import sha256
+from threading import Lock, Thread
+import hmac
+import logging
+import time
+
+
+def digest(apikey: str) -> bytes:
+    return sha256(apikey.encode()).digest()
+
+
+def same_key(apikey: str, expected: str) -> bool:
+    """
+    Compares two apikeys in constant time, None is never valid.
+    """
+    if apikey is None or expected is None:
+        return False
+    return hmac.compare_digest(apikey.encode(), expected.encode())
+
+
+class KeyStore:
+    """
+    In memory store of the API keys and their metadata (name, limits, etc).
+
+    The keys are indexed by their SHA-256 digest, then the check of a request is a dict lookup
+    and its time does not depend on how many characters of a valid key were guessed.
+    The keys of the config are added with add, the keys of MongoDB (or any other source)
+    are loaded with load and reloaded in background every ttl seconds, a failed load keeps the old keys.
+    """
+
+    def __init__(self, load=None, ttl: int = 60):
+        self.load = load
+        self.ttl = ttl
+        self.config_keys = {}
+        self.keys = {}
+        self.loaded = 0
+        self.lock = Lock()
+        self.refreshing = False
+        self.logger = logging.getLogger(__name__)
+
+    def configure(self, load, ttl: int = 60):
+        """
+        Sets the function that returns the keys, an iterable of dicts with the apikey
+        (or its hex digest in apikey_sha256) and the metadata, the keys with enabled False are skipped.
+        """
+        with self.lock:
+            self.load = load
+            self.ttl = ttl
+            self.loaded = 0
+        # first load in background, the plugins must load even if the source is down
+        self._refresh_if_stale()
+
+    def add(self, apikey: str, **metadata):
+        """
+        Adds a key of the config, it is kept when the keys are reloaded.
+        """
+        key = digest(apikey)
+        metadata.setdefault('name', key.hex()[:12])
+        with self.lock:
+            self.config_keys = {**self.config_keys, key: metadata}
+
+    def refresh(self):
+        """
+        Loads the keys with load.
+        """
+        try:
+            keys = {}
+            for doc in self.load():
+                metadata = {name: value for name, value in doc.items()
+                            if name not in ('_id', 'apikey', 'apikey_sha256', 'enabled')}
+                if not doc.get('enabled', True):
+                    continue
+                if doc.get('apikey'):
+                    key = digest(doc['apikey'])
+                elif doc.get('apikey_sha256'):
+                    key = bytes.fromhex(doc['apikey_sha256'])
+                else:
+                    continue
+                metadata.setdefault('name', key.hex()[:12])
+                keys[key] = metadata
+            with self.lock:
+                self.keys = keys
+                self.loaded = time.monotonic()
+        except Exception as e:
+            self.logger.warning(f'can not load the API keys: {e}')
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def _refresh_if_stale(self):
+        with self.lock:
+            if self.load is None or self.refreshing or time.monotonic() - self.loaded < self.ttl:
+                return
+            self.refreshing = True
+        Thread(target=self.refresh, daemon=True).start()
+
+    def lookup(self, apikey: str):
+        """
+        Returns the metadata of the apikey or None if it is not valid.
+        """
+        if not apikey:
+            return None
+        self._refresh_if_stale()
+        key = digest(apikey)
+        metadata = self.keys.get(key)
+        if metadata is None:
+            metadata = self.config_keys.get(key)
+        return metadata
+
+
+API_KEYS = KeyStore()
+
+
+def request_apikey() -> str:
+    """
+    Returns the apikey of the current request, from the query string
+    or from the form data of POST requests.
+    """
+    apikey = request.args.get('apikey')
+    if apikey is None and request.method == 'POST':
+        apikey = request.form.get('apikey')
+    return apikey
+
+
+def check_apikey(store: KeyStore = API_KEYS) -> bool:
+    """
+    Checks the apikey of the current request in the store,
+    the metadata of the key is saved in flask.g.hunabku_apikey for the rest of the request.
+    """
+    if not has_request_context():
+        return False
+    metadata = store.lookup(request_apikey())
+    g.hunabku_apikey = metadata
+    return metadata is not None
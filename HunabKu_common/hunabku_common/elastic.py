@@ -0,0 +1,139 @@
+from elasticsearch import Elasticsearch, __version__ as es_version
+from threading import Lock, Thread
+from fnmatch import fnmatch
+import logging
+import time
+
+
+# clients shared by the plugins, keyed by uri, credentials and transport settings
+_clients = {}
+_clients_lock = Lock()
+
+
+def get_client(uri: str, user: str, password: str, maxsize: int = 25, http_compress: bool = True,
+               request_timeout: float = 30, max_retries: int = 3, retry_on_timeout: bool = True,
+               backoff_factor: float = 1.0):
+    """
+    Returns the Elastic Search client for the uri, the plugins configured with the same
+    uri and settings share a single client and then its pool of keep-alive connections.
+
+    Args:
+        uri (str): Elastic Search url.
+        user (str): Elastic Search user.
+        password (str): Elastic Search password.
+        maxsize (int): Connections kept open per node, concurrent searches over it wait for a free connection.
+        http_compress (bool): Compress the requests with gzip.
+        request_timeout (float): Seconds to wait for a response.
+        max_retries (int): Retries of a request on connection errors (and timeouts if retry_on_timeout).
+        retry_on_timeout (bool): Retry the requests that timed out.
+        backoff_factor (float): Backoff in seconds of a node marked as dead after a failure,
+            it is doubled on every consecutive failure (only for elasticsearch>=8).
+
+    Returns:
+        Elasticsearch: the shared client.
+    """
+    key = (uri, user, password, maxsize, http_compress, request_timeout,
+           max_retries, retry_on_timeout, backoff_factor)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            auth = (user, password)
+            options = {'http_compress': http_compress,
+                       'max_retries': max_retries,
+                       'retry_on_timeout': retry_on_timeout}
+            if es_version[0] < 8:
+                client = Elasticsearch(uri, http_auth=auth, maxsize=maxsize,
+                                       timeout=request_timeout, **options)
+            else:
+                client = Elasticsearch(uri, basic_auth=auth, connections_per_node=maxsize,
+                                       request_timeout=request_timeout,
+                                       dead_node_backoff_factor=backoff_factor, **options)
+            _clients[key] = client
+        return client
+
+
+class IndexCatalog:
+    """
+    Cache of the names of the indices and aliases of Elastic Search.
+
+    The names are loaded with a single request and refreshed in background
+    when they are older than ttl seconds, so the searches don't pay an extra
+    round trip to check if the index exists. The catalog is only used to fail
+    fast for indices known to be missing, a 404 returned by a search must be
+    reported with invalidate.
+    """
+
+    def __init__(self, es, ttl: int = 60):
+        self.es = es
+        self.ttl = ttl
+        self.names = None
+        self.loaded = 0
+        self.lock = Lock()
+        self.refreshing = False
+        self.logger = logging.getLogger(__name__)
+
+    def refresh(self):
+        """
+        Loads the names of all the indices and their aliases.
+        """
+        try:
+            data = self.es.indices.get_alias(index='*')
+            names = set()
+            for index, info in data.items():
+                names.add(index)
+                names.update(info.get('aliases', {}).keys())
+            with self.lock:
+                self.names = names
+                self.loaded = time.monotonic()
+        except Exception as e:
+            self.logger.warning(f'can not load the Elastic Search indices: {e}')
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def _refresh_if_stale(self):
+        with self.lock:
+            if self.refreshing or time.monotonic() - self.loaded < self.ttl:
+                return
+            self.refreshing = True
+        Thread(target=self.refresh, daemon=True).start()
+
+    def exists(self, index: str):
+        """
+        Checks in the cache if an index, alias or pattern (ex: scienti_*_2022_product) exists.
+
+        Returns:
+            bool or None: None if the names were not loaded yet.
+        """
+        self._refresh_if_stale()
+        names = self.names
+        if names is None:
+            return None
+        if '*' in index or '?' in index:
+            return any(fnmatch(name, index) for name in names)
+        return index in names
+
+    def matching(self, pattern: str):
+        """
+        Returns the sorted names in the cache that match the pattern (ex: scienti_*_2022_product).
+
+        Returns:
+            list or None: None if the names were not loaded yet.
+        """
+        self._refresh_if_stale()
+        names = self.names
+        if names is None:
+            return None
+        return sorted(name for name in names if fnmatch(name, pattern))
+
+    def invalidate(self, index: str):
+        """
+        Removes an index reported as not found by Elastic Search
+        and schedules a refresh of the catalog.
+        """
+        with self.lock:
+            if self.names is not None:
+                # replaced instead of modified, it can be iterated by other threads
+                self.names = self.names - {index}
+            self.loaded = 0
+        self._refresh_if_stale()
@@ -0,0 +1,83 @@
+from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
+from hunabku.Config import Config, Param
+from hunabku_common.auth import API_KEYS, check_apikey
+from hunabku_common.limits import LIMITER, SharedWindows, install
+from pymongo import MongoClient
+from flask import g
+from threading import Thread
+
+
+class Auth(HunabkuPluginBase):
+    config = Config()
+    config += Param(apikeys_db_uri="",
+                    doc="MongoDB string connection of the API keys of the clients, empty to accept only the hunabku apikey")
+    config += Param(apikeys_db_name="hunabku",
+                    doc="MongoDB name of the API keys")
+    config += Param(apikeys_collection="apikeys",
+                    doc="Collection of the API keys, documents with apikey (or apikey_sha256), name, enabled and the limits of the client")
+    config += Param(apikeys_ttl=60,
+                    doc="Seconds after which the API keys are reloaded, keys are added or revoked without restarting")
+    config += Param(rate_limit=0,
+                    doc="Cost units per second allowed to every API key (a lookup costs 1, a full dump more), 0 for no limit")
+    config += Param(rate_burst=60,
+                    doc="Cost units an API key can spend at once before it is limited to rate_limit, a request that costs more is rejected")
+    config += Param(max_concurrent=0,
+                    doc="Requests of an API key running at the same time in every server process, 0 for no limit")
+    config += Param(rate_limit_db_uri="",
+                    doc="MongoDB string connection to share the rate limits between the server processes, empty to limit every process alone")
+    config += Param(rate_limit_collection="rate_limits",
+                    doc="Collection of the shared rate limits, in the database apikeys_db_name")
+
+    def __init__(self, hunabku):
+        super().__init__(hunabku)
+        # the keys of all the plugins that check the apikey with hunabku_common.auth.check_apikey
+        API_KEYS.add(self.global_config["apikey"], name='hunabku', admin=True)
+        if self.config.apikeys_db_uri:
+            collection = MongoClient(self.config.apikeys_db_uri)[self.config.apikeys_db_name][self.config.apikeys_collection]
+            API_KEYS.configure(collection.find, self.config.apikeys_ttl)
+        shared = None
+        if self.config.rate_limit_db_uri:
+            shared = SharedWindows(MongoClient(self.config.rate_limit_db_uri)[self.config.apikeys_db_name][self.config.rate_limit_collection])
+            # created in background, the plugin must load even if MongoDB is down.
+            Thread(target=self.create_indexes, args=(shared,), daemon=True).start()
+        LIMITER.configure(self.config.rate_limit, self.config.rate_burst, self.config.max_concurrent, shared)
+        # the hooks are global to the Flask app, then the requests of all the plugins are limited
+        install(self.app)
+
+    def create_indexes(self, shared):
+        try:
+            shared.ensure_indexes()
+        except Exception as e:
+            self.logger.warning(f'Auth: can not create the indexes of the rate limits: {e}')
+
+    def valid_apikey(self):
+        return check_apikey()
+
+    @endpoint('/auth/reload', methods=['POST'])
+    def reload(self):
+        """
+        @api {post} /auth/reload Reload API keys
+        @apiName ReloadApikeys
+        @apiGroup Common
+        @apiDescription Reloads right away the API keys of the clients from MongoDB,
+                        they are also reloaded every apikeys_ttl seconds. Only for admin keys (the hunabku apikey).
+
+        @apiParam {String} apikey  Credential for authentication
+
+        @apiSuccess {Number}  keys  Number of API keys of the clients loaded.
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+
+        @apiExample {curl} Example usage:
+            curl -i -X POST https://apis.colav.co/auth/reload -d apikey=XXXX
+        """
+        if not self.valid_apikey() or not g.hunabku_apikey.get('admin'):
+            return self.apikey_error()
+        if API_KEYS.load is not None:
+            API_KEYS.refresh()
+        response = self.app.response_class(
+            response=self.json.dumps({'keys': len(API_KEYS.keys)}),
+            status=200,
+            mimetype='application/json'
+        )
+        return response
@@ -0,0 +1,169 @@
+from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
+from hunabku.Config import Config, Param
+from hunabku_common.auth import check_apikey
+from hunabku_common.exports import EXPORTS, ExportJobs
+from flask import send_file
+import os
+import tempfile
+
+
+class Exports(HunabkuPluginBase):
+    config = Config()
+    config += Param(exports_dir=os.path.join(tempfile.gettempdir(), "hunabku_exports"),
+                    doc="Directory of the files of the exports, shared by the server processes of the host")
+    config += Param(exports_workers=2,
+                    doc="Number of exports written at the same time by every server process")
+    config += Param(exports_ttl=86400,
+                    doc="Seconds to keep an export after it is done")
+    config += Param(exports_timeout=600,
+                    doc="Seconds without news of the process of a queued or running export after which it is failed and can be submitted again")
+
+    def __init__(self, hunabku):
+        super().__init__(hunabku)
+        self.jobs = ExportJobs(self.config.exports_dir, self.config.exports_workers,
+                               self.config.exports_ttl, self.config.exports_timeout)
+
+    def valid_apikey(self):
+        return check_apikey()
+
+    def job_data(self, status: dict) -> dict:
+        data = dict(status)
+        data['status_url'] = f"/exports/{status['job_id']}"
+        if status['status'] == 'done':
+            data['download_url'] = f"/exports/{status['job_id']}/download"
+        return data
+
+    @endpoint('/exports', methods=['POST'])
+    def submit(self):
+        """
+        @api {post} /exports Submit an export
+        @apiName SubmitExport
+        @apiGroup Common
+        @apiDescription Starts in background the export of a big result set to a gzipped NDJSON file,
+                        returns the job to follow with /exports/{job_id} and the file is downloaded from
+                        /exports/{job_id}/download when it is done. An export with the same parameters
+                        is served from the same file until the data changes.
+
+        @apiParam {String} apikey  Credential for authentication
+        @apiParam {String} export  Name of the export, the exports available are returned in the errors, ex: dspace_product
+        @apiParam {String} ...  Parameters of the export, ex: institution
+
+        @apiSuccess {String}  job_id  Id of the export job, with status queued, running, done or failed.
+        @apiSuccess {String}  status_url  Url of the status of the job.
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 400) msg  Bad request, if the export or the parameters are not valid.
+        @apiError (Error 503) msg  Service Unavailable, if the data of the export can not be read.
+
+        @apiExample {curl} Example usage:
+            curl -i -X POST https://apis.colav.co/exports -d apikey=XXXX -d export=dspace_product -d institution=udea
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+        params = {name: value for name, value in self.request.values.items() if name not in ('apikey', 'export')}
+        export = EXPORTS.get(self.request.values.get('export'))
+        if export is None or set(params) != set(export.params):
+            if export is None:
+                message = f"invalid export, options are: {sorted(EXPORTS)}"
+            else:
+                message = f"the parameters of {export.name} are {export.params}"
+            data = {"error": "Bad Request", "message": message}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+        try:
+            job_id = self.jobs.submit(export, params)
+        except ValueError as e:
+            data = {"error": "Bad Request", "message": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+        except Exception as e:
+            # the database of the export or the disk of the exports failed
+            self.logger.warning(f'Exports: can not submit the export {export.name}: {e}')
+            data = {"error": "Service Unavailable", "message": f"the export {export.name} can not be submitted now, please retry later"}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=503,
+                mimetype='application/json'
+            )
+            return response
+        # the job can be created right now by another server process
+        status = self.jobs.get(job_id) or {'job_id': job_id, 'export': export.name, 'status': 'queued'}
+        data = self.job_data(status)
+        response = self.app.response_class(
+            response=self.json.dumps(data),
+            status=202,
+            mimetype='application/json'
+        )
+        response.headers['Location'] = data['status_url']
+        return response
+
+    @endpoint('/exports/<job_id>', methods=['GET'])
+    def status(self, job_id):
+        """
+        @api {get} /exports/:job_id Export status
+        @apiName ExportStatus
+        @apiGroup Common
+        @apiDescription Returns the status of an export job, the number of records written
+                        and the url to download the file when it is done.
+
+        @apiParam {String} apikey  Credential for authentication
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 404) msg  The job does not exist or it expired.
+
+        @apiExample {curl} Example usage:
+            curl -i https://apis.colav.co/exports/XXXX?apikey=XXXX
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+        status = self.jobs.get(job_id)
+        if status is None:
+            return self.not_found(job_id)
+        response = self.app.response_class(
+            response=self.json.dumps(self.job_data(status)),
+            status=200,
+            mimetype='application/json'
+        )
+        return response
+
+    @endpoint('/exports/<job_id>/download', methods=['GET'])
+    def download(self, job_id):
+        """
+        @api {get} /exports/:job_id/download Export download
+        @apiName ExportDownload
+        @apiGroup Common
+        @apiDescription Sends the gzipped NDJSON file of a done export, with support of
+                        HTTP range requests to resume the download.
+
+        @apiParam {String} apikey  Credential for authentication
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 404) msg  The job does not exist, it expired or it is not done.
+
+        @apiExample {curl} Example usage:
+            curl -C - -o udea.ndjson.gz https://apis.colav.co/exports/XXXX/download?apikey=XXXX
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+        status = self.jobs.get(job_id)
+        if status is None or status['status'] != 'done':
+            return self.not_found(job_id)
+        return send_file(self.jobs.file_path(job_id), mimetype='application/gzip', as_attachment=True,
+                         download_name=f"{status['export']}-{job_id}.ndjson.gz", conditional=True)
+
+    def not_found(self, job_id):
+        data = {"error": "Not Found", "message": f"export {job_id} not found or not done"}
+        response = self.app.response_class(
+            response=self.json.dumps(data),
+            status=404,
+            mimetype='application/json'
+        )
+        return response
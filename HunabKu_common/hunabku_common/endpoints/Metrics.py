@@ -0,0 +1,97 @@
+from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
+from hunabku.Config import Config, Param
+from hunabku_common.auth import check_apikey
+from hunabku_common.timing import install, render_metrics
+from hunabku_common.slowlog import SLOW_REQUESTS
+from flask import g
+
+
+class Metrics(HunabkuPluginBase):
+    config = Config()
+    config += Param(metrics_apikey=True,
+                    doc="Require the apikey to read /metrics, disable it if the scraper can not send it")
+    config += Param(slow_request_threshold=1.0,
+                    doc="Seconds after which a request is saved in the slow requests log, 0 to save all the requests")
+    config += Param(slow_request_size=1000,
+                    doc="Number of slow requests kept in memory by every server process")
+
+    def __init__(self, hunabku):
+        super().__init__(hunabku)
+        # the hooks are global to the Flask app, then all the plugins are timed
+        install(self.app)
+        SLOW_REQUESTS.configure(self.config.slow_request_threshold,
+                                self.config.slow_request_size)
+
+    def valid_apikey(self):
+        # the metrics show the parameters of the requests of all the clients
+        return check_apikey() and bool(g.hunabku_apikey.get('admin'))
+
+    @endpoint('/metrics', methods=['GET'])
+    def metrics(self):
+        """
+        @api {get} /metrics Metrics
+        @apiName Metrics
+        @apiGroup Common
+        @apiDescription Histograms of the time of the requests of all the plugins,
+                        and of their phases (validation, catalog, mongo_query, es_query, serialization, send,
+                        coalesced: waiting for an identical request in flight)
+                        in the Prometheus text format.
+                        The values are kept in memory by every server process.
+                        The times of the phases of a request are also sent in its Server-Timing header.
+                        Only for admin keys (the hunabku apikey).
+
+        @apiParam {String} apikey  Credential for authentication
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+
+        @apiExample {curl} Example usage:
+            curl -i https://apis.colav.co/metrics?apikey=XXXX
+        """
+        if self.config.metrics_apikey and not self.valid_apikey():
+            return self.apikey_error()
+        response = self.app.response_class(
+            response=render_metrics(),
+            status=200,
+            mimetype='text/plain; version=0.0.4'
+        )
+        return response
+
+    @endpoint('/metrics/slow_requests', methods=['GET'])
+    def slow_requests(self):
+        """
+        @api {get} /metrics/slow_requests Slow requests
+        @apiName SlowRequests
+        @apiGroup Common
+        @apiDescription Returns the last requests of all the plugins that took more than slow_request_threshold seconds,
+                        the newest first. Every request has the endpoint, the parameters (without apikey),
+                        the Mongo filters or Elastic Search bodies sent with their shape and the number of documents returned,
+                        the bytes of the response and the time of its phases.
+                        The requests are kept in memory by every server process.
+                        Only for admin keys (the hunabku apikey).
+
+        @apiParam {String} apikey  Credential for authentication
+        @apiParam {String} endpoint  Only the requests to this endpoint, ex: /scienti/product
+        @apiParam {Number} min_seconds  Only the requests that took at least min_seconds
+        @apiParam {Number} limit  Maximum number of requests returned, default 100
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 400) msg  Bad request, if min_seconds or limit are not numbers.
+
+        @apiExample {curl} Example usage:
+            curl -i https://apis.colav.co/metrics/slow_requests?apikey=XXXX&endpoint=/scienti/product&min_seconds=5
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+        try:
+            min_seconds = float(self.request.args.get('min_seconds', 0))
+            limit = int(self.request.args.get('limit', 100))
+        except ValueError:
+            return self.badrequest_error()
+        data = SLOW_REQUESTS.find(self.request.args.get('endpoint'), min_seconds, limit)
+        response = self.app.response_class(
+            # the filters can have values that are not json (ObjectId, dates)
+            response=self.json.dumps(data, default=str),
+            status=200,
+            mimetype='application/json'
+        )
+        return response
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock, Thread
+import gzip
+import json
+import logging
+import os
+import time
+
+
+class Export(namedtuple('Export', ['name', 'params', 'run', 'version'])):
+    """
+    Declaration of an export, name identifies it in /exports and params are the parameters it requires.
+    run receives the parameters (dict) and returns an iterable of records, version receives the same
+    parameters and returns a value that changes when the data changes (ex: number of records and last update),
+    the exports with the same parameters and version are served from the same file.
+    version raises ValueError if the parameters are not valid (ex: unknown institution).
+    """
+    __slots__ = ()
+
+
+# exports of all the plugins by name
+EXPORTS = {}
+
+
+def register_export(name: str, params: list, run, version):
+    EXPORTS[name] = Export(name, params, run, version)
+
+
+class ExportJobs:
+    """
+    Background jobs that write the exports to local disk as gzipped NDJSON.
+
+    The jobs run in a local thread pool and their state is saved in a JSON file next to the export,
+    so every server process of the host can report it and send the file. The job id is the hash of
+    the export, the parameters and the version of the data, then an export already done is reused
+    until the data changes. The states are queued, running, done and failed. The process of the pending
+    (queued or running) jobs touches their status every timeout / 4 seconds, a pending job that is
+    not touched in timeout seconds is failed (ex: the process was restarted) and can be submitted again.
+    """
+
+    def __init__(self, path: str, workers: int = 2, ttl: int = 86400, timeout: int = 600):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.logger = logging.getLogger(__name__)
+        # pending jobs of this process
+        self.pending = set()
+        self.lock = Lock()
+        os.makedirs(path, exist_ok=True)
+        Thread(target=self._heartbeat, daemon=True).start()
+
+    def status_path(self, job_id: str) -> str:
+        return os.path.join(self.path, f'{job_id}.json')
+
+    def file_path(self, job_id: str) -> str:
+        return os.path.join(self.path, f'{job_id}.ndjson.gz')
+
+    def _write_status(self, job_id: str, status: dict):
+        status['updated'] = datetime.utcnow().isoformat()
+        tmp = f'{self.status_path(job_id)}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp, self.status_path(job_id))
+
+    def _heartbeat(self):
+        """
+        Touches the status of the pending jobs of the process, the queued jobs are alive
+        while they wait for a worker and the running ones while they read slow queries.
+        """
+        while True:
+            time.sleep(self.timeout / 4)
+            with self.lock:
+                pending = list(self.pending)
+            for job_id in pending:
+                try:
+                    os.utime(self.status_path(job_id))
+                except OSError:
+                    pass
+
+    def get(self, job_id: str):
+        """
+        Returns the status of the job or None if the job does not exist.
+        """
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self.status_path(job_id)) as f:
+                status = json.load(f)
+            age = time.time() - os.path.getmtime(self.status_path(job_id))
+        except (OSError, ValueError):
+            return None
+        if status['status'] in ('queued', 'running') and age > self.timeout:
+            status['status'] = 'failed'
+            status['error'] = 'the job was interrupted'
+        if status['status'] == 'done' and not os.path.exists(self.file_path(job_id)):
+            return None
+        return status
+
+    def submit(self, export: Export, params: dict) -> str:
+        """
+        Enqueues an export, if the same export with the same data is pending or done
+        the existing job is returned instead of creating a new one.
+
+        Returns:
+            str: The job id.
+        """
+        version = export.version(params)
+        key = json.dumps([export.name, params, version], sort_keys=True, default=str)
+        job_id = sha256(key.encode()).hexdigest()[:32]
+        status = self.get(job_id)
+        if status is not None and status['status'] != 'failed':
+            return job_id
+        if status is None:
+            try:
+                # only one process of the host creates the job
+                os.close(os.open(self.status_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                return job_id
+        self._write_status(job_id, {'job_id': job_id, 'export': export.name, 'params': params,
+                                    'status': 'queued', 'created': datetime.utcnow().isoformat()})
+        with self.lock:
+            self.pending.add(job_id)
+        self.executor.submit(self._run, job_id, export, params)
+        self.cleanup()
+        return job_id
+
+    def _run(self, job_id: str, export: Export, params: dict):
+        try:
+            self._write(job_id, export, params)
+        finally:
+            with self.lock:
+                self.pending.discard(job_id)
+
+    def _write(self, job_id: str, export: Export, params: dict):
+        status = self.get(job_id)
+        status.update({'status': 'running', 'records': 0})
+        self._write_status(job_id, status)
+        tmp = f'{self.file_path(job_id)}.tmp'
+        try:
+            with gzip.open(tmp, 'wt') as f:
+                for record in export.run(params):
+                    f.write(json.dumps(record, default=str))
+                    f.write('\n')
+                    status['records'] += 1
+                    if status['records'] % 10000 == 0:
+                        self._write_status(job_id, status)
+            os.replace(tmp, self.file_path(job_id))
+        except Exception as e:
+            self.logger.warning(f'export {job_id} failed: {e}')
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            status.update({'status': 'failed', 'error': str(e)})
+            self._write_status(job_id, status)
+            return
+        status.update({'status': 'done', 'size': os.path.getsize(self.file_path(job_id))})
+        self._write_status(job_id, status)
+
+    def cleanup(self):
+        """
+        Removes the jobs and files not updated in ttl seconds.
+        """
+        limit = time.time() - self.ttl
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.remove(path)
+            except OSError:
+                pass
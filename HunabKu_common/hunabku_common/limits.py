@@ -0,0 +1,232 @@
+from flask import current_app, g, request
+from hunabku_common.auth import API_KEYS, request_apikey
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from threading import Lock
+import json
+import logging
+import math
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket of an API key, it is refilled with rate tokens per second up to burst tokens.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """
+        Takes cost tokens if there are enough.
+
+        Returns:
+            float: 0 if the tokens were taken, else the seconds to wait for them.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+
+class SharedWindows:
+    """
+    Rate limit shared by all the server processes, the cost of every API key is added
+    in a MongoDB collection in windows of burst / rate seconds (the same average rate of the bucket),
+    the windows are removed by a TTL index. The cost is added only if it fits in the window,
+    the rejected requests do not spend it.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index('expires', expireAfterSeconds=0)
+
+    def take(self, name: str, cost: float, rate: float, burst: float) -> float:
+        window = burst / rate
+        now = time.time()
+        start = now - now % window
+        key = f'{name}:{int(start)}'
+        try:
+            # a full window does not match and the upsert fails with its _id
+            self.collection.find_one_and_update(
+                {'_id': key, 'cost': {'$lte': burst - cost}},
+                {'$inc': {'cost': cost},
+                 '$setOnInsert': {'expires': datetime.utcfromtimestamp(start) + timedelta(seconds=2 * window)}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            doc = self.collection.find_one({'_id': key})
+            if doc is None or doc['cost'] + cost <= burst:
+                # the window was created at the same time by another request
+                return self.take(name, cost, rate, burst)
+            return start + window - now
+        return 0
+
+
+class Limiter:
+    """
+    Rate limit (cost units per second) and maximum of concurrent requests of every API key,
+    the defaults are set with configure and can be changed per key with the metadata
+    rate, burst and concurrency of hunabku_common.auth. The keys with admin metadata are not limited.
+    The concurrent requests are counted by every server process.
+
+    A request that costs more than the burst could never be paid, it is rejected (acquire returns inf)
+    and a warning is logged once, the burst should be at least the cost of the heaviest request (see set_cost).
+    """
+
+    def __init__(self):
+        self.rate = 0
+        self.burst = 60
+        self.concurrency = 0
+        self.shared = None
+        self.buckets = {}
+        self.running = {}
+        self.over_burst = set()
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def configure(self, rate: float, burst: float, concurrency: int, shared: SharedWindows = None):
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.concurrency = concurrency
+            self.shared = shared
+            self.buckets = {}
+
+    def limits(self, metadata: dict) -> tuple:
+        """
+        Returns the rate, burst and concurrency of the key, 0 is no limit.
+        """
+        if metadata.get('admin'):
+            return 0, 0, 0
+        return (metadata.get('rate', self.rate),
+                metadata.get('burst', self.burst),
+                metadata.get('concurrency', self.concurrency))
+
+    def take(self, name: str, cost: float, rate: float, burst: float) -> float:
+        if cost > burst:
+            if (cost, burst) not in self.over_burst:
+                self.over_burst.add((cost, burst))
+                self.logger.warning(f'a request costs {cost} and the burst of {name} is {burst}, it is rejected')
+            return math.inf
+        if self.shared is not None:
+            try:
+                return self.shared.take(name, cost, rate, burst)
+            except Exception as e:
+                # the requests are not stopped because the shared backend is down
+                self.logger.warning(f'can not check the shared rate limit: {e}')
+                return 0
+        with self.lock:
+            bucket = self.buckets.get(name)
+            if bucket is None or bucket.rate != rate or bucket.burst != burst:
+                bucket = self.buckets[name] = TokenBucket(rate, burst)
+            return bucket.take(cost)
+
+    def acquire(self, metadata: dict, cost: float) -> float:
+        """
+        Checks the limits of the key for a request of cost units.
+
+        Returns:
+            float: 0 if the request can run (it must be released), else the seconds to retry,
+            inf if the request costs more than the burst of the key.
+        """
+        rate, burst, concurrency = self.limits(metadata)
+        if not rate and not concurrency:
+            return 0
+        name = metadata['name']
+        with self.lock:
+            running = self.running.get(name, 0)
+            if concurrency and running >= concurrency:
+                return 1
+            self.running[name] = running + 1
+        wait = self.take(name, cost, rate, burst or rate) if rate else 0
+        if wait:
+            self.release(name)
+        return wait
+
+    def release(self, name: str):
+        with self.lock:
+            running = self.running.get(name, 0) - 1
+            if running > 0:
+                self.running[name] = running
+            else:
+                self.running.pop(name, None)
+
+
+LIMITER = Limiter()
+
+# cost of the requests by url rule, a number or a function of the parameters of the request
+COSTS = {}
+
+
+def set_cost(rule: str, cost):
+    """
+    Sets the cost of the requests to an endpoint (1 by default), ex: set_cost('/dspace/info/', 5)
+    or a function of the parameters (request.values) that returns the cost.
+    The requests that cost more than the burst of a key are rejected (see Limiter).
+    """
+    COSTS[rule] = cost
+
+
+def request_cost() -> float:
+    if request.url_rule is None:
+        return 1
+    cost = COSTS.get(request.url_rule.rule, 1)
+    return cost(request.values) if callable(cost) else cost
+
+
+def _limit():
+    metadata = API_KEYS.lookup(request_apikey())
+    if metadata is None:
+        # the endpoint returns the apikey error
+        return None
+    cost = request_cost()
+    wait = LIMITER.acquire(metadata, cost)
+    if not wait:
+        g.hunabku_limited = metadata['name']
+        return None
+    if math.isinf(wait):
+        data = {"error": "Too Many Requests",
+                "message": f"the request costs {cost}, more than the burst of the apikey {metadata['name']}, "
+                           "it can not be accepted, please split it in smaller requests"}
+        return current_app.response_class(
+            response=json.dumps(data),
+            status=429,
+            mimetype='application/json'
+        )
+    data = {"error": "Too Many Requests",
+            "message": f"too many requests for the apikey {metadata['name']}, retry after {math.ceil(wait)} seconds"}
+    return current_app.response_class(
+        response=json.dumps(data),
+        status=429,
+        mimetype='application/json',
+        headers={'Retry-After': str(math.ceil(wait))}
+    )
+
+
+def _release(response):
+    name = g.pop('hunabku_limited', None)
+    if name is not None:
+        # the streamed responses run until they are closed
+        response.call_on_close(lambda: LIMITER.release(name))
+    return response
+
+
+def install(app):
+    """
+    Adds the limits of the API keys to all the requests of the Flask app.
+    """
+    if app.extensions.get('hunabku_limits'):
+        return
+    app.extensions['hunabku_limits'] = True
+    app.before_request(_limit)
+    app.after_request(_release)
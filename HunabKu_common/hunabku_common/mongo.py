@@ -0,0 +1,51 @@
+from threading import Lock
+import time
+
+
+class Snapshot:
+    """
+    Cache of a value loaded from MongoDB (ex: counts of documents),
+    load is called to get the value at most once every ttl seconds.
+    """
+
+    def __init__(self, load, ttl: int = 60):
+        self.load = load
+        self.ttl = ttl
+        self.value = None
+        self.loaded = 0
+        self.lock = Lock()
+
+    def refresh(self):
+        value = self.load()
+        with self.lock:
+            self.value = value
+            self.loaded = time.monotonic()
+        return value
+
+    def get(self):
+        """
+        Returns the value, reloaded if it is older than ttl seconds.
+        """
+        value = self.value
+        if value is None or time.monotonic() - self.loaded >= self.ttl:
+            value = self.refresh()
+        return value
+
+
+class NameCatalog(Snapshot):
+    """
+    Cache of a list of names of MongoDB (databases or collections),
+    load is called to get the names at most once every ttl seconds,
+    a name not found forces a reload so the new databases are found right away.
+    """
+
+    def __init__(self, load, ttl: int = 60):
+        super().__init__(lambda: set(load()), ttl)
+
+    def exists(self, name: str) -> bool:
+        """
+        Checks if the name exists, a miss is checked again in MongoDB.
+        """
+        if name in self.get():
+            return True
+        return name in self.refresh()
@@ -0,0 +1,112 @@
+from flask import request
+from hunabku_common.timing import record
+from functools import wraps
+from threading import Event, Lock
+import time
+
+
+class Call:
+    """
+    Computation in flight, the result or the error is set before done.
+    """
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs once the concurrent calls with the same key, the calls that arrive while
+    the first one is running wait for it and get the same result (or error).
+    Nothing is cached, the next call after the first one finished runs again.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = Lock()
+
+    def do(self, key, fn):
+        """
+        Returns fn() or the result of the call with the same key in flight.
+
+        Returns:
+            tuple: the result and True if it was shared with another call.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+FLIGHTS = SingleFlight()
+
+
+def request_key() -> tuple:
+    """
+    Key of the current request, the endpoint, the variables of its url
+    and the sorted parameters without the apikey.
+    """
+    params = tuple(sorted((name, tuple(values)) for name, values in request.values.lists()
+                          if name != 'apikey'))
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return request.method, request.url_rule.rule, view_args, params
+
+
+def coalesce(func=None, apikey: bool = False):
+    """
+    Decorator of the endpoints of the plugins, the identical requests that arrive
+    while one is running wait for it and get a copy of its response, ex:
+
+        @endpoint('/siiu/info', methods=['GET'])
+        @coalesce
+        def siiu_info(self):
+
+    The waiting requests do not run the endpoint, then the endpoints that check the apikey
+    must pass apikey=True (@coalesce(apikey=True)) so it is checked for every request
+    before it joins the request in flight. The streamed responses are not shared
+    (every waiting request runs the endpoint).
+    """
+    if func is None:
+        return lambda func: coalesce(func, apikey)
+
+    @wraps(func)
+    def _coalesce(self, *args, **kwargs):
+        if apikey and not self.valid_apikey():
+            return self.apikey_error()
+
+        def run():
+            response = func(self, *args, **kwargs)
+            if response.is_streamed:
+                return response
+            return response.get_data(), response.status_code, list(response.headers.items())
+
+        start = time.perf_counter()
+        result, shared = FLIGHTS.do(request_key(), run)
+        if shared:
+            # time waiting for the request in flight
+            record('coalesced', time.perf_counter() - start)
+        if not isinstance(result, tuple):
+            if shared:
+                return func(self, *args, **kwargs)
+            return result
+        body, status, headers = result
+        return self.app.response_class(response=body, status=status, headers=headers)
+    return _coalesce
@@ -0,0 +1,73 @@
+from collections import deque
+from datetime import datetime
+from threading import Lock
+
+
+def query_shape(query):
+    """
+    Returns the query (Mongo filter or Elastic Search body) with the values
+    replaced by their type, so the requests with the same shape can be grouped.
+    """
+    if isinstance(query, dict):
+        return {key: query_shape(value) for key, value in query.items()}
+    if isinstance(query, (list, tuple)):
+        return [query_shape(value) for value in query]
+    return type(query).__name__
+
+
+class SlowRequests:
+    """
+    In memory log of the requests slower than threshold seconds,
+    only the last maxsize requests are kept.
+    """
+
+    def __init__(self, threshold: float = 1.0, maxsize: int = 1000):
+        self.threshold = threshold
+        self.lock = Lock()
+        self.records = deque(maxlen=maxsize)
+
+    def configure(self, threshold: float, maxsize: int):
+        with self.lock:
+            self.threshold = threshold
+            if maxsize != self.records.maxlen:
+                self.records = deque(self.records, maxlen=maxsize)
+
+    def add(self, seconds: float, record: dict) -> bool:
+        """
+        Saves the record if the request took more than threshold seconds.
+
+        Returns:
+            bool: True if the request was saved.
+        """
+        if self.threshold is None or seconds < self.threshold:
+            return False
+        record['seconds'] = seconds
+        record['date'] = datetime.utcnow().isoformat()
+        with self.lock:
+            self.records.append(record)
+        return True
+
+    def find(self, endpoint: str = None, min_seconds: float = 0, limit: int = 100) -> list:
+        """
+        Returns the slow requests, the newest first.
+
+        Args:
+            endpoint (str): Url rule of the requests, ex: /scienti/product (Optional)
+            min_seconds (float): Only the requests that took at least min_seconds.
+            limit (int): Maximum number of requests returned.
+        """
+        with self.lock:
+            records = list(self.records)
+        found = []
+        for record in reversed(records):
+            if len(found) >= limit:
+                break
+            if endpoint and record['endpoint'] != endpoint:
+                continue
+            if record['seconds'] < min_seconds:
+                continue
+            found.append(record)
+        return found
+
+
+SLOW_REQUESTS = SlowRequests()
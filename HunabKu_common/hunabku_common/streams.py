@@ -0,0 +1,38 @@
+from itertools import chain
+import json
+
+
+def json_array(items, dumps=json.dumps):
+    """
+    Serializes the items as a JSON array one item at a time, given to the response
+    the documents are sent while they are read from the cursor,
+    without building the whole list nor the whole string in memory.
+    """
+    yield '['
+    first = True
+    for item in items:
+        if first:
+            first = False
+            yield dumps(item)
+        else:
+            yield ',' + dumps(item)
+    yield ']'
+
+
+def prefetch(items):
+    """
+    Reads the first item, so the query runs (and fails) before the response starts,
+    returns an iterator over all the items.
+    """
+    items = iter(items)
+    for first in items:
+        return chain([first], items)
+    return iter([])
+
+
+def ndjson(items, dumps=json.dumps):
+    """
+    Serializes the items as newline delimited JSON, one item per line.
+    """
+    for item in items:
+        yield dumps(item) + '\n'
@@ -0,0 +1,224 @@
+from flask import g, has_request_context, request
+from hunabku_common.slowlog import SLOW_REQUESTS, query_shape
+from contextlib import contextmanager
+from threading import Lock
+import time
+
+
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    Histogram in the Prometheus text format, the series are identified
+    by the values of the labels.
+    """
+
+    def __init__(self, name: str, doc: str, labels: tuple, buckets: tuple = BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = Lock()
+
+    def observe(self, values: tuple, seconds: float):
+        with self.lock:
+            serie = self.series.get(values)
+            if serie is None:
+                # one counter per bucket plus the sum and the count
+                serie = self.series[values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    serie[i] += 1
+            serie[-2] += seconds
+            serie[-1] += 1
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {values: list(serie) for values, serie in self.series.items()}
+        for values, serie in sorted(series.items()):
+            labels = ','.join(f'{label}="{escape(value)}"' for label, value in zip(self.labels, values))
+            for bound, count in zip(self.buckets, serie):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {serie[-1]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {serie[-2]}')
+            lines.append(f'{self.name}_count{{{labels}}} {serie[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('hunabku_request_seconds',
+                            'Time to build and send the response of the requests.',
+                            ('endpoint', 'method', 'status'))
+PHASE_SECONDS = Histogram('hunabku_request_phase_seconds',
+                          'Time spent in every phase of the requests '
+                          '(validation, catalog, mongo_query, es_query, serialization, send).',
+                          ('endpoint', 'phase'))
+
+
+def record(name: str, seconds: float):
+    """
+    Adds the time of a phase to the current request, the times of
+    a phase that runs several times in the same request are added up.
+    """
+    if not has_request_context():
+        return
+    phases = g.setdefault('hunabku_phases', {})
+    phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Measures the time of the block as a phase of the current request, ex:
+
+        with phase('mongo_query'):
+            data = list(collection.find(query))
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str, items):
+    """
+    Returns an iterator over the items that adds the time to get every item to the phase name
+    of the current request, for the cursors that are read while the response is streamed, ex:
+
+        data = prefetch(timed('mongo_query', collection.find(query)))
+    """
+    phases = g.setdefault('hunabku_phases', {}) if has_request_context() else {}
+
+    def _timed():
+        items_iter = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items_iter)
+            except StopIteration:
+                return
+            finally:
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+            yield item
+    return _timed()
+
+
+def note_query(target: str, query, docs: int = None):
+    """
+    Saves a query done by the current request for the slow requests log.
+
+    Args:
+        target (str): Collection (db.collection) or Elastic Search index queried.
+        query (dict): Mongo filter or Elastic Search body.
+        docs (int): Number of documents returned.
+    """
+    if not has_request_context():
+        return
+    g.setdefault('hunabku_queries', []).append(
+        {'target': target, 'query': query, 'shape': query_shape(query), 'docs': docs})
+
+
+def request_params() -> dict:
+    """
+    Returns the parameters of the request sorted by name, without the apikey.
+    """
+    params = {}
+    for name in sorted(request.args.keys()):
+        if name == 'apikey':
+            continue
+        values = request.args.getlist(name)
+        params[name] = values[0] if len(values) == 1 else values
+    return params
+
+
+def endpoint_name() -> str:
+    # the rule and not the path, to keep the number of series bounded
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _start():
+    g.hunabku_start = time.perf_counter()
+
+
+def _count(body, size: list):
+    """
+    Yields the chunks of the body encoded, adding their length to size[0].
+    """
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            size[0] += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def _finish(response):
+    start = g.get('hunabku_start')
+    if start is None:
+        return response
+    built = time.perf_counter()
+    endpoint = endpoint_name()
+    method = request.method
+    # the streamed cursors keep adding their time to the phases until the response is closed
+    phases = g.setdefault('hunabku_phases', {})
+    queries = g.setdefault('hunabku_queries', [])
+    params = request_params()
+
+    timings = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in phases.items()]
+    timings.append(f'total;dur={(built - start) * 1000:.2f}')
+    response.headers.add('Server-Timing', ', '.join(timings))
+
+    size = None
+    if response.is_streamed and not response.direct_passthrough:
+        size = [0]
+        response.response = _count(response.response, size)
+
+    def closed():
+        # called by the server when the body was written to the client
+        done = time.perf_counter()
+        REQUEST_SECONDS.observe((endpoint, method, str(response.status_code)), done - start)
+        PHASE_SECONDS.observe((endpoint, 'send'), done - built)
+        for name, seconds in phases.items():
+            PHASE_SECONDS.observe((endpoint, name), seconds)
+        if SLOW_REQUESTS.threshold is not None and done - start >= SLOW_REQUESTS.threshold:
+            SLOW_REQUESTS.add(done - start, {
+                'endpoint': endpoint,
+                'method': method,
+                'status': response.status_code,
+                'params': params,
+                'queries': queries,
+                'bytes': size[0] if size is not None else response.content_length,
+                'phases': dict(phases)})
+    response.call_on_close(closed)
+    return response
+
+
+def install(app):
+    """
+    Registers in the Flask app the hooks that time all the requests,
+    it can be called several times, the hooks are added once.
+    """
+    if app.extensions.get('hunabku_timing'):
+        return
+    app.extensions['hunabku_timing'] = True
+    app.before_request(_start)
+    app.after_request(_finish)
+
+
+def render_metrics() -> str:
+    """
+    Returns all the metrics in the Prometheus text format.
+    """
+    return REQUEST_SECONDS.render() + PHASE_SECONDS.render()
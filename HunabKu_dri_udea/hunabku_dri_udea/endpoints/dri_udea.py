@@ -2,6 +2,7 @@ from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from pymongo import MongoClient
 from flask import Response, request
+from hunabku_common.auth import request_apikey, same_key
 import csv
 
 
@@ -31,14 +32,10 @@ class International(HunabkuPluginBase):
         self.apikey = self.config.apikey
 
     def valid_apikey(self):
-        if self.request.method == 'POST':
-            apikey = self.request.form.get('apikey')
-        else:
-            apikey = self.request.args.get('apikey')
-        if self.apikey == apikey:
-            return True
-        else:
-            return False
+        """
+        Checks the apikey of the plugin in constant time.
+        """
+        return same_key(request_apikey(), self.apikey)
 
     @endpoint('/agreements', methods=['GET'])
     def get_agreements(self):
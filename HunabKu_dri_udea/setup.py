@@ -82,7 +82,8 @@ def main():
         install_requires=[
             'flask>=1.1.2',
             'requests>=2.22.0',
-            'hunabku'
+            'hunabku',
+            'hunabku_common'
         ],
     )
 
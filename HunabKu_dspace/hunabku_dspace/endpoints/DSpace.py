@@ -1,21 +1,152 @@
 from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+from hunabku_common.auth import check_apikey
+from hunabku_common.exports import register_export
+from hunabku_common.limits import set_cost
+from hunabku_common.mongo import NameCatalog, Snapshot
+from hunabku_common.singleflight import coalesce
+from hunabku_common.streams import json_array, ndjson, prefetch
+from hunabku_common.timing import phase, note_query, timed
+from hunabku_dspace.records import (DATESTAMP, INDEX_NOT_FOUND, RECORDS_COLLECTION, ensure_indexes, ensure_text_index,
+                                    get_datestamp, encode_token, decode_token, changed_after,
+                                    text_search, search_projection)
+from itertools import chain
+from threading import Lock, Thread
 import sys
 import re
 
 
+# OAI datestamps accepted by since, a day or a UTC time
+SINCE = re.compile(r'^\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}:\d{2}Z)?$')
+
+
 class DSpace(HunabkuPluginBase):
     config = Config()
     config += Param(db_uri="mongodb://localhost:27017/",
                     doc="MongoDB string connection")
     config += Param(mdb_name="oxomoc",
                     doc="MongoDB name for DSpace")
+    config += Param(mdb_batch_size=500,
+                    doc="Records read from MongoDB per round trip when the records are streamed")
+    config += Param(mdb_create_indexes=True,
+                    doc="Create at startup the datestamp and text indexes used by the incremental harvesting (since) and the search")
+    config += Param(mdb_text_language="none",
+                    doc="Language of the text index of the search, none does not remove stop words nor stems the words")
+    config += Param(mdb_catalog_ttl=60,
+                    doc="Seconds the names of the collections are cached, a missing collection is always checked again")
+    config += Param(mdb_stats_ttl=300,
+                    doc="Seconds the number of records of every institution (/dspace/info resume) is cached")
+    config += Param(max_ids=10000,
+                    doc="Maximum number of ids of a batch lookup in /dspace/product")
+    config += Param(default_max_results=100,
+                    doc="Number of records per page of the search if max_results is not passed")
 
     def __init__(self, hunabku):
         super().__init__(hunabku)
         self.dbclient = MongoClient(self.config.db_uri)
         self.db = self.dbclient[self.config.mdb_name]
+        self.collection_catalog = NameCatalog(self.db.list_collection_names, self.config.mdb_catalog_ttl)
+        self.stats = Snapshot(self.load_stats, self.config.mdb_stats_ttl)
+        set_cost('/dspace/product', self.product_cost)
+        set_cost('/dspace/info/', self.info_cost)
+        register_export('dspace_product', ['institution'], self.export_records, self.export_version)
+        # collections whose text index is being built in background
+        self.building = set()
+        self.building_lock = Lock()
+        if self.config.mdb_create_indexes:
+            # created in background, the plugin must load even if MongoDB is down.
+            Thread(target=self.create_indexes, daemon=True).start()
+
+    def valid_apikey(self):
+        """
+        Checks the apikey with the key store of hunabku_common.auth.
+        """
+        return check_apikey()
+
+    def create_indexes(self):
+        """
+        Creates the datestamp indexes of the collections of records.
+        """
+        try:
+            ensure_indexes(self.db, self.config.mdb_text_language)
+        except Exception as e:
+            self.logger.warning(f'DSpace: can not create the indexes: {e}')
+
+    def build_text_index(self, col_name):
+        """
+        Starts the build of the text index of a collection in background (once at a time),
+        for the collections added after the plugin started.
+        """
+        with self.building_lock:
+            if col_name in self.building:
+                return
+            self.building.add(col_name)
+
+        def build():
+            try:
+                ensure_text_index(self.db[col_name], self.config.mdb_text_language)
+            except Exception as e:
+                self.logger.warning(f'DSpace: can not create the text index of {col_name}: {e}')
+            finally:
+                with self.building_lock:
+                    self.building.discard(col_name)
+        Thread(target=build, daemon=True).start()
+
+    def load_stats(self):
+        """
+        Returns the resume of /dspace/info, the number of records of every institution
+        taken from the collection metadata (estimated_document_count), the collections are not scanned.
+        """
+        data = []
+        for col in sorted(self.collection_catalog.refresh()):
+            if RECORDS_COLLECTION.match(col):
+                values = re.split("_", col)
+                info = [{'name': 'records', 'count': self.db[col].estimated_document_count()}]
+                data.append({"institution": values[1], 'info': info})
+        return data
+
+    def product_cost(self, req_args):
+        """
+        Cost of a request to /dspace/product for the rate limits (hunabku_common.limits),
+        the ids cost 1 per batch, a page or a search 2 and the dump of all the records 20.
+        """
+        ids = req_args.getlist('id')
+        if ids:
+            return 1 + len(ids) // self.config.mdb_batch_size
+        if req_args.get('max_results') or req_args.get('search'):
+            return 2
+        return 20
+
+    def info_cost(self, req_args):
+        """
+        The resume is cached, all the ids cost as a dump.
+        """
+        if req_args.get('get') == 'ids' and not req_args.get('max_results'):
+            return 20
+        return 1
+
+    def export_collection(self, params):
+        col_name = f"dspace_{params['institution']}_records"
+        if not self.collection_catalog.exists(col_name):
+            raise ValueError(f"invalid institution, collection {col_name} not found in database {self.config.mdb_name}.")
+        return self.db[col_name]
+
+    def export_records(self, params):
+        """
+        All the records of the institution for the export dspace_product of hunabku_common.exports.
+        """
+        return self.export_collection(params).find().sort('_id', 1).batch_size(self.config.mdb_batch_size)
+
+    def export_version(self, params):
+        """
+        The export changes when records are added or harvested again,
+        the number of records and the last datestamp, read from the datestamp index.
+        """
+        collection = self.export_collection(params)
+        last = list(collection.find({}, {DATESTAMP: 1}).sort([(DATESTAMP, -1), ('_id', -1)]).limit(1))
+        return [collection.estimated_document_count(), get_datestamp(last[0]) if last else None]
 
     def check_required_parameters(self, req_args):
         """
@@ -56,8 +187,9 @@ class DSpace(HunabkuPluginBase):
         """
         Method to check if the collection exists, the colletion is a combination of dspace_{initials}_records ex: dspace_udea_records
         """
-        col_names = self.db.list_collection_names()
-        if col_name not in col_names:
+        with phase('catalog'):
+            exists = self.collection_catalog.exists(col_name)
+        if not exists:
             data = {
                 "error": "Bad Request", "message": f"invalid institution, collection {col_name} not found in database {self.config.mdb_name}. Please check info endpoint for available institutions."}
             response = self.app.response_class(
@@ -68,7 +200,174 @@ class DSpace(HunabkuPluginBase):
             return response
         return None
 
-    @endpoint('/dspace/product', methods=['GET'])
+    def check_pagination(self, req_args):
+        """
+        Method to check the parameters format and max_results,
+        returns the format, max_results (0 without pagination)
+        and error code 400 (Bad Request) if they are not valid.
+        """
+        output = req_args.get('format', 'json')
+        max_results = req_args.get('max_results')
+        try:
+            if output not in ('json', 'ndjson'):
+                raise ValueError(f"invalid format {output}, options are: json, ndjson")
+            if max_results is not None:
+                if not max_results.isdigit() or int(max_results) < 1:
+                    raise ValueError("max_results must be a positive integer")
+                max_results = int(max_results)
+        except ValueError as e:
+            data = {"error": "Bad Request", "message": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return None, 0, response
+        return output, max_results or 0, None
+
+    def stream_records(self, records, output, headers=None):
+        """
+        returns the records serialized while they are sent, as a JSON array or as NDJSON.
+        """
+        if output == 'ndjson':
+            body = ndjson(records, self.json.dumps)
+            mimetype = 'application/x-ndjson'
+        else:
+            body = json_array(records, self.json.dumps)
+            mimetype = 'application/json'
+        response = self.app.response_class(
+            response=body,
+            status=200,
+            mimetype=mimetype,
+            headers=headers
+        )
+        return response
+
+    def page_records(self, col_name, after, max_results, projection=None):
+        """
+        Method to read the records sorted by _id with keyset pagination, the collection is never skipped.
+        returns an iterator over the records (the first batch is already read) and the headers,
+        X-Next-After has the last id of the page if there are more records.
+        """
+        query = {'_id': {'$gt': after}} if after else {}
+        collection = self.db[col_name]
+        headers = {}
+        with phase('mongo_query'):
+            cursor = collection.find(query, projection).sort('_id', 1).batch_size(self.config.mdb_batch_size)
+            if max_results:
+                cursor = cursor.limit(max_results)
+                # last id of the page and if there are more records, read from the _id index only
+                last = list(collection.find(query, {'_id': 1}).sort('_id', 1).skip(max_results - 1).limit(2))
+                if len(last) == 2:
+                    headers['X-Next-After'] = str(last[0]['_id'])
+        records = prefetch(timed('mongo_query', cursor))
+        note_query(f'{self.config.mdb_name}.{col_name}', query)
+        return records, headers
+
+    def find_ids(self, col_name, ids):
+        """
+        Method to read the records of a list of ids with a $in query every mdb_batch_size ids,
+        yields the records found in the order of the ids.
+        """
+        size = self.config.mdb_batch_size
+        for i in range(0, len(ids), size):
+            chunk = ids[i:i + size]
+            query = {'_id': {'$in': chunk}}
+            found = {record['_id']: record for record in self.db[col_name].find(query)}
+            note_query(f'{self.config.mdb_name}.{col_name}', query, len(found))
+            for pid in chunk:
+                if pid in found:
+                    yield found[pid]
+
+    def find_text(self, col_name, query, projection, skip, limit):
+        """
+        Runs a text search sorted by relevance, returns an iterator over the records (the first batch is already read).
+        """
+        cursor = self.db[col_name].find(query, projection, skip=skip, limit=limit)
+        return prefetch(timed('mongo_query', cursor.sort([('score', {'$meta': 'textScore'})])))
+
+    def search_records(self, col_name, search, page, fields, output, max_results):
+        """
+        Method to stream a page of the records found by the text search, sorted by relevance (score),
+        with only the fields passed (comma separated) if any.
+        """
+        try:
+            if page is not None and (not page.isdigit() or int(page) < 1):
+                raise ValueError("page must be a positive integer")
+            projection = search_projection(fields.split(',') if fields else None)
+        except ValueError as e:
+            data = {"error": "Bad Request", "message": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+        limit = max_results or self.config.default_max_results
+        skip = (int(page or 1) - 1) * limit
+        query = text_search(search)
+        try:
+            records = self.find_text(col_name, query, projection, skip, limit)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+            # collection added after the plugin started, the search is available when the index is built
+            message = f"the text search of {col_name} is not available, its text index does not exist"
+            if self.config.mdb_create_indexes:
+                self.build_text_index(col_name)
+                message = f"the text index of {col_name} is being built, please retry later"
+            response = self.app.response_class(
+                response=self.json.dumps({"error": "Service Unavailable", "message": message}),
+                status=503,
+                mimetype='application/json',
+                headers={'Retry-After': '60'}
+            )
+            return response
+        note_query(f'{self.config.mdb_name}.{col_name}', query)
+        return self.stream_records(records, output)
+
+    def changed_records(self, col_name, since, token, output, max_results):
+        """
+        Method to stream the records changed after since (OAI datestamp) or after the position of token,
+        sorted by datestamp and _id. The header X-Next-Token has the position of the last record of the page,
+        or of the last record if there are no more pages, to request the next page or the next changes.
+        """
+        try:
+            if token:
+                position = decode_token(token)
+            elif SINCE.match(since):
+                position = (since, '')
+            else:
+                raise ValueError(f"invalid since {since}, the format is YYYY-MM-DD or YYYY-MM-DDThh:mm:ssZ")
+        except ValueError as e:
+            data = {"error": "Bad Request", "message": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+
+        query = changed_after(*position)
+        order = [(DATESTAMP, 1), ('_id', 1)]
+        keys = {DATESTAMP: 1, '_id': 1}
+        collection = self.db[col_name]
+        with phase('mongo_query'):
+            cursor = collection.find(query).sort(order).batch_size(self.config.mdb_batch_size)
+            last = []
+            if max_results:
+                cursor = cursor.limit(max_results)
+                last = list(collection.find(query, keys).sort(order).skip(max_results - 1).limit(1))
+            if not last:
+                last = list(collection.find(query, keys).sort([(DATESTAMP, -1), ('_id', -1)]).limit(1))
+        records = prefetch(timed('mongo_query', cursor))
+        note_query(f'{self.config.mdb_name}.{col_name}', query)
+        if last:
+            position = (get_datestamp(last[0]), str(last[0]['_id']))
+        headers = {'X-Next-Token': encode_token(*position)}
+        return self.stream_records(records, output, headers)
+
+    @endpoint('/dspace/product', methods=['GET', 'POST'])
     def dspace_product(self):
         """
         @api {get} /dspace/product DSpace prouduct endpoint
@@ -78,25 +377,55 @@ class DSpace(HunabkuPluginBase):
                         institution is mandatory parameter.
 
         @apiParam {String} apikey  Credential for authentication
-        @apiParam {String} id  DSpace id of the product
+        @apiParam {String} id  DSpace id of the product, it can be repeated (up to max_ids) to get several products,
+                               sent in the order of the ids, use POST (form data) for long lists.
         @apiParam {String} institution Institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} format  json (default) returns a list, ndjson returns a record per line (application/x-ndjson).
+        @apiParam {Number} max_results  Number of records per page, the records are sorted by id.
+        @apiParam {String} after  Returns the records after this id, to get the next page use the header X-Next-After of the response.
+        @apiParam {String} since  Returns the records harvested with an OAI datestamp since this date (YYYY-MM-DD or YYYY-MM-DDThh:mm:ssZ),
+                                  sorted by datestamp.
+        @apiParam {String} token  Returns the records changed after the token, to get the next page or the next changes
+                                  use the header X-Next-Token of the response.
+        @apiParam {String} search  Text search in titles, authors, subjects and abstracts (Dublin Core),
+                                   returns the records sorted by relevance with their score, in pages of max_results (default 100).
+        @apiParam {Number} page  Page of the search, default 1.
+        @apiParam {String} fields  Fields of the records returned by the search, comma separated, ex: OAI-PMH.GetRecord.record.header
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
+        @apiSuccess {String}  X-Next-After  (header) id to request the next page, not sent for the last page.
+        @apiSuccess {String}  X-Next-Token  (header) with since or token, token to request the next page or the next changes.
 
         @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
         @apiError (Error 400) msg  Bad request, if the query is not right.
+        @apiError (Error 503) msg  Service Unavailable, the search of a new collection while its text index is built.
 
         @apiExample {curl} Example usage:
             # all the products for the institution
             curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea
             # An specific product
             curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&id=oai:bibliotecadigital.udea.edu.co:10495/1489
+            # several products, one per line
+            curl -i https://apis.colav.co/dspace/product -d apikey=XXXX -d institution=udea -d format=ndjson \\
+                -d id=oai:bibliotecadigital.udea.edu.co:10495/1489 \\
+                -d id=oai:bibliotecadigital.udea.edu.co:10495/1490
+            # all the products for the institution, one per line, in pages of 1000
+            curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&format=ndjson&max_results=1000
+            curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&format=ndjson&max_results=1000&after=oai:bibliotecadigital.udea.edu.co:10495/1489
+            # the products changed since a date, then the next changes with the token of the last response
+            curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&format=ndjson&since=2023-06-01
+            curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&format=ndjson&token=XXXX
+            # search the theses about malaria, only the header of the records
+            curl -i https://apis.colav.co/dspace/product?apikey=XXXX&institution=udea&search=malaria%20tesis&fields=OAI-PMH.GetRecord.record.header
         """
 
         if self.valid_apikey():
-            pid = self.request.args.get('id')
-            institution = self.request.args.get('institution')
-            response = self.check_required_parameters(self.request.args)
+            # POST sends the parameters as form data, for long lists of ids
+            args = self.request.form if self.request.method == 'POST' else self.request.args
+            pids = list(dict.fromkeys(args.getlist('id')))
+            pid = pids[0] if len(pids) == 1 else None
+            institution = args.get('institution')
+            response = self.check_required_parameters(args)
             if response is not None:
                 return response
 
@@ -105,26 +434,52 @@ class DSpace(HunabkuPluginBase):
             response = self.check_collection(col_name)
             if response is not None:
                 return response
+            output, max_results, response = self.check_pagination(args)
+            if response is not None:
+                return response
+            if len(pids) > self.config.max_ids:
+                data = {"error": "Bad Request",
+                        "message": f"too many ids {len(pids)}, the maximum is {self.config.max_ids}"}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+                return response
 
             try:
                 data = []
                 if pid:
-                    data = list(self.db[col_name].find(
-                        {'_id': pid}))
+                    with phase('mongo_query'):
+                        data = list(self.db[col_name].find(
+                            {'_id': pid}))
+                    note_query(f'{self.config.mdb_name}.{col_name}', {'_id': pid}, len(data))
+                    with phase('serialization'):
+                        body = self.json.dumps(data)
                     response = self.app.response_class(
-                        response=self.json.dumps(data),
+                        response=body,
                         status=200,
                         mimetype='application/json'
                     )
                     return response
+                if pids:
+                    records = prefetch(timed('mongo_query', self.find_ids(col_name, pids)))
+                    return self.stream_records(records, output)
                 if institution:
-                    data = list(self.db[col_name].find())
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
+                    since = args.get('since')
+                    token = args.get('token')
+                    after = args.get('after')
+                    search = args.get('search')
+                    if [bool(since or token), bool(after), bool(search)].count(True) > 1:
+                        return self.badrequest_error()
+                    if search:
+                        return self.search_records(col_name, search, args.get('page'), args.get('fields'),
+                                                   output, max_results)
+                    if since or token:
+                        return self.changed_records(col_name, since, token, output, max_results)
+
+                    records, headers = self.page_records(col_name, after, max_results)
+                    return self.stream_records(records, output, headers)
 
                 data = {
                     "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters."}
@@ -147,6 +502,7 @@ class DSpace(HunabkuPluginBase):
             return self.apikey_error()
 
     @endpoint('/dspace/info/', methods=['GET'])
+    @coalesce(apikey=True)
     def dspace_info(self):
         """
         @api {get} /dspace/info DSpace info endpoint
@@ -157,8 +513,13 @@ class DSpace(HunabkuPluginBase):
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} get Options are resume and ids, ids require additional parameter institution
         @apiParam {String} institution Institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} format  for ids, json (default) returns the ids in the resume, ndjson returns an id per line (application/x-ndjson).
+        @apiParam {Number} max_results  for ids, number of ids per page, the ids are sorted.
+        @apiParam {String} after  for ids, returns the ids after this id, to get the next page use the header X-Next-After of the response.
 
-        @apiSuccess {Object}  Resgisters from MongoDB in Json format.
+        @apiSuccess {Object}  Resgisters from MongoDB in Json format,
+                              the counts of the resume are estimated and cached for mdb_stats_ttl seconds.
+        @apiSuccess {String}  X-Next-After  (header) for ids, id to request the next page, not sent for the last page.
 
         @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
         @apiError (Error 400) msg  Bad request, if the query is not right.
@@ -167,6 +528,8 @@ class DSpace(HunabkuPluginBase):
             # resume of dspace database
             curl -i https://apis.colav.co/dspace/info?apikey=XXXX&get=resume
             curl -i https://apis.colav.co/dspace/info?apikey=XXXX&get=ids&institution=udea
+            # the ids of the institution, one per line, in pages of 10000
+            curl -i https://apis.colav.co/dspace/info?apikey=XXXX&get=ids&institution=udea&format=ndjson&max_results=10000
         """
         if self.valid_apikey():
             option = self.request.args.get('get')
@@ -177,16 +540,8 @@ class DSpace(HunabkuPluginBase):
                     return response
             try:
                 if option == "resume":
-                    data = []
-                    cols = self.db.list_collection_names()
-                    for col in cols:
-                        if re.match(r'^dspace_.*._records$', col):
-                            values = re.split("_", col)
-                            info = []
-                            count = self.db[col].count_documents({})
-                            info.append({'name': 'records', 'count': count})
-                            data.append(
-                                {"institution": values[1], 'info': info})
+                    with phase('catalog'):
+                        data = self.stats.get()
 
                     response = self.app.response_class(
                         response=self.json.dumps(data),
@@ -197,7 +552,7 @@ class DSpace(HunabkuPluginBase):
 
                 if option == "ids":
                     response = self.check_parameters(
-                        ['apikey', 'get', 'institution'], self.request.args.keys())
+                        ['apikey', 'get', 'institution', 'format', 'max_results', 'after'], self.request.args.keys())
                     if response is not None:
                         return response
                     institution = self.request.args.get('institution')
@@ -207,16 +562,21 @@ class DSpace(HunabkuPluginBase):
                     if response is not None:
                         return response
 
-                    data = []
-                    cols = []
-                    ids = list(self.db[col].find({}, {"_id": 1}))
-                    cols.append({'name': 'records', 'ids': ids})
-                    data.append({"institution": institution, 'info': cols})
+                    output, max_results, response = self.check_pagination(self.request.args)
+                    if response is not None:
+                        return response
 
+                    ids, headers = self.page_records(col, self.request.args.get('after'), max_results, {'_id': 1})
+                    if output == 'ndjson':
+                        return self.stream_records(ids, output, headers)
+                    # the ids inside the resume of the institution, as they were always returned
+                    head = f'[{{"institution": {self.json.dumps(institution)}, "info": [{{"name": "records", "ids": '
+                    body = chain([head], json_array(ids, self.json.dumps), ['}]}]'])
                     response = self.app.response_class(
-                        response=self.json.dumps(data),
+                        response=body,
                         status=200,
-                        mimetype='application/json'
+                        mimetype='application/json',
+                        headers=headers
                     )
                     return response
 
@@ -0,0 +1,132 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from pymongo.errors import OperationFailure
+import json
+import logging
+import re
+
+
+# OAI datestamp of the record, saved by oxomoc from the header of GetRecord
+DATESTAMP = 'OAI-PMH.GetRecord.record.header.datestamp'
+
+# collections of records harvested by oxomoc
+RECORDS_COLLECTION = re.compile(r'^dspace_.*._records$')
+
+# Dublin Core metadata (oai_dc) of the record
+DC = 'OAI-PMH.GetRecord.record.metadata.oai_dc:dc'
+
+# fields of the text search: titles, authors, subjects and abstracts, with their weight in the score
+TEXT_FIELDS = {f'{DC}.dc:title': 10,
+               f'{DC}.dc:creator': 5,
+               f'{DC}.dc:subject': 3,
+               f'{DC}.dc:description': 1}
+TEXT_INDEX = 'text_search'
+
+# error of a $text query in a collection without text index
+INDEX_NOT_FOUND = 27
+
+# fields that can be projected, paths of the record without operators
+FIELD = re.compile(r'^[^.$\s][^$\s]*$')
+
+
+def ensure_text_index(collection, language: str = 'none'):
+    """
+    Creates (if missing) the text index of TEXT_FIELDS used by the search.
+    """
+    collection.create_index([(field, 'text') for field in TEXT_FIELDS], name=TEXT_INDEX,
+                            weights=TEXT_FIELDS, default_language=language)
+
+
+def ensure_indexes(db, language: str = 'none') -> list:
+    """
+    Creates (if missing) the index by datestamp of every collection of records,
+    used by the incremental harvesting (the _id makes the order unique),
+    and the text index of TEXT_FIELDS used by the search.
+    A collection that fails is logged and the next ones are indexed.
+
+    Args:
+        db: MongoDB database of oxomoc.
+        language (str): default language of the text index, none does not remove stop words nor stems.
+
+    Returns:
+        list: names of the collections indexed.
+    """
+    indexed = []
+    for name in db.list_collection_names():
+        if not RECORDS_COLLECTION.match(name):
+            continue
+        try:
+            db[name].create_index([(DATESTAMP, 1), ('_id', 1)])
+            ensure_text_index(db[name], language)
+        except OperationFailure as e:
+            logging.getLogger(__name__).warning(f'DSpace: can not create the indexes of {name}: {e}')
+            continue
+        indexed.append(name)
+    return indexed
+
+
+def get_datestamp(record: dict):
+    """
+    Returns the datestamp of the record or None if it does not have it.
+    """
+    value = record
+    for field in DATESTAMP.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(field)
+    return value
+
+
+def encode_token(datestamp: str, record_id: str) -> str:
+    """
+    Builds the change token, the position of a record in the order by datestamp and _id.
+    """
+    return urlsafe_b64encode(json.dumps([datestamp, record_id]).encode()).decode()
+
+
+def decode_token(token: str) -> tuple:
+    """
+    Returns the datestamp and _id of the change token.
+
+    Raises:
+        ValueError: if the token is not valid.
+    """
+    try:
+        datestamp, record_id = json.loads(urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError(f"invalid token {token}")
+    if not isinstance(datestamp, str) or not isinstance(record_id, str):
+        raise ValueError(f"invalid token {token}")
+    return datestamp, record_id
+
+
+def changed_after(datestamp: str, record_id: str = '') -> dict:
+    """
+    Returns the filter of the records after the position (datestamp, _id),
+    with an empty record_id it is every record with datestamp >= datestamp.
+    """
+    return {'$or': [{DATESTAMP: {'$gt': datestamp}},
+                    {DATESTAMP: datestamp, '_id': {'$gt': record_id}}]}
+
+
+def text_search(search: str) -> dict:
+    """
+    Returns the filter of the text search in TEXT_FIELDS,
+    the words are ORed and a "quoted phrase" is required.
+    """
+    return {'$text': {'$search': search}}
+
+
+def search_projection(fields: list = None) -> dict:
+    """
+    Returns the projection of the text search, the fields (all if empty) and the score.
+
+    Raises:
+        ValueError: if a field is not a path of the record.
+    """
+    fields = fields or []
+    invalid = [field for field in fields if not FIELD.match(field)]
+    if invalid:
+        raise ValueError(f"invalid fields {invalid}")
+    projection = {field: 1 for field in fields}
+    projection['score'] = {'$meta': 'textScore'}
+    return projection
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+import unicodedata
+import time
+import re
+
+
+def normalize_query(query: str, country: str = None) -> str:
+    """
+    Builds the cache key for an organization name.
+
+    Args:
+        query (str): The organization name as sent by the client.
+        country (str): Country of the organization (Optional)
+
+    Returns:
+        str: lowercased and accent-folded name, with the country appended.
+    """
+    def fold(text: str) -> str:
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+        return re.sub(r'\s+', ' ', text).strip().lower()
+
+    key = fold(query)
+    if country:
+        key = f'{key}|{fold(country)}'
+    return key
+
+
+class ResolutionCache:
+    """
+    Cache of organization names already resolved by kamunu.
+
+    The normalized query is mapped to the _id of the record in the
+    records collection, the mapping is persisted in MongoDB (the key is the
+    document _id, so the lookup is always indexed) and the hottest entries
+    are kept in an in-process LRU on top of it.
+    """
+
+    def __init__(self, collection, maxsize: int = 10000):
+        self.collection = collection
+        self.maxsize = maxsize
+        self.lru = OrderedDict()
+        self.lock = Lock()
+
+    def _remember(self, key: str, record_id):
+        with self.lock:
+            self.lru[key] = record_id
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.maxsize:
+                self.lru.popitem(last=False)
+
+    def get(self, query: str, country: str = None):
+        """
+        Returns the record _id for the query or None if it was not resolved before.
+        """
+        key = normalize_query(query, country)
+        with self.lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                return self.lru[key]
+
+        entry = self.collection.find_one({'_id': key}, {'record_id': 1})
+        if entry is None:
+            return None
+        self._remember(key, entry['record_id'])
+        return entry['record_id']
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Bulk version of get for normalized keys, the entries not in the LRU
+        are fetched with a single $in query.
+
+        Returns:
+            dict: normalized key to record _id, only for the keys found.
+        """
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                if key in self.lru:
+                    self.lru.move_to_end(key)
+                    found[key] = self.lru[key]
+                else:
+                    missing.append(key)
+
+        if missing:
+            for entry in self.collection.find({'_id': {'$in': missing}}, {'record_id': 1}):
+                self._remember(entry['_id'], entry['record_id'])
+                found[entry['_id']] = entry['record_id']
+        return found
+
+    def set(self, query: str, country: str, record_id):
+        """
+        Saves the record _id resolved for the query.
+        """
+        key = normalize_query(query, country)
+        self.collection.update_one(
+            {'_id': key},
+            {'$set': {'record_id': record_id,
+                      'query': query,
+                      'country': country,
+                      'updated': datetime.utcnow()}},
+            upsert=True)
+        self._remember(key, record_id)
+
+    def evict(self, query: str, country: str = None):
+        """
+        Removes the entry, used when the cached record no longer exists.
+        """
+        key = normalize_query(query, country)
+        with self.lock:
+            self.lru.pop(key, None)
+        self.collection.delete_one({'_id': key})
+
+
+class NegativeCache:
+    """
+    Cache of organization names that kamunu could not resolve.
+
+    kamunu saves those names in the not_inserted collection, the entries are
+    marked there with the normalized query (plus source) and the time of the
+    attempt, so a repeated name is answered as not found until ttl expires.
+    An in-process LRU keeps the expiration of the hottest entries.
+    """
+
+    def __init__(self, collection, ttl: int, maxsize: int = 10000):
+        self.collection = collection
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lru = OrderedDict()
+        self.lock = Lock()
+
+    @staticmethod
+    def key(query: str, country: str, source: str) -> str:
+        return f'{normalize_query(query, country)}|{source}'
+
+    def ensure_indexes(self):
+        self.collection.create_index([('cache_key', 1), ('cached', -1)], sparse=True)
+
+    def _remember(self, key: str, expires: float):
+        with self.lock:
+            self.lru[key] = expires
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.maxsize:
+                self.lru.popitem(last=False)
+
+    def contains(self, query: str, country: str, source: str) -> bool:
+        """
+        Returns True if the query failed to resolve less than ttl seconds ago.
+        """
+        key = self.key(query, country, source)
+        now = time.time()
+        with self.lock:
+            expires = self.lru.get(key)
+            if expires is not None:
+                if expires > now:
+                    self.lru.move_to_end(key)
+                    return True
+                del self.lru[key]
+
+        entry = self.collection.find_one(
+            {'cache_key': key, 'cached': {'$gt': datetime.utcnow() - timedelta(seconds=self.ttl)}},
+            {'cached': 1}, sort=[('cached', -1)])
+        if entry is None:
+            return False
+        age = (datetime.utcnow() - entry['cached']).total_seconds()
+        self._remember(key, now + self.ttl - age)
+        return True
+
+    def add(self, query: str, country: str, source: str, not_inserted_id):
+        """
+        Marks the not_inserted document created by kamunu for the query.
+        """
+        key = self.key(query, country, source)
+        self.collection.update_one(
+            {'_id': not_inserted_id},
+            {'$set': {'cache_key': key, 'country': country, 'cached': datetime.utcnow()}})
+        self._remember(key, time.time() + self.ttl)
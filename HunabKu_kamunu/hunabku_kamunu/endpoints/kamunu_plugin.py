@@ -1,9 +1,46 @@
 from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
+from hunabku_kamunu.cache import ResolutionCache, NegativeCache, normalize_query
+from hunabku_kamunu.jobs import JobQueue
+from hunabku_kamunu.identifiers import parse_identifier, values_at, ensure_indexes, ID_PATHS, INSERTABLE_SCHEMES
 from kamunu import kamunu_main, id_input
 from hunabku.Config import Config, Param
+from hunabku_common.auth import check_apikey
 from pymongo import MongoClient
 from flask import request
-import re
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from urllib.parse import urlencode
+
+
+# accepted values for the return parameter and the response shape they produce
+RETURN_OPTIONS = {"ids_only": "ids", "only_ids": "ids", "ids": "ids",
+                  "dehydrated_document": "dehydrated", "dehydrated": "dehydrated",
+                  "full_document": "full", "full": "full",
+                  "custom": "custom"}
+
+CUSTOM_KEYS = ['_id', 'raw_name', 'names', 'ids', 'categories',
+               'location', 'records', 'records.wikidata', 'records.ror']
+
+
+def record_projection(mode: str, key: str = None) -> dict:
+    """
+    Mongo projection with only the fields required by the response, so the big
+    records.wikidata and records.ror payloads are transferred only when requested.
+
+    Args:
+        mode (str): One of the values of RETURN_OPTIONS.
+        key (str): Custom key, required when mode is custom.
+
+    Returns:
+        dict: The projection for find/find_one.
+    """
+    if mode == "ids":
+        return {'ids': 1}
+    if mode == "dehydrated":
+        return {'records': 0, 'validation': 0}
+    if mode == "full":
+        return {'validation': 0}
+    return {key: 1}
 
 
 class Kamunu(HunabkuPluginBase):
@@ -20,6 +57,33 @@ class Kamunu(HunabkuPluginBase):
     config += Param(not_inserted_collection="not_inserted",
                     doc="Mongo DB collection")
 
+    config += Param(cache_collection="resolution_cache",
+                    doc="Mongo DB collection for the normalized query to record _id cache")
+
+    config += Param(cache_size=10000,
+                    doc="Number of resolved queries kept in the in-process LRU cache")
+
+    config += Param(negative_cache_ttl=604800,
+                    doc="Seconds during which a name that kamunu could not resolve is answered as not found without retrying")
+
+    config += Param(batch_workers=4,
+                    doc="Number of concurrent kamunu resolutions for the batch endpoint")
+
+    config += Param(batch_max_size=50000,
+                    doc="Maximum number of queries accepted in a batch request")
+
+    config += Param(jobs_collection="resolution_jobs",
+                    doc="Mongo DB collection for the state of the background resolutions (async=true)")
+
+    config += Param(jobs_workers=2,
+                    doc="Number of concurrent background resolutions")
+
+    config += Param(jobs_ttl=86400,
+                    doc="Seconds to keep a background resolution after it finished")
+
+    config += Param(jobs_timeout=600,
+                    doc="Seconds without news of the process of a background resolution after which it is failed and can be enqueued again")
+
     config += Param(apikey="colavudea",
                     doc="Plugin API key")
 
@@ -30,6 +94,406 @@ class Kamunu(HunabkuPluginBase):
         self.records_collection = self.db[self.config.records_collection]
         self.not_inserted_collection = self.db[self.config.not_inserted_collection]
         self.apikey = self.config.apikey
+        self.resolution_cache = ResolutionCache(
+            self.db[self.config.cache_collection], self.config.cache_size)
+        self.negative_cache = NegativeCache(
+            self.not_inserted_collection, self.config.negative_cache_ttl, self.config.cache_size)
+        self.batch_executor = ThreadPoolExecutor(
+            max_workers=self.config.batch_workers)
+        self.jobs = JobQueue(
+            self.db[self.config.jobs_collection], self.config.jobs_workers, self.config.jobs_timeout)
+        # the indexes are created in background, the plugin must load even if MongoDB is down.
+        Thread(target=self.create_indexes, daemon=True).start()
+
+    def create_indexes(self):
+        """
+        Creates the indexes on the identifier paths of the records collection
+        and the indexes of the jobs collection.
+        """
+        try:
+            ensure_indexes(self.records_collection)
+            self.negative_cache.ensure_indexes()
+            self.jobs.ensure_indexes(self.config.jobs_ttl)
+        except Exception as e:
+            self.logger.warning(f'Kamunu: can not create the indexes: {e}')
+
+    def valid_apikey(self):
+        """
+        Checks the apikey with the key store of hunabku_common.auth, it is also accepted
+        in the query string of POST requests, where the body is JSON or NDJSON.
+        """
+        return check_apikey()
+
+    def cached_record(self, query: str, country: str = None, projection: dict = None):
+        """
+        Returns the record of an organization name already resolved or None.
+
+        Args:
+            query (str): The organization name.
+            country (str): Country of the organization (Optional)
+            projection (dict): Fields of the record to return (Optional)
+        """
+        record_id = self.resolution_cache.get(query, country)
+        if record_id is None:
+            return None
+        record = self.records_collection.find_one({'_id': record_id}, projection)
+        if record is None:
+            # the record was removed, the entry is stale
+            self.resolution_cache.evict(query, country)
+        return record
+
+    def resolve_name(self, query: str, source: str, country: str = None, projection: dict = None):
+        """
+        Resolves an organization name to its record, the resolution cache is
+        consulted first and kamunu is only invoked for names not resolved before.
+
+        Args:
+            query (str): The organization name.
+            source (str): Source of the organization name.
+            country (str): Country of the organization (Optional)
+            projection (dict): Fields of the record to return (Optional)
+
+        Returns:
+            The record found or None.
+        """
+        record = self.cached_record(query, country, projection)
+        if record:
+            return record
+        return self.kamunu_resolution(query, source, country, projection)
+
+    def kamunu_resolution(self, query: str, source: str, country: str = None, projection: dict = None):
+        """
+        Resolves an organization name with kamunu (the slow path) and saves
+        the result in the resolution cache, the names that kamunu could not
+        resolve recently are not retried.
+
+        Returns:
+            The record found or None.
+        """
+        if self.negative_cache.contains(query, country, source):
+            return None
+        insert = kamunu_main.single_organization(query, source, country)
+        if not insert:
+            return None
+        record = self.records_collection.find_one({'_id': insert['_id']}, projection)
+        if record:
+            self.resolution_cache.set(query, country, record['_id'])
+        else:
+            # kamunu saved the name in the not_inserted collection
+            self.negative_cache.add(query, country, source, insert['_id'])
+        return record
+
+    def resolve_identifier(self, identifier, source: str, country: str = None, projection: dict = None):
+        """
+        Inserts an organization given by identifier that is not in the collection yet,
+        only the identifiers supported by kamunu (ROR and Wikidata) can be inserted.
+
+        Args:
+            identifier (Identifier): The identifier returned by parse_identifier.
+            source (str): Source of the identifier.
+            country (str): Country of the organization (Optional)
+            projection (dict): Fields of the record to return (Optional)
+
+        Returns:
+            The record inserted or None.
+        """
+        if identifier.scheme not in INSERTABLE_SCHEMES:
+            return None
+        insert = id_input.id_as_input(identifier.value, source, country)
+        if not insert:
+            return None
+        return self.records_collection.find_one({'_id': insert['_id']}, projection)
+
+    def run_resolution_job(self, params: dict):
+        """
+        Body of the background resolutions.
+
+        Returns:
+            The _id of the record found or None.
+        """
+        identifier = parse_identifier(params['query'])
+        if identifier is None:
+            record = self.resolve_name(
+                params['query'], params['source'], params['country'], {'_id': 1})
+        else:
+            record = self.records_collection.find_one(
+                {identifier.path: identifier.value}, {'_id': 1})
+            if record is None:
+                record = self.resolve_identifier(
+                    identifier, params['source'], params['country'], {'_id': 1})
+        return record['_id'] if record else None
+
+    def enqueue_resolution(self, query: str, identifier, source: str, country: str, mode: str, key: str = None):
+        """
+        Enqueues the resolution of a query in the background jobs, the requests of the same query
+        share the job whatever their return and key, that are passed in the url of the job.
+
+        Returns:
+            Response 202 with the job id and the url to check the state of the job.
+        """
+        qkey = identifier.key if identifier else normalize_query(query, country)
+        params = {'query': query, 'source': source, 'country': country}
+        job_id = self.jobs.submit(qkey, params, self.run_resolution_job)
+        shape = {'return': mode, 'key': key} if key else {'return': mode}
+        data = {'job_id': job_id, 'status_url': f'/organizations/jobs/{job_id}?{urlencode(shape)}'}
+        response = self.app.response_class(
+            response=self.json.dumps(data),
+            status=202,
+            mimetype='application/json'
+        )
+        response.headers['Location'] = data['status_url']
+        return response
+
+    def shape_record(self, record: dict, mode: str, key: str = None):
+        """
+        Builds the response for a record fetched with record_projection.
+
+        Args:
+            record (dict): The organization record.
+            mode (str): One of the values of RETURN_OPTIONS.
+            key (str): Custom key, required when mode is custom.
+
+        Returns:
+            tuple: HTTP status and the data to send.
+        """
+        if mode == "ids":
+            return 200, record.get('ids')
+        if mode == "dehydrated" or mode == "full":
+            return 200, record
+        if key == 'records.wikidata' or key == 'records.ror':
+            child = key.split('.')[1]
+            if child in record.get('records', {}):
+                return 200, record['records'][child]
+            return 400, {'message': f'Not {child} data found in the record.'}
+        return 200, record.get(key)
+
+    def find_batch_records(self, conditions: list, paths: set, projection: dict) -> list:
+        """
+        Finds the records matching any of the conditions of a batch.
+
+        Returns:
+            list: (match, record) tuples, match has the identifier paths used to match
+            the record with the queries and record has the fields of the projection.
+        """
+        if not any(projection.get(path.split('.')[0]) == 0 for path in paths):
+            fetch = dict(projection)
+            if all(fetch.values()):
+                for path in paths:
+                    # adding a path already covered by the projection is a path collision
+                    if not any(path == field or path.startswith(field + '.') or field.startswith(path + '.')
+                               for field in fetch):
+                        fetch[path] = 1
+            return [(record, record) for record in self.records_collection.find({'$or': conditions}, fetch)]
+
+        # the projection removes some of the paths, the records are matched
+        # first with a light query and then fetched by _id.
+        matches = list(self.records_collection.find(
+            {'$or': conditions}, {path: 1 for path in paths}))
+        records = {record['_id']: record for record in self.records_collection.find(
+            {'_id': {'$in': [match['_id'] for match in matches]}}, projection)}
+        return [(match, records[match['_id']]) for match in matches if match['_id'] in records]
+
+    def parse_batch(self):
+        """
+        Reads the queries of a batch request, the body is a JSON list (or an object
+        with the list in "queries") or NDJSON with one query per line.
+        Every query is a string or an object with the keys "query" and "country".
+
+        Returns:
+            list: (query, country) tuples, or None if the body is not valid.
+        """
+        try:
+            if self.request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+                lines = self.request.get_data(as_text=True).splitlines()
+                items = [self.json.loads(line) for line in lines if line.strip()]
+            else:
+                items = self.request.get_json(force=True)
+                if isinstance(items, dict):
+                    items = items.get('queries')
+        except ValueError:
+            return None
+        if not isinstance(items, list):
+            return None
+
+        queries = []
+        for item in items:
+            if isinstance(item, str):
+                item = {'query': item}
+            if not isinstance(item, dict) or not isinstance(item.get('query'), str) or not item['query'].strip():
+                return None
+            country = item.get('country')
+            if country:
+                country = country.lower().title()
+            queries.append((item['query'].strip(), country))
+        return queries
+
+    def resolve_batch(self, queries: list, source: str, mode: str, key: str = None):
+        """
+        Resolves a list of queries, the repeated ones are resolved once, the
+        identifiers and the names already in the resolution cache are found with
+        a single query and the remaining names are sent to kamunu in the batch pool,
+        at most 4 times batch_workers ahead of the results sent, none after the
+        generator is closed (ex: the client disconnected).
+
+        Args:
+            queries (list): (query, country) tuples.
+            source (str): Source of the organization names.
+            mode (str): One of the values of RETURN_OPTIONS.
+            key (str): Custom key, required when mode is custom.
+
+        Returns:
+            generator: NDJSON lines with the results in the same order of the queries.
+        """
+        projection = record_projection(mode, key)
+        keys = []
+        unique = {}
+        for query, country in queries:
+            identifier = parse_identifier(query)
+            qkey = identifier.key if identifier else normalize_query(query, country)
+            keys.append(qkey)
+            if qkey not in unique:
+                unique[qkey] = (query, country, identifier)
+
+        cached = self.resolution_cache.get_many(
+            [qkey for qkey, (_, _, identifier) in unique.items() if identifier is None])
+        ids = {path: set() for path in ID_PATHS.values()}
+        ids['_id'] = set(cached.values())
+        for _, _, identifier in unique.values():
+            if identifier:
+                ids[identifier.path].add(identifier.value)
+        conditions = [{path: {'$in': list(values)}}
+                      for path, values in ids.items() if values]
+
+        found = {path: {} for path in ids}
+        if conditions:
+            paths = {path for path, values in ids.items() if values}
+            for match, record in self.find_batch_records(conditions, paths, projection):
+                for path in paths:
+                    for value in values_at(match, path):
+                        found[path][value] = record
+
+        results = {}
+        # resolutions for kamunu in the order of the queries
+        tasks = {}
+        for qkey, (query, country, identifier) in unique.items():
+            if identifier:
+                record = found[identifier.path].get(identifier.value)
+            else:
+                record = found['_id'].get(cached.get(qkey))
+            if record:
+                results[qkey] = record
+            elif identifier:
+                tasks[qkey] = (self.resolve_identifier, identifier, source, country, projection)
+            else:
+                tasks[qkey] = (self.resolve_name, query, source, country, projection)
+        order = list(tasks)
+        position = {qkey: i for i, qkey in enumerate(order)}
+        window = 4 * self.config.batch_workers
+        futures = {}
+
+        def submit(upto):
+            # submits the resolutions in order until the position upto
+            while len(futures) < min(upto, len(order)):
+                qkey = order[len(futures)]
+                function, *args = tasks[qkey]
+                futures[qkey] = self.batch_executor.submit(function, *args)
+
+        def generate():
+            try:
+                for (query, country), qkey in zip(queries, keys):
+                    line = {'query': query, 'country': country}
+                    if qkey in tasks:
+                        submit(position[qkey] + window)
+                    try:
+                        record = futures[qkey].result() if qkey in tasks else results[qkey]
+                    except Exception as e:
+                        line.update({'status': 500, 'result': {'message': str(e)}})
+                        yield self.json.dumps(line, default=str) + '\n'
+                        continue
+                    if record:
+                        status, data = self.shape_record(record, mode, key)
+                    else:
+                        status, data = 404, {
+                            'message': 'Not Found: There were no valid results for the organization'}
+                    line.update({'status': status, 'result': data})
+                    yield self.json.dumps(line, default=str) + '\n'
+            finally:
+                # the resolutions not started are dropped when the client disconnects
+                for future in futures.values():
+                    future.cancel()
+        return generate()
+
+    @endpoint('/organizations/batch', methods=['POST'])
+    def search_organizations_batch(self):
+        """
+        @api {post} /organizations/batch Organizations IDs batch finder
+        @apiName Organizations batch finder plugin
+        @apiGroup Oganizations
+        @apiDescription Allows to resolve a list of organization names or identifiers in a single request.
+                        The body is a JSON list (or an object with the list in the key queries) or NDJSON
+                        (Content-Type: application/x-ndjson) with one query per line, every query is a string
+                        or an object with the keys query and country.
+                        The results are streamed as NDJSON in the same order of the queries.
+
+        @apiParam {String} apikey  Credential for authentication (in the query string)
+        @apiParam {String="IDs_Only", "Dehydrated_document" ,"Full_document", "Custom"} return="Dehydrated_document" Options for search response
+        @apiParam {String="_id", "raw_name" ,"names", "ids", "categories", "location", "records", "records.wikidata", "records.ror"} key="location" Options for custom key
+        @apiParam {String} source Source of the organization names (Optional)
+
+        @apiSuccess {Object[]} results NDJSON lines with the keys query, country, status and result.
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 400) msg  Bad request, if the body or the parameters are not right.
+
+        @apiExample {curl} Example usage:
+            # Get only organization identifiers for a list of names and ids.
+            curl -i -X POST "http://apis.colav.co/organizations/batch?apikey=XXXX&return=IDs_Only" -H "Content-Type: application/json" -d '["Universidad de antioquia", "Q1258413"]'
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+
+        source = self.request.args.get('source', 'batch_search')
+        return_ = self.request.args.get('return', 'Dehydrated_document')
+        key = self.request.args.get('key')
+
+        mode = RETURN_OPTIONS.get(return_.lower())
+        if mode is None:
+            data = {"message": "Invalid value for 'return' parameter"}
+            return self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+        if mode == "custom":
+            key = key.lower() if key else 'location'
+            if key not in CUSTOM_KEYS:
+                return self.app.response_class(
+                    response=self.json.dumps({'message': 'Invalid key'}),
+                    status=400,
+                    mimetype='application/json'
+                )
+
+        queries = self.parse_batch()
+        if not queries:
+            data = {"message": "The body must be a non empty JSON or NDJSON list of queries"}
+            return self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+        if len(queries) > self.config.batch_max_size:
+            data = {"message": f"Too many queries, the maximum is {self.config.batch_max_size}"}
+            return self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+
+        return self.app.response_class(
+            response=self.resolve_batch(queries, source, mode, key),
+            status=200,
+            mimetype='application/x-ndjson'
+        )
 
     @endpoint('/organizations', methods=['GET'])
     def search_organizations(self):
@@ -40,14 +504,16 @@ class Kamunu(HunabkuPluginBase):
         @apiDescription Allows to perform searches for information about organizations
 
         @apiParam {String} apikey  Credential for authentication
-        @apiParam {String} query Organization name or identifier
+        @apiParam {String} query Organization name or identifier (ROR, Wikidata, GRID, ISNI or Crossref Funder ID)
         @apiParam {String} country Country of the organization (Optional)
 
         @apiParam {String="IDs_Only", "Dehydrated_document" ,"Full_document", "Custom"} return="Dehydrated_document" Options for search response
         @apiParam {String="_id", "raw_name" ,"names", "ids", "categories", "location", "records", "records.wikidata", "records.ror"} key="location" Options for custom key
         @apiParam {String} source Source of the organization name (Optional)
+        @apiParam {Boolean} async=false If true and the organization is not resolved yet, the resolution runs in background and a job id is returned with status 202 (Optional)
 
         @apiSuccess Document/Dict Dehydrated document of the organization
+        @apiSuccess (Success 202) {String} job_id Id of the background resolution, see /organizations/jobs/:job_id
 
         @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
         @apiError (Error 400) msg  Bad request, if the query is not right.
@@ -65,6 +531,9 @@ class Kamunu(HunabkuPluginBase):
 
             # Get data from wikidata and ror by entering the name of the organization or the identifier. ('records', 'records.wikidata', 'records.ror')
             curl -i http://apis.colav.co/organizations?apikey=XXXX&query=Q1258413&return=custom&key=records
+
+            # Resolve in background if the organization is not known yet.
+            curl -i http://apis.colav.co/organizations?apikey=XXXX&query=Universidad%20de%20antioquia&return=IDs_Only&async=true
         """
 
         if not self.valid_apikey():
@@ -75,89 +544,9 @@ class Kamunu(HunabkuPluginBase):
         return_ = request.args.get('return')
         key = request.args.get('key')
         country = request.args.get('country')
+        background = request.args.get('async', 'false').lower() in ('true', '1', 'yes')
 
-        def bd_search(key: str, query: str):
-            """"
-            Search for the organization in the collection according to the ID
-
-            Arg:
-                key (str): The key according to the ID
-                query (str): The input Id string to be find.
-
-            Returns:
-                The record found.
-            """
-
-            results = None
-            # Search for the organization in the collection
-            results = self.records_collection.find_one({key: query})
-
-            return results
-
-        def detect_input_type(query):
-            """
-            Detects the type of input based on different patterns.
-
-            Args:
-                query (str): The input string to be detected.
-
-            Returns:
-                str: The type of input detected.
-            """
-            # Regular expression patterns for different types of inputs
-            ror_url_pattern = r'^https:\/\/ror\.org\/\w+$'
-            wikidata_url_pattern = r'^https:\/\/www\.wikidata\.org\/wiki\/Q\d+$'
-            wikidata_id_pattern = r'^Q\d+$'
-            ror_id_pattern = r'^\w+$'
-
-            # Checking patterns
-            if re.match(ror_url_pattern, query):
-                return bd_search('ids.ror', query)
-            elif re.match(wikidata_url_pattern, query):
-                return bd_search('ids.wikidata', query)
-            elif re.match(wikidata_id_pattern, query):
-                return bd_search('ids.wikidata', "https://www.wikidata.org/wiki/" + query)
-            elif re.match(ror_id_pattern, query) and len(query) == 9 and query.startswith('0') and query[-1].isdigit():
-                return bd_search('ids.ror', "https://ror.org/" + query)
-            else:
-                return 'string'
-
-        query = request.args.get('query')
         if query:
-            input = detect_input_type(query)
-
-            if country:
-                country = country.lower().title()
-
-            if input == 'string' and source:
-                kamunu_query = query
-                kamunu_source = source
-                insert = kamunu_main.single_organization(
-                    kamunu_query, kamunu_source, country)
-                response = bd_search('_id', insert['_id'])
-
-            elif input == 'string':
-                kamunu_query = query
-                insert = kamunu_main.single_organization(
-                    kamunu_query, "single_search", country)
-                if insert:
-                    response = bd_search('_id', insert['_id'])
-                else:
-                    response = None
-
-            else:
-                if input is None:
-                    if source:
-                        kamunu_source = source
-                    else:
-                        kamunu_source = "single_search"
-
-                    insert = id_input.id_as_input(
-                        query, kamunu_source, country)
-                    response = bd_search('_id', insert['_id'])
-                else:
-                    response = input
-
             if not return_:
                 data = {
                     "message": "It is necessary to define the 'return' parameter"}
@@ -168,76 +557,61 @@ class Kamunu(HunabkuPluginBase):
                 )
                 return response
 
-            if response:
-                if return_.lower() == "ids_only" or return_.lower() == "only_ids" or return_.lower() == "ids":
-                    return self.app.response_class(
-                        response=self.json.dumps(response['ids'], default=str),
-                        status=200,
-                        mimetype='application/json'
-                    )
+            mode = RETURN_OPTIONS.get(return_.lower())
+            if mode is None:
+                data = {"message": "Invalid value for 'return' parameter"}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+                return response
 
-                elif return_.lower() == "dehydrated_document" or return_.lower() == "dehydrated":
-                    response.pop('records')
-                    response.pop('validation')
+            if mode == "custom":
+                # Custom key
+                if not key:
+                    key = 'location'
+                key = key.lower()
+                if key not in CUSTOM_KEYS:
                     return self.app.response_class(
-                        response=self.json.dumps(response, default=str),
-                        status=200,
+                        response=self.json.dumps(
+                            {'message': 'Invalid key'}),
+                        status=400,
                         mimetype='application/json'
                     )
+            projection = record_projection(mode, key)
 
-                elif return_.lower() == "full_document" or return_.lower() == "full":
-                    response.pop('validation')
-                    return self.app.response_class(
-                        response=self.json.dumps(response, default=str),
-                        status=200,
-                        mimetype='application/json'
-                    )
+            identifier = parse_identifier(query)
 
-                elif return_.lower() == "custom":
-                    # Custom key
-                    if not key:
-                        key = 'location'
-                    key = key.lower()
-                    if key not in ['_id', 'raw_name', 'names', 'ids', 'categories', 'location', 'records', 'records.wikidata', 'records.ror']:
-                        return self.app.response_class(
-                            response=self.json.dumps(
-                                {'message': 'Invalid key'}),
-                            status=400,
-                            mimetype='application/json'
-                        )
-
-                    elif key == 'records.wikidata' or key == 'records.ror':
-                        child = key.split('.')[1]
-                        if child in response['records']:
-                            return self.app.response_class(
-                                response=self.json.dumps(
-                                    response['records'][child], default=str),
-                                status=200,
-                                mimetype='application/json'
-                            )
-                        else:
-                            return self.app.response_class(
-                                response=self.json.dumps(
-                                    {'message': f'Not {child} data found in the record.'}),
-                                status=400,
-                                mimetype='application/json'
-                            )
+            if country:
+                country = country.lower().title()
 
-                    else:
-                        return self.app.response_class(
-                            response=self.json.dumps(
-                                response[f'{key}'], default=str),
-                            status=200,
-                            mimetype='application/json'
-                        )
-                else:
-                    data = {"message": "Invalid value for 'return' parameter"}
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=400,
-                        mimetype='application/json'
-                    )
-                    return response
+            kamunu_source = source if source else "single_search"
+            if identifier is None:
+                response = self.cached_record(query, country, projection)
+                if response is None:
+                    if background:
+                        return self.enqueue_resolution(
+                            query, identifier, kamunu_source, country, mode, key)
+                    response = self.kamunu_resolution(
+                        query, kamunu_source, country, projection)
+            else:
+                response = self.records_collection.find_one(
+                    {identifier.path: identifier.value}, projection)
+                if response is None:
+                    if background:
+                        return self.enqueue_resolution(
+                            query, identifier, kamunu_source, country, mode, key)
+                    response = self.resolve_identifier(
+                        identifier, kamunu_source, country, projection)
+
+            if response:
+                status, data = self.shape_record(response, mode, key)
+                return self.app.response_class(
+                    response=self.json.dumps(data, default=str),
+                    status=status,
+                    mimetype='application/json'
+                )
 
             else:
                 if country:
@@ -252,3 +626,78 @@ class Kamunu(HunabkuPluginBase):
                     status=404,
                     mimetype='application/json'
                 )
+
+    @endpoint('/organizations/jobs/<job_id>', methods=['GET'])
+    def organizations_job(self, job_id):
+        """
+        @api {get} /organizations/jobs/:job_id Organizations background resolution
+        @apiName Organizations background resolution
+        @apiGroup Oganizations
+        @apiDescription Allows to check the state of a resolution enqueued with async=true in /organizations,
+                        when the job is done the result is returned with the return and key passed,
+                        the status_url returned by /organizations has the ones of the request.
+
+        @apiParam {String} apikey  Credential for authentication
+        @apiParam {String} job_id  Id of the job returned by /organizations
+        @apiParam {String="IDs_Only", "Dehydrated_document" ,"Full_document", "Custom"} return="Dehydrated_document" Options for the result
+        @apiParam {String="_id", "raw_name" ,"names", "ids", "categories", "location", "records", "records.wikidata", "records.ror"} key="location" Options for custom key
+
+        @apiSuccess Document/Dict Result of the resolution, with the state of the job.
+        @apiSuccess (Success 202) {String} status queued or running, the job is not finished yet.
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+        @apiError (Error 404) msg  Not Found, the job does not exist or there were no valid results for the organization.
+        @apiError (Error 500) msg  The resolution failed.
+
+        @apiExample {curl} Example usage:
+            curl -i http://apis.colav.co/organizations/jobs/6565f0a1c2a3b4d5e6f70819?apikey=XXXX&return=ids
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+
+        job = self.jobs.get(job_id)
+        if job is None:
+            return self.app.response_class(
+                response=self.json.dumps(
+                    {'message': f'Not Found: There is no job {job_id}'}),
+                status=404,
+                mimetype='application/json'
+            )
+
+        params = job['params']
+        mode = RETURN_OPTIONS.get(request.args.get('return', 'dehydrated').lower())
+        key = request.args.get('key')
+        if mode == "custom":
+            key = (key or 'location').lower()
+        if mode is None or (mode == "custom" and key not in CUSTOM_KEYS):
+            return self.app.response_class(
+                response=self.json.dumps(
+                    {'message': "Invalid value for 'return' or 'key' parameter"}),
+                status=400,
+                mimetype='application/json'
+            )
+
+        data = {'job_id': job_id, 'status': job['status'], 'query': params['query'],
+                'country': params['country'], 'created': job['created'], 'updated': job['updated']}
+        status = 202
+        if job['status'] == 'done':
+            projection = record_projection(mode, key)
+            record = self.records_collection.find_one(
+                {'_id': job['record_id']}, projection)
+            if record:
+                status, data['result'] = self.shape_record(record, mode, key)
+            else:
+                status = 404
+                data['message'] = 'Not Found: The record of the organization was removed'
+        elif job['status'] == 'not_found':
+            status = 404
+            data['message'] = f'Not Found: There were no valid results for the organization: {params["query"]}'
+        elif job['status'] == 'failed':
+            status = 500
+            data['message'] = job.get('error')
+
+        return self.app.response_class(
+            response=self.json.dumps(data, default=str),
+            status=status,
+            mimetype='application/json'
+        )
@@ -0,0 +1,107 @@
+from collections import namedtuple
+import re
+
+
+class Identifier(namedtuple('Identifier', ['scheme', 'value', 'path'])):
+    """
+    Organization identifier in its canonical form.
+
+    scheme is one of the keys of ID_PATHS, value is the identifier as it is
+    stored in the records collection and path is the field to query.
+    """
+    __slots__ = ()
+
+    @property
+    def key(self) -> str:
+        return f'{self.scheme}:{self.value}'
+
+
+# field of the records collection where every scheme is stored,
+# GRID, ISNI and FundRef are taken from the ROR record.
+ID_PATHS = {
+    'ror': 'ids.ror',
+    'wikidata': 'ids.wikidata',
+    'grid': 'records.ror.external_ids.GRID.all',
+    'isni': 'records.ror.external_ids.ISNI.all',
+    'fundref': 'records.ror.external_ids.FundRef.all',
+}
+
+# schemes that kamunu is able to insert when they are not in the collection
+INSERTABLE_SCHEMES = ('ror', 'wikidata')
+
+ROR_URL = re.compile(r'^(?:https?://)?(?:www\.)?ror\.org/(\w+)/?$', re.IGNORECASE)
+ROR_ID = re.compile(r'^0[a-hj-km-np-tv-z0-9]{6}\d{2}$', re.IGNORECASE)
+WIKIDATA_URL = re.compile(r'^(?:https?://)?(?:www\.)?wikidata\.org/(?:wiki|entity)/(Q\d+)/?$', re.IGNORECASE)
+WIKIDATA_ID = re.compile(r'^Q\d+$', re.IGNORECASE)
+GRID = re.compile(r'^(?:https?://(?:www\.)?grid\.ac/institutes/)?(grid\.\d+\.[0-9a-f]+)/?$', re.IGNORECASE)
+ISNI = re.compile(r'^(?:https?://(?:www\.)?isni\.org/isni/|isni:?\s*)?(\d{4})\s?(\d{4})\s?(\d{4})\s?(\d{3}[\dX])/?$', re.IGNORECASE)
+FUNDREF = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)?10\.13039/(\d+)/?$', re.IGNORECASE)
+
+
+def parse_identifier(query: str):
+    """
+    Detects if the query is an organization identifier.
+
+    Args:
+        query (str): The input string to be detected.
+
+    Returns:
+        Identifier: the identifier in canonical form or None if the query is a name.
+    """
+    query = query.strip()
+
+    match = ROR_URL.match(query)
+    if match:
+        return Identifier('ror', 'https://ror.org/' + match.group(1).lower(), ID_PATHS['ror'])
+    if ROR_ID.match(query):
+        return Identifier('ror', 'https://ror.org/' + query.lower(), ID_PATHS['ror'])
+
+    match = WIKIDATA_URL.match(query)
+    if match:
+        qid = match.group(1).upper()
+        return Identifier('wikidata', 'https://www.wikidata.org/wiki/' + qid, ID_PATHS['wikidata'])
+    if WIKIDATA_ID.match(query):
+        return Identifier('wikidata', 'https://www.wikidata.org/wiki/' + query.upper(), ID_PATHS['wikidata'])
+
+    match = GRID.match(query)
+    if match:
+        return Identifier('grid', match.group(1).lower(), ID_PATHS['grid'])
+
+    match = ISNI.match(query)
+    if match:
+        # ROR stores the ISNI in groups of four digits
+        return Identifier('isni', ' '.join(match.groups()).upper(), ID_PATHS['isni'])
+
+    match = FUNDREF.match(query)
+    if match:
+        return Identifier('fundref', match.group(1), ID_PATHS['fundref'])
+
+    return None
+
+
+def values_at(record: dict, path: str) -> list:
+    """
+    Returns the values stored in a dotted path of the record,
+    the lists found along the path are flattened.
+    """
+    values = [record]
+    for field in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and field in value:
+                found.append(value[field])
+        values = []
+        for value in found:
+            values.extend(value if isinstance(value, list) else [value])
+    return [value for value in values if value]
+
+
+def ensure_indexes(collection) -> list:
+    """
+    Creates (if missing) one index for every identifier path,
+    so the lookups by identifier are a single index hit.
+
+    Returns:
+        list: names of the indexes.
+    """
+    return [collection.create_index(path) for path in ID_PATHS.values()]
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from bson.objectid import ObjectId
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from threading import Lock, Thread
+import logging
+import time
+
+
+class JobQueue:
+    """
+    Background jobs for the slow kamunu resolutions.
+
+    The jobs run in a local thread pool, apart from the workers that serve the
+    requests, and their state is saved in MongoDB so any server worker can
+    report it. The states are queued, running, done, not_found and failed.
+    There is a single pending (queued or running) job per key, the process of
+    the pending jobs updates them every timeout / 4 seconds, a pending job not
+    updated in timeout seconds is failed (ex: the process was restarted) and
+    the next submit of its key creates a new one.
+    """
+
+    def __init__(self, collection, workers: int = 2, timeout: int = 600):
+        self.collection = collection
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # pending jobs of this process
+        self.pending = set()
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+        Thread(target=self._heartbeat, daemon=True).start()
+
+    def ensure_indexes(self, ttl: int):
+        """
+        Creates the unique index of the pending jobs by key and the TTL index
+        that removes the finished jobs ttl seconds after they finished.
+        """
+        self.collection.create_index('key', unique=True, name='pending_key',
+                                     partialFilterExpression={'pending': True})
+        self.collection.create_index('finished', expireAfterSeconds=ttl)
+
+    def _heartbeat(self):
+        """
+        Updates the pending jobs of the process, the queued jobs are alive
+        while they wait for a worker and the running ones while kamunu works.
+        """
+        while True:
+            time.sleep(self.timeout / 4)
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                continue
+            try:
+                self.collection.update_many({'_id': {'$in': pending}, 'pending': True},
+                                            {'$set': {'updated': datetime.utcnow()}})
+            except Exception as e:
+                self.logger.warning(f'can not update the pending jobs: {e}')
+
+    def _expire(self, key: str, now: datetime):
+        limit = now - timedelta(seconds=self.timeout)
+        self._finish({'key': key, 'pending': True, 'updated': {'$lt': limit}},
+                     {'status': 'failed', 'error': 'the job was interrupted'}, many=True)
+
+    def submit(self, key: str, params: dict, function) -> str:
+        """
+        Enqueues a resolution, if a job for the same key is pending
+        the existing job is returned instead of creating a new one.
+
+        Args:
+            key (str): Normalized query used to detect repeated jobs.
+            params (dict): Parameters of the job, saved with the job and passed to function.
+            function (callable): Receives params and returns the record _id or None.
+
+        Returns:
+            str: The job id.
+        """
+        now = datetime.utcnow()
+        self._expire(key, now)
+        job_id = str(ObjectId())
+        try:
+            # the job is created only if there is no pending job for the key
+            job = self.collection.find_one_and_update(
+                {'key': key, 'pending': True},
+                {'$setOnInsert': {'_id': job_id, 'status': 'queued', 'params': params,
+                                  'created': now, 'updated': now}},
+                projection={'_id': 1}, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # created at the same time by another request
+            return self.submit(key, params, function)
+        if job['_id'] == job_id:
+            with self.lock:
+                self.pending.add(job_id)
+            self.executor.submit(self._run, job_id, params, function)
+        return job['_id']
+
+    def _run(self, job_id: str, params: dict, function):
+        try:
+            self._resolve(job_id, params, function)
+        finally:
+            with self.lock:
+                self.pending.discard(job_id)
+
+    def _resolve(self, job_id: str, params: dict, function):
+        self._update(job_id, {'status': 'running'})
+        try:
+            record_id = function(params)
+        except Exception as e:
+            self._finish({'_id': job_id}, {'status': 'failed', 'error': str(e)})
+            return
+        if record_id is None:
+            self._finish({'_id': job_id}, {'status': 'not_found'})
+        else:
+            self._finish({'_id': job_id}, {'status': 'done', 'record_id': record_id})
+
+    def _update(self, job_id: str, values: dict):
+        values['updated'] = datetime.utcnow()
+        self.collection.update_one({'_id': job_id}, {'$set': values})
+
+    def _finish(self, query: dict, values: dict, many: bool = False):
+        values['updated'] = values['finished'] = datetime.utcnow()
+        update = {'$set': values, '$unset': {'pending': ''}}
+        if many:
+            self.collection.update_many(query, update)
+        else:
+            self.collection.update_one(query, update)
+
+    def get(self, job_id: str):
+        """
+        Returns the job document or None if the job does not exist.
+        """
+        job = self.collection.find_one({'_id': job_id})
+        if job and job.get('pending') and datetime.utcnow() - job['updated'] > timedelta(seconds=self.timeout):
+            job['status'] = 'failed'
+            job['error'] = 'the job was interrupted'
+        return job
@@ -83,6 +83,7 @@ def main():
             'flask>=1.1.2',
             'requests>=2.22.0',
             'hunabku',
+            'hunabku_common',
             'kamunu'
         ],
     )
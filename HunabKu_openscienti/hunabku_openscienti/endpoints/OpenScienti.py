@@ -1,6 +1,7 @@
 from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from pymongo import MongoClient
+from hunabku_common.exports import register_export
 import sys
 
 
@@ -15,6 +16,25 @@ class OpenScienti(HunabkuPluginBase):
         super().__init__(hunabku)
         self.dbclient = MongoClient(self.config.db_uri)
         self.db = self.dbclient[self.config.db_name]
+        # exports of hunabku_common.exports, the same data of /openscienti/cvlac without COD_RH
+        register_export('openscienti_raw_data', [], self.export_records('cvlac_data'), self.export_version('cvlac_data'))
+        register_export('openscienti_scrapped_data', [], self.export_records('cvlac_stage'), self.export_version('cvlac_stage'))
+
+    def export_records(self, collection):
+        """
+        Returns the function that reads all the records of the collection for an export.
+        """
+        return lambda params: self.db[collection].find({}, {'_id': 0})
+
+    def export_version(self, collection):
+        """
+        Returns the function that reads the version of the data of the collection,
+        the number of records and their size from collStats.
+        """
+        def version(params):
+            stats = self.db.command('collStats', collection)
+            return [stats['count'], stats['size']]
+        return version
 
     @endpoint('/openscienti/cvlac', methods=['GET'])
     def openscienti_cvlac(self):
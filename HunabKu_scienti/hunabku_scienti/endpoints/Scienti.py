@@ -1,11 +1,26 @@
 from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from pymongo import MongoClient
-from elasticsearch import Elasticsearch, __version__ as es_version
+from elasticsearch import NotFoundError
 from elasticsearch_dsl import Search
+from hunabku_common.auth import check_apikey
+from hunabku_common.elastic import IndexCatalog, get_client
+from hunabku_common.exports import register_export
+from hunabku_common.limits import set_cost
+from hunabku_common.mongo import NameCatalog
+from hunabku_common.singleflight import coalesce
+from hunabku_common.streams import json_array, prefetch
+from hunabku_common.timing import phase, note_query, timed
+from hunabku_scienti.entities import ENTITIES, SEARCH
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import sys
 import re
-import time
+
+
+# databases scienti_{institution}_{model_year} and indices scienti_{institution}_{model_year}_{collection}
+SCIENTI_DB = re.compile(r'^scienti_([^_]+)_(\d+)$')
+SCIENTI_INDEX = re.compile(r'^scienti_([^_]+)_(\d+)_')
 
 
 class Scienti(HunabkuPluginBase):
@@ -18,68 +33,148 @@ class Scienti(HunabkuPluginBase):
                     doc="Elastic Search user")
     config += Param(es_pass="",
                     doc="Elastic Search password")
+    config += Param(es_catalog_ttl=60,
+                    doc="Seconds to cache the list of Elastic Search indices before refreshing it in background")
+    config += Param(es_maxsize=25,
+                    doc="Elastic Search connections kept open per node, shared by the plugins with the same es_uri")
+    config += Param(es_http_compress=True,
+                    doc="Compress the Elastic Search requests with gzip")
+    config += Param(es_request_timeout=30,
+                    doc="Seconds to wait for an Elastic Search response")
+    config += Param(es_max_retries=3,
+                    doc="Retries of an Elastic Search request on connection errors")
+    config += Param(es_retry_on_timeout=True,
+                    doc="Retry the Elastic Search requests that timed out")
+    config += Param(es_backoff_factor=1.0,
+                    doc="Seconds to skip an Elastic Search node after a failure, doubled on consecutive failures")
+    config += Param(mdb_catalog_ttl=60,
+                    doc="Seconds to cache the list of MongoDB databases used to check model_year and institution")
+    config += Param(default_max_results=100,
+                    doc="Results per page when page is passed without max_results")
+    config += Param(fanout_workers=8,
+                    doc="Threads to query concurrently the databases of several institutions or model years")
 
     def __init__(self, hunabku):
         super().__init__(hunabku)
         self.dbclient = MongoClient(self.config.db_uri)
-        auth = (self.config.es_user, self.config.es_pass)
-        if es_version[0] < 8:
-            self.es = Elasticsearch(self.config.es_uri, http_auth=auth)
-        else:
-            self.es = Elasticsearch(self.config.es_uri, basic_auth=auth)
+        self.es = get_client(self.config.es_uri, self.config.es_user, self.config.es_pass,
+                             maxsize=self.config.es_maxsize,
+                             http_compress=self.config.es_http_compress,
+                             request_timeout=self.config.es_request_timeout,
+                             max_retries=self.config.es_max_retries,
+                             retry_on_timeout=self.config.es_retry_on_timeout,
+                             backoff_factor=self.config.es_backoff_factor)
+        self.index_catalog = IndexCatalog(self.es, self.config.es_catalog_ttl)
+        self.db_catalog = NameCatalog(self.dbclient.list_database_names, self.config.mdb_catalog_ttl)
+        self.fanout_executor = ThreadPoolExecutor(max_workers=self.config.fanout_workers)
+        for entity in ENTITIES.values():
+            set_cost(f'/scienti/{entity.name}', self.entity_cost)
+        set_cost('/scienti/info/', self.info_cost)
+        for entity in ENTITIES.values():
+            register_export(f'scienti_{entity.name}', ['institution', 'model_year'],
+                            self.entity_export(entity), self.export_version)
+
+    def valid_apikey(self):
+        """
+        Checks the apikey in the API keys of hunabku_common.auth,
+        the hunabku apikey and the keys of the clients.
+        """
+        return check_apikey()
+
+    def entity_cost(self, req_args):
+        """
+        Cost of a request to the entities for the rate limits (hunabku_common.limits),
+        a lookup by COD_RH and key costs 1 and a list 2 for every database queried, all counts as 10.
+        """
+        if req_args.get('COD_RH') and any(req_args.get(entity.id_key) for entity in ENTITIES.values()):
+            return 1
+        dbs = 1
+        for param in ('institution', 'model_year'):
+            value = req_args.get(param, '')
+            dbs *= 10 if value == 'all' else len(value.split(','))
+        return 2 * dbs
+
+    def info_cost(self, req_args):
+        """
+        The ids of a whole database cost 10, the resume 1.
+        """
+        return 10 if req_args.get('get') == 'ids' else 1
+
+    def export_db(self, params):
+        db_name = f"scienti_{params['institution']}_{params['model_year']}"
+        if not self.db_catalog.exists(db_name):
+            raise ValueError(f"invalid institution or model_year, database {db_name} not found.")
+        return self.dbclient[db_name]
+
+    def entity_export(self, entity):
+        """
+        Returns the function of the export scienti_{name} of hunabku_common.exports,
+        all the records of the entity for an institution and model year.
+        """
+        def run(params):
+            return self.export_db(params)[entity.collection].find({}, entity.projection)
+        return run
+
+    def export_version(self, params):
+        # the databases of a model year are loaded once, the names of the collections and their counts are enough
+        db = self.export_db(params)
+        return {name: db[name].estimated_document_count() for name in sorted(db.list_collection_names())}
 
     def check_required_parameters(self, req_args):
         """
         Method to check mandatory parameters for the request.
         if a required parameter is not found, returns error code 400 (Bad Request)
         """
-        model_year = req_args.get('model_year')
-        institution = req_args.get('institution')
-        if not model_year:
-            # model year required
-            data = {"error": "Bad Request",
-                    "message": "model_year parameter is required, it was not provided."}
-            response = self.app.response_class(
-                response=self.json.dumps(data),
-                status=400,
-                mimetype='application/json'
-            )
-            return response
+        with phase('validation'):
+            model_year = req_args.get('model_year')
+            institution = req_args.get('institution')
+            if not model_year:
+                # model year required
+                data = {"error": "Bad Request",
+                        "message": "model_year parameter is required, it was not provided."}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+                return response
 
-        if not institution:
-            # institution required
-            data = {"error": "Bad Request",
-                    "message": "institution parameter is required, it was not provided. options are: udea, unaula, uec"}
-            response = self.app.response_class(
-                response=self.json.dumps(data),
-                status=400,
-                mimetype='application/json'
-            )
-            return response
-        return None
+            if not institution:
+                # institution required
+                data = {"error": "Bad Request",
+                        "message": "institution parameter is required, it was not provided. options are: udea, unaula, uec"}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+                return response
+            return None
 
     def check_parameters(self, end_params, req_args):
         """
         Method to check is the parameters passed to the endpoint are valid,
         if unkown parameter is passed and Bad request is returned.
         """
-        for rarg in req_args:
-            if rarg not in end_params:
-                data = {"error": "Bad Request",
-                        "message": f"invalid parameter {rarg} passed. please fix your request. Valid parameters are {end_params}"}
-                response = self.app.response_class(response=self.json.dumps(data),
-                                                   status=400,
-                                                   mimetype='application/json'
-                                                   )
-                return response
-        return None
+        with phase('validation'):
+            for rarg in req_args:
+                if rarg not in end_params:
+                    data = {"error": "Bad Request",
+                            "message": f"invalid parameter {rarg} passed. please fix your request. Valid parameters are {end_params}"}
+                    response = self.app.response_class(response=self.json.dumps(data),
+                                                       status=400,
+                                                       mimetype='application/json'
+                                                       )
+                    return response
+            return None
 
     def check_db(self, db_name):
         """
         Method to check if the database exists, the database is a combination of scienti_{initials}_{year} ex: scienti_udea_2022
         """
-        db_names = self.dbclient.list_database_names()
-        if db_name not in db_names:
+        with phase('catalog'):
+            exists = self.db_catalog.exists(db_name)
+        if not exists:
             data = {
                 "error": "Bad Request", "message": f"invalid model_year or institution, db {db_name} not found."}
             response = self.app.response_class(
@@ -90,9 +185,101 @@ class Scienti(HunabkuPluginBase):
             return response
         return None
 
-    def es_multi_match(self, keyword, fields, es_index):
+    def es_index_error(self, es_index):
+        """
+        returns error 500, the index does not exists in Elastic Search.
+        """
+        response = self.app.response_class(
+            response=self.json.dumps(
+                {"msg": f"Internal error, index {es_index} not found in Elastic Search"}),
+            status=500,
+            mimetype='application/json'
+        )
+        return response
+
+    def check_es_index(self, es_index):
+        """
+        Method to check in the cached index catalog if the index is known to be missing in Elastic Search,
+        returns error 500 if the index does not exists.
+        The catalog is refreshed in background, a 404 in the search invalidates it.
+        """
+        with phase('catalog'):
+            exists = self.index_catalog.exists(es_index)
+        if exists is False:
+            return self.es_index_error(es_index)
+        return None
+
+    def check_pagination(self, req_args):
+        """
+        Method to check the pagination parameters page and max_results,
+        returns the skip and limit for the query (0 and 0 without pagination)
+        and error code 400 (Bad Request) if they are not positive integers.
+        """
+        page = req_args.get('page')
+        max_results = req_args.get('max_results')
+        if not page and not max_results:
+            return 0, 0, None
+        try:
+            page = int(page) if page else 1
+            max_results = int(max_results) if max_results else self.config.default_max_results
+            if page < 1 or max_results < 1:
+                raise ValueError()
+        except ValueError:
+            data = {"error": "Bad Request",
+                    "message": "page and max_results must be positive integers."}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return 0, 0, response
+        return (page - 1) * max_results, max_results, None
+
+    def check_fields(self, entity, req_args):
+        """
+        Method to check the parameter fields (comma separated) against the fields allowed for the entity,
+        returns the fields selected (None if all the fields are requested), the MongoDB projection
+        and error code 400 (Bad Request) if a field is not allowed.
+        """
+        fields = req_args.get('fields')
+        if not fields:
+            return None, entity.projection, None
+        try:
+            fields = entity.select([field.strip() for field in fields.split(',') if field.strip()])
+        except ValueError as e:
+            data = {"error": "Bad Request", "message": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return None, None, response
+        return fields, entity.field_projection(fields), None
+
+    def find_records(self, db, collection, query, projection={"_id": 0}, one=False, skip=0, limit=0):
+        """
+        Method to perform the MongoDB queries of the endpoints,
+        the query is timed and saved for the slow requests log.
+        if one is True returns the first record found or None,
+        else returns an iterator over the records, the first batch is already read.
+        """
+        if one:
+            with phase('mongo_query'):
+                data = db[collection].find_one(query, projection)
+        else:
+            data = prefetch(timed('mongo_query', db[collection].find(query, projection, skip=skip, limit=limit)))
+        note_query(f'{db.name}.{collection}', query,
+                   int(data is not None) if one else None)
+        return data
+
+    def es_multi_match(self, keyword, fields, es_index, skip=0, limit=0, source=None, with_index=False):
         """
-        Method to perform the elasticsearch multi_match query.
+        Method to perform the elasticsearch multi_match query,
+        es_index can be a list of indices searched in a single query (the missing ones are ignored),
+        source is the list of fields returned (all if None).
+        returns an iterator over the documents found (the first page is already read),
+        or over tuples (index, document) if with_index is True,
+        or None if the index was not found.
         """
         body = {
             "query": {
@@ -105,11 +292,315 @@ class Scienti(HunabkuPluginBase):
         }
         s = Search(using=self.es, index=es_index)
         s = s.update_from_dict(body)
-        s = s.extra(track_total_hits=True)
-        s.execute()
-        data = [hit.to_dict() for hit in s.scan()]
+        if isinstance(es_index, list):
+            s = s.params(ignore_unavailable=True)
+        if source:
+            s = s.source(source)
+        try:
+            if limit:
+                with phase('es_query'):
+                    hits = s[skip:skip + limit].execute()
+            else:
+                hits = s.scan()
+            if with_index:
+                data = prefetch(timed('es_query', ((hit.meta.index, hit.to_dict()) for hit in hits)))
+            else:
+                data = prefetch(timed('es_query', (hit.to_dict() for hit in hits)))
+        except NotFoundError:
+            if isinstance(es_index, str):
+                self.index_catalog.invalidate(es_index)
+            return None
+        note_query(es_index if isinstance(es_index, str) else ','.join(es_index), body)
         return data
 
+    def scienti_targets(self, institution, model_year):
+        """
+        Method to get the databases requested by institution and model_year, each one can be a single value,
+        a comma separated list or all (every value found in the databases),
+        returns a list of tuples (institution, model_year) sorted by year and institution
+        and error code 400 (Bad Request) if a database does not exist.
+        """
+        institutions = [value.strip() for value in institution.split(',') if value.strip()]
+        years = [value.strip() for value in model_year.split(',') if value.strip()]
+
+        if institution == 'all' or model_year == 'all':
+            with phase('catalog'):
+                names = self.db_catalog.get()
+            targets = []
+            for match in map(SCIENTI_DB.match, names):
+                if not match:
+                    continue
+                if institution != 'all' and match.group(1) not in institutions:
+                    continue
+                if model_year != 'all' and match.group(2) not in years:
+                    continue
+                targets.append(match.groups())
+            if not targets:
+                data = {
+                    "error": "Bad Request",
+                    "message": f"invalid model_year or institution, no databases found for institution {institution} and model_year {model_year}."}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+                return [], response
+            return sorted(targets, key=lambda target: (target[1], target[0])), None
+
+        targets = []
+        for year in sorted(set(years)):
+            for initials in sorted(set(institutions)):
+                response = self.check_db(f'scienti_{initials}_{year}')
+                if response is not None:
+                    return [], response
+                targets.append((initials, year))
+        return targets, None
+
+    def fanout_find(self, targets, collection, query, projection, one=False, limit=0):
+        """
+        Method to perform the same MongoDB query in the databases of the targets concurrently,
+        returns an iterator over tuples (target, record) in the order of the targets
+        (a single record per target or none if one is True).
+        Every query reads its first batch in the pool and the rest while it is sent,
+        the records of a target are sent as soon as its query and the ones of the previous targets returned.
+        """
+        def find(target):
+            db = self.dbclient[f'scienti_{target[0]}_{target[1]}']
+            if one:
+                record = db[collection].find_one(query, projection)
+                return [record] if record is not None else []
+            return prefetch(db[collection].find(query, projection, limit=limit))
+
+        futures = [(target, self.fanout_executor.submit(find, target)) for target in targets]
+        for target in targets:
+            note_query(f'scienti_{target[0]}_{target[1]}.{collection}', query)
+
+        def records():
+            for target, future in futures:
+                for record in future.result():
+                    yield target, record
+        # the first target is read before the response starts, then its errors are returned as errors
+        return prefetch(timed('mongo_query', records()))
+
+    def tag_records(self, entity, records, dedupe=False):
+        """
+        Adds to the records (tuples (target, record)) the institution and model year they come from,
+        if dedupe is True only the first record with the same model_year, COD_RH and key of the entity is returned
+        (the researchers are in the databases of all their institutions).
+        """
+        seen = set()
+        for (institution, model_year), record in records:
+            if dedupe:
+                key = (model_year, record.get('COD_RH'), record.get(entity.id_key))
+                if key[1] is not None and key[2] is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+            record['institution'] = institution
+            record['model_year'] = model_year
+            yield record
+
+    def search_indices(self, entity, targets, all_institutions):
+        """
+        Method to get the Elastic Search indices of the targets, a pattern per year scienti_*_{year}_{collection}
+        if all the institutions are requested, returns the indices and the ones to search: the indices
+        known to be missing are removed and the patterns are replaced by the names of the catalog
+        that are valid indices of an institution and year (the pattern if the catalog is not loaded yet).
+        """
+        if all_institutions:
+            indices = sorted({f'scienti_*_{target[1]}_{entity.collection}' for target in targets})
+        else:
+            indices = [f'scienti_{target[0]}_{target[1]}_{entity.collection}' for target in targets]
+        valid = re.compile(rf'{SCIENTI_INDEX.pattern}{re.escape(entity.collection)}$')
+        es_indices = []
+        with phase('catalog'):
+            for index in indices:
+                if '*' not in index:
+                    if self.index_catalog.exists(index) is not False:
+                        es_indices.append(index)
+                    continue
+                names = self.index_catalog.matching(index)
+                if names is None:
+                    es_indices.append(index)
+                else:
+                    es_indices += [name for name in names if valid.match(name)]
+        return indices, es_indices
+
+    def index_records(self, data):
+        """
+        Converts the tuples (index, record) of a search in several indices to (target, record),
+        the records of an index that is not scienti_{institution}_{model_year}_{collection} are skipped.
+        """
+        for index, record in data:
+            match = SCIENTI_INDEX.match(index)
+            if match is None:
+                self.logger.warning(f'Scienti: skipped the records of the index {index}, invalid name')
+                continue
+            yield match.groups(), record
+
+    def entity_fanout(self, entity, targets, req_args, fields, projection, skip, limit):
+        """
+        Handler of the requests for several institutions or model years, the databases are queried concurrently
+        (the text search is a single query over all the indices) and the records are merged in the order of
+        the years and institutions, tagged with their institution and model_year.
+        The records found in several institutions are returned once.
+        """
+        institutions = {target[0] for target in targets}
+        dedupe = len(institutions) > 1
+        if dedupe and fields is not None:
+            # the keys are required to find the repeated records
+            fields = entity.select(fields + ['COD_RH', entity.id_key])
+            projection = entity.field_projection(fields)
+
+        cod_rh = req_args.get('COD_RH')
+        code = req_args.get(entity.id_key)
+        end = skip + limit if limit else None
+        if cod_rh and code:
+            query = {'COD_RH': cod_rh, entity.id_key: entity.id_type(code)}
+            records = self.fanout_find(targets, entity.collection, query, projection, one=True)
+            return self.json_stream(islice(self.tag_records(entity, records, dedupe), skip, end))
+
+        for param, field in entity.filters.items():
+            value = req_args.get(param)
+            if not value:
+                continue
+            if param == SEARCH:
+                indices, es_indices = self.search_indices(entity, targets, req_args.get('institution') == 'all')
+                if not es_indices:
+                    return self.es_index_error(','.join(indices))
+                data = self.es_multi_match(value, entity.es_fields, es_indices, 0 if dedupe else skip,
+                                           0 if dedupe else limit, fields, with_index=True)
+                if data is None:
+                    return self.es_index_error(','.join(es_indices))
+                records = self.tag_records(entity, self.index_records(data), dedupe)
+                return self.json_stream(islice(records, skip, end) if dedupe else records)
+            # a target never sends more than end records of the page, even after removing the repeated ones
+            records = self.fanout_find(targets, entity.collection, {field: value}, projection, limit=end or 0)
+            return self.json_stream(islice(self.tag_records(entity, records, dedupe), skip, end))
+        return None
+
+    def json_stream(self, items):
+        """
+        returns the items as a JSON array, serialized while they are sent.
+        An error after the status was sent is raised, the array is not closed
+        and the client gets an invalid body instead of a truncated list.
+        """
+        response = self.app.response_class(
+            response=json_array(items, self.json.dumps),
+            status=200,
+            mimetype='application/json'
+        )
+        return response
+
+    def entity_request(self, entity):
+        """
+        Generic handler of the entities declared in hunabku_scienti.entities.
+        The entity is looked up by COD_RH and its key, or by the first filter passed,
+        the lists are streamed and can be paginated with page and max_results.
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+
+        req_args = self.request.args
+        response = self.check_required_parameters(req_args)
+        if response is not None:
+            return response
+        response = self.check_parameters(entity.params, req_args.keys())
+        if response is not None:
+            return response
+        skip, limit, response = self.check_pagination(req_args)
+        if response is not None:
+            return response
+        fields, projection, response = self.check_fields(entity, req_args)
+        if response is not None:
+            return response
+
+        model_year = req_args.get('model_year')
+        institution = req_args.get('institution')
+        db_name = f'scienti_{institution}_{model_year}'
+
+        if 'all' in (institution, model_year) or ',' in institution or ',' in model_year:
+            targets, response = self.scienti_targets(institution, model_year)
+            if response is not None:
+                return response
+            try:
+                response = self.entity_fanout(entity, targets, req_args, fields, projection, skip, limit)
+            except Exception as e:
+                data = {"error": "Bad Request", "message": str(
+                    sys.exc_info()), "exception": str(e)}
+                response = self.app.response_class(
+                    response=self.json.dumps(data),
+                    status=400,
+                    mimetype='application/json'
+                )
+            if response is not None:
+                return response
+            data = {
+                "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+
+        response = self.check_db(db_name)
+        if response is not None:
+            return response
+
+        try:
+            db = self.dbclient[db_name]
+            cod_rh = req_args.get('COD_RH')
+            code = req_args.get(entity.id_key)
+            if cod_rh and code:
+                data = self.find_records(db, entity.collection,
+                                         {'COD_RH': cod_rh, entity.id_key: entity.id_type(code)},
+                                         projection, one=True)
+                with phase('serialization'):
+                    body = self.json.dumps(data)
+                response = self.app.response_class(
+                    response=body,
+                    status=200,
+                    mimetype='application/json'
+                )
+                return response
+
+            for param, field in entity.filters.items():
+                value = req_args.get(param)
+                if not value:
+                    continue
+                if param == SEARCH:
+                    es_index = f'scienti_{institution}_{model_year}_{entity.collection}'
+                    response = self.check_es_index(es_index)
+                    if response is not None:
+                        return response
+                    data = self.es_multi_match(value, entity.es_fields, es_index, skip, limit, fields)
+                    if data is None:
+                        return self.es_index_error(es_index)
+                else:
+                    data = self.find_records(db, entity.collection, {field: value},
+                                             projection, skip=skip, limit=limit)
+                return self.json_stream(data)
+
+            data = {
+                "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+
+        except Exception as e:
+            data = {"error": "Bad Request", "message": str(
+                sys.exc_info()), "exception": str(e)}
+            response = self.app.response_class(
+                response=self.json.dumps(data),
+                status=400,
+                mimetype='application/json'
+            )
+            return response
+
     @endpoint('/scienti/product', methods=['GET'])
     def scienti_product(self):
         """
@@ -117,17 +608,24 @@ class Scienti(HunabkuPluginBase):
         @apiName product
         @apiGroup Scienti
         @apiDescription Allows to perform queries for products,
-                        model_year is mandatory parameter, if model year is the only
-                        parameter passed, the endpoint returns all the dump of the database.
+                        model_year and institution are mandatory parameters together with one of the lookups below,
+                        the whole collection is available as the export scienti_product of /exports.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} COD_RH  User primary key
         @apiParam {String} COD_PRODUCTO  Product key (require COD_RH)
         @apiParam {String} SGL_CATEGORIA  Category of the product
-        @apiParam {String} model_year  Year of the scienti model, example: 2022
-        @apiParam {String} institution Institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} model_year  Year of the scienti model, example: 2022. Several years can be requested as a comma separated list
+                                       (example: 2019,2021,2022) or all, the records are returned in a list tagged with their institution and model_year.
+        @apiParam {String} institution Institution initials. supported example: udea, uec, unaula, univalle.
+                                       Several institutions can be requested as a comma separated list or all,
+                                       the records found in several institutions are returned once.
         @apiParam {String} search Allows to search text keywords in several fields of the product collection using elastic search.
         @apiParam {String} group_id  Returns products for the given group id.
+        @apiParam {Number} page  Page of the results, starting at 1 (optional, requires max_results or uses the default).
+        @apiParam {Number} max_results  Number of results per page (optional, without page and max_results all the results are returned).
+        @apiParam {String} fields  Comma separated list of the fields returned (optional, all by default),
+                                   ex: COD_RH,COD_PRODUCTO,TXT_NME_PROD. The fields allowed are listed in the error for an invalid field.
 
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
@@ -146,138 +644,18 @@ class Scienti(HunabkuPluginBase):
             curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=2022&institution=udea&search="machine learning"
             # return products for the given group id
             curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=2022&institution=udea&group_id=COL0008423
+            # all the products of the user in every model year
+            curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=all&institution=udea&COD_RH=0000000639
+            # text search in all the institutions
+            curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=2022&institution=all&search="machine learning"
+            # only the codes and title of the products of a group
+            curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=2022&institution=udea&group_id=COL0008423&fields=COD_RH,COD_PRODUCTO,TXT_NME_PROD
+            # second page of 50 products of a category
+            curl -i https://apis.colav.co/scienti/product?apikey=XXXX&model_year=2022&institution=udea&SGL_CATEGORIA=ART-ART_A1&page=2&max_results=50
 
 
         """
-
-        if self.valid_apikey():
-            cod_rh = self.request.args.get('COD_RH')
-            cod_prod = self.request.args.get('COD_PRODUCTO')
-            sgl_cat = self.request.args.get('SGL_CATEGORIA')
-            model_year = self.request.args.get('model_year')
-            institution = self.request.args.get('institution')
-            keyword = self.request.args.get('search')
-            group_id = self.request.args.get('group_id')
-
-            response = self.check_required_parameters(self.request.args)
-            if response is not None:
-                return response
-            response = self.check_parameters(
-                ['apikey', 'COD_RH', 'COD_PRODUCTO', 'SGL_CATEGORIA', 'model_year', 'institution', 'search', 'group_id'], self.request.args.keys())
-            if response is not None:
-                return response
-
-            db_name = f'scienti_{institution}_{model_year}'
-
-            response = self.check_db(db_name)
-            if response is not None:
-                return response
-
-            try:
-                self.db = self.dbclient[db_name]
-                data = []
-                if cod_rh and cod_prod:
-                    data = self.db["product"].find_one(
-                        {'COD_RH': cod_rh, 'COD_PRODUCTO': cod_prod}, {"_id": 0})
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if cod_rh:
-                    data = list(self.db["product"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if sgl_cat:
-                    data = list(self.db["product"].find(
-                        {'SGL_CATEGORIA': sgl_cat}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if keyword:
-                    es_index = f'scienti_{institution}_{model_year}_product'
-
-                    # not required extra fields for search, at least for product
-                    # article, audiovisual, book, book_chapter, event, journal, journal_others, music_sheet
-                    # oriented_thesis
-                    fields = ["TXT_NME_PROD",
-                              "TXT_RESUMEN_PROD",
-                              "TXT_OBSERV_PROD",
-                              "DSC_PROJETO",
-                              # campos application_sector (es recursivo a 3 niveles)
-                              # https://github.com/colav/KayPacha/blob/main/kaypacha/models/scienti/graph_schema_product.py#L636
-                              "details.application_sector.TXT_NME_SECTOR_APLIC",
-                              "details.application_sector.application_sector.TXT_NME_SECTOR_APLIC",
-                              "details.application_sector.application_sector.application_sector.TXT_NME_SECTOR_APLIC",
-                              # community
-                              "details.community.TXT_CARACTERIZACION",
-                              # course
-                              "details.course.TXT_FINALIDAD",
-                              # keywords
-                              "details.keywords.TXT_NME_PALABRA_CLAVE",
-                              # memory chapter
-                              "details.memory_chapter.TXT_NME_PONENCIA",
-                              "details.memory_chapter.TXT_NME_EVENTO",
-                              # prod_art
-                              "details.prod_art.prod_art_detail.TXT_NME_EVENTO",
-                              "details.prod_art.prod_art_detail.knowledge_area.TXT_NME_AREA_FULL",
-                              # technical
-                              "details.technical.TXT_NME_COMERCIAL",
-                              "details.technical.TXT_FINALIDAD"]
-
-                    # get the start time
-                    st = time.time()
-                    data = self.es_multi_match(keyword, fields, es_index)
-                    # get the end time
-                    et = time.time()
-                    # get the execution time
-                    elapsed_time = et - st
-                    print(f'Search for "{keyword}" in {es_index} Execution time:',
-                          elapsed_time, 'seconds')
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if group_id:
-                    data = list(self.db["product"].find(
-                        {'group.COD_ID_GRUPO': group_id}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-
-                data = {
-                    "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters."}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-            except Exception as e:
-                data = {"error": "Bad Request", "message": str(
-                    sys.exc_info()), "execption": str(e)}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-        else:
-            return self.apikey_error()
+        return self.entity_request(ENTITIES['product'])
 
     @endpoint('/scienti/network', methods=['GET'])
     def scienti_network(self):
@@ -286,17 +664,24 @@ class Scienti(HunabkuPluginBase):
         @apiName network
         @apiGroup Scienti
         @apiDescription Allows to perform queries for networks,
-                        model_year is mandatory parameter, if model year is the only
-                        parameter passed, the endpoint returns all the dump of the database.
+                        model_year and institution are mandatory parameters together with one of the lookups below,
+                        the whole collection is available as the export scienti_network of /exports.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} COD_RH  User primary key
         @apiParam {String} COD_RED  network key (require COD_RH)
         @apiParam {String} SGL_CATEGORIA  category of the network
-        @apiParam {String} model_year  year of the scienti model, example: 2022
-        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} model_year  year of the scienti model, example: 2022. Several years can be requested as a comma separated list
+                                       (example: 2019,2021,2022) or all, the records are returned in a list tagged with their institution and model_year.
+        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle.
+                                       Several institutions can be requested as a comma separated list or all,
+                                       the records found in several institutions are returned once.
         @apiParam {String} search Allows to search text keywords in several fields of the network collection using elastic search.
         @apiParam {String} group_id  Returns networks for the given group id.
+        @apiParam {Number} page  Page of the results, starting at 1 (optional, requires max_results or uses the default).
+        @apiParam {Number} max_results  Number of results per page (optional, without page and max_results all the results are returned).
+        @apiParam {String} fields  Comma separated list of the fields returned (optional, all by default),
+                                   ex: COD_RH,COD_RED,TXT_NME_RED. The fields allowed are listed in the error for an invalid field.
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
 
@@ -316,134 +701,7 @@ class Scienti(HunabkuPluginBase):
             curl -i https://apis.colav.co/scienti/network?apikey=XXXX&model_year=2022&institution=udea&group_id=COL0053803
 
         """
-
-        if self.valid_apikey():
-            cod_rh = self.request.args.get('COD_RH')
-            cod_red = self.request.args.get('COD_RED')
-            sgl_cat = self.request.args.get('SGL_CATEGORIA')
-            model_year = self.request.args.get('model_year')
-            institution = self.request.args.get('institution')
-            keyword = self.request.args.get('search')
-            group_id = self.request.args.get('group_id')
-
-            response = self.check_required_parameters(self.request.args)
-            if response is not None:
-                return response
-            response = self.check_parameters(
-                ['apikey', 'COD_RH', 'COD_RED', 'SGL_CATEGORIA', 'model_year', 'institution', 'search', 'group_id'], self.request.args.keys())
-            if response is not None:
-                return response
-
-            db_name = f'scienti_{institution}_{model_year}'
-
-            response = self.check_db(db_name)
-            if response is not None:
-                return response
-
-            try:
-                self.db = self.dbclient[db_name]
-                data = []
-                if cod_rh and cod_red:
-                    cod_red = int(cod_red)
-                    data = self.db["network"].find_one(
-                        {'COD_RH': cod_rh, 'COD_RED': cod_red}, {"_id": 0})
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if cod_rh:
-                    data = list(self.db["network"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if sgl_cat:
-                    data = list(self.db["network"].find(
-                        {'SGL_CATEGORIA': sgl_cat}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if keyword:
-                    es_index = f'scienti_{institution}_{model_year}_network'
-
-                    fields = ["TXT_NME_RED",
-                              "details.community.TXT_NME_COMUNIDAD",
-                              "details.community.TXT_CARACTERIZACION",
-                              "details.community.product.TXT_NME_PROD",
-                              "details.community.product.TXT_RESUMEN_PROD",
-                              "details.community.product.TXT_OBSERV_PROD",
-                              "details.community.product.DSC_PROJETO",
-                              "details.community.project.TXT_NME_PROYECTO",
-                              "details.community.project.TXT_OBSERV_PROYECTO",
-                              "details.community.project.TXT_RESUMEN_PROYECTO",
-                              "group.NME_GRUPO",
-                              "group.TXT_PLAN_TRABAJO",
-                              "group.TXT_ESTADO_ARTE",
-                              "group.TXT_OBJETIVOS",
-                              "group.TXT_PROD_DESTACADA",
-                              "group.TXT_RETOS",
-                              "group.TXT_VISION",
-                              "group.knowledge_area.TXT_NME_AREA",  # recursive level 0
-                              "group.knowledge_area.TXT_NME_AREA_FULL"
-                              "group.knowledge_area.knowledge_area.TXT_NME_AREA",  # level 1
-                              "group.knowledge_area.knowledge_area.TXT_NME_AREA_FULL"
-                              "group.knowledge_area.knowledge_area.knowledge_area.TXT_NME_AREA",  # level 3
-                              "group.knowledge_area.knowledge_area.knowledge_area.TXT_NME_AREA_FULL"
-                              ]
-
-                    # get the start time
-                    st = time.time()
-                    data = self.es_multi_match(keyword, fields, es_index)
-                    # get the end time
-                    et = time.time()
-                    # get the execution time
-                    elapsed_time = et - st
-                    print(f'Search for "{keyword}" Execution time:',
-                          elapsed_time, 'seconds')
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if group_id:
-                    data = list(self.db["network"].find(
-                        {'group.COD_ID_GRUPO': group_id}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-
-                data = {
-                    "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-
-            except Exception as e:
-                data = {"error": "Bad Request", "message": str(
-                    sys.exc_info()), "execption": str(e)}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-        else:
-            return self.apikey_error()
+        return self.entity_request(ENTITIES['network'])
 
     @endpoint('/scienti/project', methods=['GET'])
     def scienti_project(self):
@@ -452,17 +710,24 @@ class Scienti(HunabkuPluginBase):
         @apiName project
         @apiGroup Scienti
         @apiDescription Allows to perform queries for projects,
-                        model_year is mandatory parameter, if model year is the only
-                        parameter passed, the endpoint returns all the dump of the database.
+                        model_year and institution are mandatory parameters together with one of the lookups below,
+                        the whole collection is available as the export scienti_project of /exports.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} COD_RH  User primary key
         @apiParam {String} COD_PROYECTO  project key (require COD_RH)
         @apiParam {String} SGL_CATEGORIA  category of the network
-        @apiParam {String} model_year  year of the scienti model, example: 2022
-        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} model_year  year of the scienti model, example: 2022. Several years can be requested as a comma separated list
+                                       (example: 2019,2021,2022) or all, the records are returned in a list tagged with their institution and model_year.
+        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle.
+                                       Several institutions can be requested as a comma separated list or all,
+                                       the records found in several institutions are returned once.
         @apiParam {String} search Allows to search text keywords in several fields of the project collection using elastic search.
         @apiParam {String} group_id  Returns projects for the given group id.
+        @apiParam {Number} page  Page of the results, starting at 1 (optional, requires max_results or uses the default).
+        @apiParam {Number} max_results  Number of results per page (optional, without page and max_results all the results are returned).
+        @apiParam {String} fields  Comma separated list of the fields returned (optional, all by default),
+                                   ex: COD_RH,COD_PROYECTO,TXT_NME_PROYECTO. The fields allowed are listed in the error for an invalid field.
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
 
@@ -482,119 +747,7 @@ class Scienti(HunabkuPluginBase):
             curl -i https://apis.colav.co/scienti/project?apikey=XXXX&model_year=2022&institution=udea&group_id=COL0008423
 
         """
-
-        if self.valid_apikey():
-            cod_rh = self.request.args.get('COD_RH')
-            cod_projecto = self.request.args.get('COD_PROYECTO')
-            sgl_cat = self.request.args.get('SGL_CATEGORIA')
-            model_year = self.request.args.get('model_year')
-            institution = self.request.args.get('institution')
-            keyword = self.request.args.get('search')
-            group_id = self.request.args.get('group_id')
-
-            response = self.check_required_parameters(self.request.args)
-            if response is not None:
-                return response
-            response = self.check_parameters(
-                ['apikey', 'COD_RH', 'COD_PROYECTO', 'SGL_CATEGORIA', 'model_year', 'institution', 'search', 'group_id'], self.request.args.keys())
-            if response is not None:
-                return response
-
-            db_name = f'scienti_{institution}_{model_year}'
-
-            response = self.check_db(db_name)
-            if response is not None:
-                return response
-
-            try:
-                self.db = self.dbclient[db_name]
-                data = []
-                if cod_rh and cod_projecto:
-                    data = self.db["project"].find_one(
-                        {'COD_RH': cod_rh, 'COD_PROYECTO': cod_projecto}, {"_id": 0})
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if cod_rh:
-                    data = list(self.db["project"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if sgl_cat:
-                    data = list(self.db["project"].find(
-                        {'SGL_CATEGORIA': sgl_cat}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if keyword:
-                    es_index = f'scienti_{institution}_{model_year}_project'
-
-                    # only required fields for search are product and community, at least for project.
-                    fields = ["TXT_NME_PROYECTO",
-                              "TXT_OBSERV_PROYECTO",
-                              "TXT_RESUMEN_PROYECTO",
-                              "details.product.TXT_NME_PROD",
-                              "details.product.TXT_RESUMEN_PROD",
-                              "details.product.TXT_OBSERV_PROD",
-                              "details.product.DSC_PROJETO",
-                              "details.community.TXT_NME_COMUNIDAD",
-                              "details.community.TXT_CARACTERIZACION"]
-                    # get the start time
-                    st = time.time()
-                    data = self.es_multi_match(keyword, fields, es_index)
-                    # get the end time
-                    et = time.time()
-                    # get the execution time
-                    elapsed_time = et - st
-                    print(f'Search for "{keyword}" Execution time:',
-                          elapsed_time, 'seconds')
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-
-                if group_id:
-                    data = list(self.db["project"].find(
-                        {'group.COD_ID_GRUPO': group_id}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-
-                data = {
-                    "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-
-            except Exception as e:
-                data = {"error": "Bad Request", "message": str(
-                    sys.exc_info()), "exception": str(e)}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-        else:
-            return self.apikey_error()
+        return self.entity_request(ENTITIES['project'])
 
     @endpoint('/scienti/event', methods=['GET'])
     def scienti_event(self):
@@ -603,17 +756,24 @@ class Scienti(HunabkuPluginBase):
         @apiName event
         @apiGroup Scienti
         @apiDescription Allows to perform queries for events,
-                        model_year is mandatory parameter, if model year is the only
-                        parameter passed, the endpoint returns all the dump of the database.
+                        model_year and institution are mandatory parameters together with one of the lookups below,
+                        the whole collection is available as the export scienti_event of /exports.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} COD_RH  User primary key
         @apiParam {String} COD_EVENTO  event key (require COD_RH)
         @apiParam {String} SGL_CATEGORIA  category of the network
-        @apiParam {String} model_year  year of the scienti model, example: 2022
-        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} model_year  year of the scienti model, example: 2022. Several years can be requested as a comma separated list
+                                       (example: 2019,2021,2022) or all, the records are returned in a list tagged with their institution and model_year.
+        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle.
+                                       Several institutions can be requested as a comma separated list or all,
+                                       the records found in several institutions are returned once.
         @apiParam {String} search Allows to search text keywords in several fields of the event collection using elastic search.
         @apiParam {String} group_id  Returns events for the given group id.
+        @apiParam {Number} page  Page of the results, starting at 1 (optional, requires max_results or uses the default).
+        @apiParam {Number} max_results  Number of results per page (optional, without page and max_results all the results are returned).
+        @apiParam {String} fields  Comma separated list of the fields returned (optional, all by default),
+                                   ex: COD_RH,COD_EVENTO,TXT_NME_EVENTO. The fields allowed are listed in the error for an invalid field.
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
 
@@ -633,120 +793,7 @@ class Scienti(HunabkuPluginBase):
             curl -i https://apis.colav.co/scienti/event?apikey=XXXX&model_year=2022&institution=udea&group_id=COL0008423
 
         """
-        if self.valid_apikey():
-            cod_rh = self.request.args.get('COD_RH')
-            cod_evento = self.request.args.get('COD_EVENTO')
-            sgl_cat = self.request.args.get('SGL_CATEGORIA')
-            model_year = self.request.args.get('model_year')
-            institution = self.request.args.get('institution')
-            keyword = self.request.args.get('search')
-            group_id = self.request.args.get('group_id')
-
-            response = self.check_required_parameters(self.request.args)
-            if response is not None:
-                return response
-            response = self.check_parameters(
-                ['apikey', 'COD_RH', 'COD_PROYECTO', 'COD_EVENTO', 'model_year', 'institution', 'search', 'group_id'], self.request.args.keys())
-            if response is not None:
-                return response
-
-            db_name = f'scienti_{institution}_{model_year}'
-
-            response = self.check_db(db_name)
-            if response is not None:
-                return response
-
-            try:
-                self.db = self.dbclient[db_name]
-                data = []
-                if cod_rh and cod_evento:
-                    data = self.db["event"].find_one(
-                        {'COD_RH': cod_rh, 'COD_EVENTO': int(cod_evento)}, {"_id": 0})
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if cod_rh:
-                    data = list(self.db["event"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if sgl_cat:
-                    data = list(self.db["event"].find(
-                        {'SGL_CATEGORIA': sgl_cat}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if keyword:
-                    es_index = f'scienti_{institution}_{model_year}_event'
-
-                    fields = ["TXT_NME_EVENTO",
-                              "TXT_RESUMEN_EVENTO",
-                              "TXT_ACTIVIDADES",
-                              "project.TXT_NME_PROYECTO",
-                              "project.TXT_RESUMEN_PROYECTO",
-                              "details.product.TXT_NME_PROD",
-                              "details.product.TXT_RESUMEN_PROD",
-                              "details.product.TXT_OBSERV_PROD",
-                              "details.product.DSC_PROJETO",
-                              "details.keywords.TXT_NME_PALABRA_CLAVE",
-                              "details.application_sector.TXT_NME_SECTOR_APLIC",  # recursive 2 times
-                              "details.application_sector.application_sector.TXT_NME_SECTOR_APLIC",
-                              ]
-                    # get the start time
-                    st = time.time()
-                    data = self.es_multi_match(keyword, fields, es_index)
-                    # get the end time
-                    et = time.time()
-                    # get the execution time
-                    elapsed_time = et - st
-                    print(f'Search for "{keyword}" Execution time:',
-                          elapsed_time, 'seconds')
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if group_id:
-                    data = list(self.db["event"].find(
-                        {'group.COD_ID_GRUPO': group_id}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-
-                data = {
-                    "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-
-            except Exception as e:
-                data = {"error": "Bad Request", "message": str(
-                    sys.exc_info()), "exception": str(e)}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-        else:
-            return self.apikey_error()
+        return self.entity_request(ENTITIES['event'])
 
     @endpoint('/scienti/patent', methods=['GET'])
     def scienti_patent(self):
@@ -755,16 +802,23 @@ class Scienti(HunabkuPluginBase):
         @apiName patent
         @apiGroup Scienti
         @apiDescription Allows to perform queries for patents,
-                        model_year is mandatory parameter, if model year is the only
-                        parameter passed, the endpoint returns all the dump of the database.
+                        model_year and institution are mandatory parameters together with one of the lookups below,
+                        the whole collection is available as the export scienti_patent of /exports.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} COD_RH  User primary key
         @apiParam {String} COD_PATENTE  patent key (require COD_RH)
         @apiParam {String} SGL_CATEGORIA  category of the network
-        @apiParam {String} model_year  year of the scienti model, example: 2022
-        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle
+        @apiParam {String} model_year  year of the scienti model, example: 2022. Several years can be requested as a comma separated list
+                                       (example: 2019,2021,2022) or all, the records are returned in a list tagged with their institution and model_year.
+        @apiParam {String} institution institution initials. supported example: udea, uec, unaula, univalle.
+                                       Several institutions can be requested as a comma separated list or all,
+                                       the records found in several institutions are returned once.
         @apiParam {String} search Allows to search text keywords in several fields of the patent collection using elastic search.
+        @apiParam {Number} page  Page of the results, starting at 1 (optional, requires max_results or uses the default).
+        @apiParam {Number} max_results  Number of results per page (optional, without page and max_results all the results are returned).
+        @apiParam {String} fields  Comma separated list of the fields returned (optional, all by default),
+                                   ex: COD_RH,COD_PATENTE,TXT_NME_PATENTE. The fields allowed are listed in the error for an invalid field.
 
         @apiSuccess {Object}  Resgisters from MongoDB in Json format.
 
@@ -781,103 +835,7 @@ class Scienti(HunabkuPluginBase):
             # Text search for a keyword using elastic search
             curl -i https://apis.colav.co/scienti/patent?apikey=XXXX&model_year=2022&institution=udea&search="process"
         """
-        if self.valid_apikey():
-            cod_rh = self.request.args.get('COD_RH')
-            cod_patente = self.request.args.get('COD_PATENTE')
-            sgl_cat = self.request.args.get('SGL_CATEGORIA')
-            model_year = self.request.args.get('model_year')
-            institution = self.request.args.get('institution')
-            keyword = self.request.args.get('search')
-
-            response = self.check_required_parameters(self.request.args)
-            if response is not None:
-                return response
-            response = self.check_parameters(
-                ['apikey', 'COD_RH', 'COD_PATENTE', 'model_year', 'institution', 'search'], self.request.args.keys())
-            if response is not None:
-                return response
-
-            db_name = f'scienti_{institution}_{model_year}'
-
-            response = self.check_db(db_name)
-            if response is not None:
-                return response
-
-            try:
-                self.db = self.dbclient[db_name]
-                data = []
-                if cod_rh and cod_patente:
-                    data = self.db["patent"].find_one(
-                        {'COD_RH': cod_rh, 'COD_PATENTE': int(cod_patente)}, {"_id": 0})
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if cod_rh:
-                    data = list(self.db["patent"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if sgl_cat:
-                    data = list(self.db["patent"].find(
-                        {'SGL_CATEGORIA': sgl_cat}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                if keyword:
-                    es_index = f'scienti_{institution}_{model_year}_patent'
-
-                    # only required field for search is technical, at least for patent.
-                    fields = ["TXT_NME_PATENTE",
-                              "details.technical.product.TXT_NME_PROD",
-                              "details.technical.product.TXT_RESUMEN_PROD",
-                              "details.technical.product.TXT_OBSERV_PROD",
-                              "details.technical.product.DSC_PROJETO"
-                              ]
-                    # get the start time
-                    st = time.time()
-                    data = self.es_multi_match(keyword, fields, es_index)
-                    # get the end time
-                    et = time.time()
-                    # get the execution time
-                    elapsed_time = et - st
-                    print(f'Search for "{keyword}" Execution time:',
-                          elapsed_time, 'seconds')
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
-                data = {
-                    "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-
-            except Exception as e:
-                data = {"error": "Bad Request", "message": str(
-                    sys.exc_info()), "exception": str(e)}
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=400,
-                    mimetype='application/json'
-                )
-                return response
-        else:
-            return self.apikey_error()
+        return self.entity_request(ENTITIES['patent'])
 
     @endpoint('/scienti/author', methods=['GET'])
     def scienti_author(self):
@@ -924,14 +882,8 @@ class Scienti(HunabkuPluginBase):
                 db = self.dbclient[db_name]
                 data = []
                 if cod_rh:
-                    data = list(db["author"].find(
-                        {'COD_RH': cod_rh}, {"_id": 0}))
-                    response = self.app.response_class(
-                        response=self.json.dumps(data),
-                        status=200,
-                        mimetype='application/json'
-                    )
-                    return response
+                    data = self.find_records(db, "author", {'COD_RH': cod_rh})
+                    return self.json_stream(data)
                 data = {
                     "error": "Bad Request", "message": "invalid parameters, please select the right combination of parameters"}
                 response = self.app.response_class(
@@ -954,6 +906,7 @@ class Scienti(HunabkuPluginBase):
             return self.apikey_error()
 
     @endpoint('/scienti/info/', methods=['GET'])
+    @coalesce(apikey=True)
     def scienti_info(self):
         """
         @api {get} /scienti/info Scienti info endpoint
@@ -999,8 +952,10 @@ class Scienti(HunabkuPluginBase):
                             data.append(
                                 {"institution": values[1], 'model_year': values[2], 'entities': cols})
 
+                    with phase('serialization'):
+                        body = self.json.dumps(data)
                     response = self.app.response_class(
-                        response=self.json.dumps(data),
+                        response=body,
                         status=200,
                         mimetype='application/json'
                     )
@@ -1049,8 +1004,10 @@ class Scienti(HunabkuPluginBase):
                     data.append({"institution": institution,
                                 'model_year': model_year, 'entities': cols})
 
+                    with phase('serialization'):
+                        body = self.json.dumps(data)
                     response = self.app.response_class(
-                        response=self.json.dumps(data),
+                        response=body,
                         status=200,
                         mimetype='application/json'
                     )
@@ -0,0 +1,191 @@
+from collections import namedtuple
+
+
+class Entity(namedtuple('Entity', ['name', 'collection', 'id_key', 'id_type', 'filters', 'es_fields', 'projection'])):
+    """
+    Declaration of an entity served by /scienti/{name}.
+
+    name is the path of the endpoint, collection is the MongoDB collection (and suffix of the
+    Elastic Search index scienti_{institution}_{model_year}_{collection}).
+    id_key is the key of the entity for a researcher, it is looked up together with COD_RH
+    and converted with id_type. filters maps every parameter to the field where it is looked up,
+    in the order they are applied, only the first parameter passed is used,
+    the parameter search is the text search in es_fields. projection is applied to all the queries.
+    """
+    __slots__ = ()
+
+    @property
+    def params(self) -> list:
+        """
+        Parameters accepted by the endpoint.
+        """
+        return ['apikey', 'model_year', 'institution', 'page', 'max_results', 'fields',
+                self.id_key] + list(self.filters.keys())
+
+    @property
+    def allowed_fields(self) -> set:
+        """
+        Fields that can be requested with the parameter fields, they are the keys, the fields
+        of the filters and of the text search, and every parent of them (ex: details, details.keywords).
+        """
+        paths = ['COD_RH', self.id_key] + self.es_fields
+        paths += [field for field in self.filters.values() if field]
+        allowed = set()
+        for path in paths:
+            parts = path.split('.')
+            for i in range(1, len(parts) + 1):
+                allowed.add('.'.join(parts[:i]))
+        return allowed
+
+    def select(self, fields: list) -> list:
+        """
+        Returns the fields without the ones already included by a parent,
+        MongoDB does not allow a projection with both (path collision).
+
+        Raises:
+            ValueError: if a field is not in allowed_fields.
+        """
+        allowed = self.allowed_fields
+        invalid = [field for field in fields if field not in allowed]
+        if invalid:
+            raise ValueError(f"invalid fields {invalid} for {self.name}, valid fields are {sorted(allowed)}")
+        fields = set(fields)
+        return sorted(field for field in fields
+                      if not any(field.startswith(parent + '.') for parent in fields))
+
+    def field_projection(self, fields: list) -> dict:
+        """
+        Returns the MongoDB projection for the fields selected (the _id is never returned).
+        """
+        projection = {field: 1 for field in fields}
+        projection['_id'] = 0
+        return projection
+
+
+SEARCH = 'search'
+
+# lookups shared by all the entities, the text search goes before the group,
+# as it was in the original endpoints.
+RESEARCHER_FILTERS = {'COD_RH': 'COD_RH',
+                      'SGL_CATEGORIA': 'SGL_CATEGORIA',
+                      SEARCH: None,
+                      'group_id': 'group.COD_ID_GRUPO'}
+
+DEFAULT_PROJECTION = {'_id': 0}
+
+ENTITIES = {
+    'product': Entity(
+        name='product',
+        collection='product',
+        id_key='COD_PRODUCTO',
+        id_type=str,
+        filters=RESEARCHER_FILTERS,
+        # not required extra fields for search, at least for product
+        # article, audiovisual, book, book_chapter, event, journal, journal_others, music_sheet
+        # oriented_thesis
+        es_fields=["TXT_NME_PROD",
+                   "TXT_RESUMEN_PROD",
+                   "TXT_OBSERV_PROD",
+                   "DSC_PROJETO",
+                   # campos application_sector (es recursivo a 3 niveles)
+                   # https://github.com/colav/KayPacha/blob/main/kaypacha/models/scienti/graph_schema_product.py#L636
+                   "details.application_sector.TXT_NME_SECTOR_APLIC",
+                   "details.application_sector.application_sector.TXT_NME_SECTOR_APLIC",
+                   "details.application_sector.application_sector.application_sector.TXT_NME_SECTOR_APLIC",
+                   # community
+                   "details.community.TXT_CARACTERIZACION",
+                   # course
+                   "details.course.TXT_FINALIDAD",
+                   # keywords
+                   "details.keywords.TXT_NME_PALABRA_CLAVE",
+                   # memory chapter
+                   "details.memory_chapter.TXT_NME_PONENCIA",
+                   "details.memory_chapter.TXT_NME_EVENTO",
+                   # prod_art
+                   "details.prod_art.prod_art_detail.TXT_NME_EVENTO",
+                   "details.prod_art.prod_art_detail.knowledge_area.TXT_NME_AREA_FULL",
+                   # technical
+                   "details.technical.TXT_NME_COMERCIAL",
+                   "details.technical.TXT_FINALIDAD"],
+        projection=DEFAULT_PROJECTION),
+    'network': Entity(
+        name='network',
+        collection='network',
+        id_key='COD_RED',
+        id_type=int,
+        filters=RESEARCHER_FILTERS,
+        es_fields=["TXT_NME_RED",
+                   "details.community.TXT_NME_COMUNIDAD",
+                   "details.community.TXT_CARACTERIZACION",
+                   "details.community.product.TXT_NME_PROD",
+                   "details.community.product.TXT_RESUMEN_PROD",
+                   "details.community.product.TXT_OBSERV_PROD",
+                   "details.community.product.DSC_PROJETO",
+                   "details.community.project.TXT_NME_PROYECTO",
+                   "details.community.project.TXT_OBSERV_PROYECTO",
+                   "details.community.project.TXT_RESUMEN_PROYECTO",
+                   "group.NME_GRUPO",
+                   "group.TXT_PLAN_TRABAJO",
+                   "group.TXT_ESTADO_ARTE",
+                   "group.TXT_OBJETIVOS",
+                   "group.TXT_PROD_DESTACADA",
+                   "group.TXT_RETOS",
+                   "group.TXT_VISION",
+                   "group.knowledge_area.TXT_NME_AREA",  # recursive level 0
+                   "group.knowledge_area.TXT_NME_AREA_FULL",
+                   "group.knowledge_area.knowledge_area.TXT_NME_AREA",  # level 1
+                   "group.knowledge_area.knowledge_area.TXT_NME_AREA_FULL",
+                   "group.knowledge_area.knowledge_area.knowledge_area.TXT_NME_AREA",  # level 3
+                   "group.knowledge_area.knowledge_area.knowledge_area.TXT_NME_AREA_FULL"],
+        projection=DEFAULT_PROJECTION),
+    'project': Entity(
+        name='project',
+        collection='project',
+        id_key='COD_PROYECTO',
+        id_type=str,
+        filters=RESEARCHER_FILTERS,
+        # only required fields for search are product and community, at least for project.
+        es_fields=["TXT_NME_PROYECTO",
+                   "TXT_OBSERV_PROYECTO",
+                   "TXT_RESUMEN_PROYECTO",
+                   "details.product.TXT_NME_PROD",
+                   "details.product.TXT_RESUMEN_PROD",
+                   "details.product.TXT_OBSERV_PROD",
+                   "details.product.DSC_PROJETO",
+                   "details.community.TXT_NME_COMUNIDAD",
+                   "details.community.TXT_CARACTERIZACION"],
+        projection=DEFAULT_PROJECTION),
+    'event': Entity(
+        name='event',
+        collection='event',
+        id_key='COD_EVENTO',
+        id_type=int,
+        filters=RESEARCHER_FILTERS,
+        es_fields=["TXT_NME_EVENTO",
+                   "TXT_RESUMEN_EVENTO",
+                   "TXT_ACTIVIDADES",
+                   "project.TXT_NME_PROYECTO",
+                   "project.TXT_RESUMEN_PROYECTO",
+                   "details.product.TXT_NME_PROD",
+                   "details.product.TXT_RESUMEN_PROD",
+                   "details.product.TXT_OBSERV_PROD",
+                   "details.product.DSC_PROJETO",
+                   "details.keywords.TXT_NME_PALABRA_CLAVE",
+                   "details.application_sector.TXT_NME_SECTOR_APLIC",  # recursive 2 times
+                   "details.application_sector.application_sector.TXT_NME_SECTOR_APLIC"],
+        projection=DEFAULT_PROJECTION),
+    'patent': Entity(
+        name='patent',
+        collection='patent',
+        id_key='COD_PATENTE',
+        id_type=int,
+        # patents are not related to groups
+        filters={key: field for key, field in RESEARCHER_FILTERS.items() if key != 'group_id'},
+        # only required field for search is technical, at least for patent.
+        es_fields=["TXT_NME_PATENTE",
+                   "details.technical.product.TXT_NME_PROD",
+                   "details.technical.product.TXT_RESUMEN_PROD",
+                   "details.technical.product.TXT_OBSERV_PROD",
+                   "details.technical.product.DSC_PROJETO"],
+        projection=DEFAULT_PROJECTION),
+}
@@ -1,9 +1,22 @@
 from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from pymongo import MongoClient
-from elasticsearch import Elasticsearch, __version__ as es_version
+from elasticsearch import NotFoundError
 from elasticsearch_dsl import Search
-import time
+from hunabku_common.auth import check_apikey
+from hunabku_common.elastic import IndexCatalog, get_client
+from hunabku_common.exports import register_export
+from hunabku_common.limits import set_cost
+from hunabku_common.singleflight import coalesce
+from hunabku_common.timing import phase, note_query
+from hunabku_siiu.indexes import ensure_indexes, missing_indexes, query_plans
+from threading import Thread
+
+
+# parameters of /siiu/project matched exactly, and their field in the project collection
+PROJECT_EXACT_FIELDS = {'CODIGO': 'CODIGO',
+                        'group_code': 'project_participant.group.CODIGO_COLCIENCIAS',
+                        'participant_id': 'project_participant.PERSONA_NATURAL'}
 
 
 class SIIU(HunabkuPluginBase):
@@ -20,29 +33,143 @@ class SIIU(HunabkuPluginBase):
                     doc="Elastic Search password")
     config += Param(es_project_index="siiu_project",
                     doc="Elastic Search siiu project index name")
+    config += Param(es_catalog_ttl=60,
+                    doc="Seconds to cache the list of Elastic Search indices before refreshing it in background")
+    config += Param(es_maxsize=25,
+                    doc="Elastic Search connections kept open per node, shared by the plugins with the same es_uri")
+    config += Param(es_http_compress=True,
+                    doc="Compress the Elastic Search requests with gzip")
+    config += Param(es_request_timeout=30,
+                    doc="Seconds to wait for an Elastic Search response")
+    config += Param(es_max_retries=3,
+                    doc="Retries of an Elastic Search request on connection errors")
+    config += Param(es_retry_on_timeout=True,
+                    doc="Retry the Elastic Search requests that timed out")
+    config += Param(es_backoff_factor=1.0,
+                    doc="Seconds to skip an Elastic Search node after a failure, doubled on consecutive failures")
+    config += Param(mdb_create_indexes=True,
+                    doc="Create at startup the MongoDB indexes used by /siiu/project")
 
     def __init__(self, hunabku):
         super().__init__(hunabku)
         self.dbclient = MongoClient(self.config.mdb_uri)
-        auth = (self.config.es_user, self.config.es_pass)
-        if es_version[0] < 8:
-            self.es = Elasticsearch(self.config.es_uri, http_auth=auth)
-        else:
-            self.es = Elasticsearch(self.config.es_uri, basic_auth=auth)
+        self.es = get_client(self.config.es_uri, self.config.es_user, self.config.es_pass,
+                             maxsize=self.config.es_maxsize,
+                             http_compress=self.config.es_http_compress,
+                             request_timeout=self.config.es_request_timeout,
+                             max_retries=self.config.es_max_retries,
+                             retry_on_timeout=self.config.es_retry_on_timeout,
+                             backoff_factor=self.config.es_backoff_factor)
+        self.index_catalog = IndexCatalog(self.es, self.config.es_catalog_ttl)
+        # field of the project index filtered by every exact parameter, loaded from its mapping
+        self.term_fields = None
+        # cost for the rate limits, the info aggregates all the projects
+        set_cost('/siiu/info', 5)
+        register_export('siiu_project', [], self.export_projects, self.export_version)
+        # checked in background, the plugin must load even if MongoDB is down.
+        Thread(target=self.check_indexes, daemon=True).start()
+
+    def valid_apikey(self):
+        """
+        Accepts the hunabku apikey and the keys of the clients (hunabku_common.auth).
+        """
+        return check_apikey()
+
+    def export_projects(self, params):
+        """
+        All the projects for the export siiu_project of hunabku_common.exports.
+        """
+        return self.dbclient[self.config.mdb_name]["project"].find({}, {'_id': 0})
+
+    def export_version(self, params):
+        """
+        The export changes when projects are added, removed or updated,
+        the number of projects and the size of their data from collStats.
+        """
+        stats = self.dbclient[self.config.mdb_name].command('collStats', 'project')
+        return [stats['count'], stats['size']]
+
+    def check_indexes(self):
+        """
+        Creates the indexes of the project collection (if enabled) and
+        reports the query shapes of /siiu/project that are not indexed.
+        """
+        collection = self.dbclient[self.config.mdb_name]["project"]
+        try:
+            if self.config.mdb_create_indexes:
+                ensure_indexes(collection)
+            for field in missing_indexes(collection):
+                self.logger.warning(f'SIIU: field {field} of the project collection is not indexed')
+            for name, plan in query_plans(collection).items():
+                if not plan['indexed']:
+                    self.logger.warning(f'SIIU: query by {name} scans the whole project collection')
+        except Exception as e:
+            self.logger.warning(f'SIIU: can not check the indexes: {e}')
+
+    def load_term_fields(self):
+        """
+        Returns the field of the project index to filter every exact key, the keyword subfield
+        (not analyzed) of the text fields of the dynamic mapping, or the field itself if it has
+        no keyword subfield (ex: mapped as keyword or number). Cached until the index is not found.
+        """
+        if self.term_fields is None:
+            fields = list(PROJECT_EXACT_FIELDS.values())
+            data = self.es.indices.get_field_mapping(index=self.config.es_project_index,
+                                                     fields=fields + [f'{field}.keyword' for field in fields])
+            names = set()
+            for index, mapping in data.items():
+                names.update(mapping.get('mappings', {}).keys())
+            self.term_fields = {field: f'{field}.keyword' if f'{field}.keyword' in names else field
+                                for field in fields}
+        return self.term_fields
+
+    def project_es_query(self, keyword, group_name, participant_name, exact, term_fields=None):
+        """
+        Builds a single Elastic Search bool query with all the filters of /siiu/project,
+        the text filters are scored clauses and the exact keys are term filters
+        on the fields of term_fields (see load_term_fields), the field itself if not given.
+        """
+        term_fields = term_fields or {}
+        must = []
+        if keyword:
+            must.append({"bool": {
+                "should": [
+                    {"match": {"NOMBRE_CORTO": keyword}},
+                    {"match": {"NOMBRE_COMPLETO": keyword}},
+                    {"match": {"PALABRAS_CLAVES": keyword}},
+                    {"match": {"descriptive_text.TEXTO_INGRESADO": keyword}}
+                ]
+            }})
+        if group_name:
+            must.append({"match_phrase": {
+                "project_participant.group.NOMBRE_COMPLETO": group_name}})
+        if participant_name:
+            must.append({"match_phrase": {
+                "project_participant.NOMBRE_COMPLETO": participant_name}})
+        filters = [{"term": {term_fields.get(field, field): value}}
+                   for field, value in exact.items()]
+        return {"query": {"bool": {"must": must, "filter": filters}}}
+
+    def index_error(self):
+        """
+        returns error 500, the project index does not exists in Elastic Search.
+        """
+        response = self.app.response_class(
+            response=self.json.dumps(
+                {"msg": f"Internal error, index {self.config.es_project_index} not found in Elastic Search"}),
+            status=500,
+            mimetype='application/json'
+        )
+        return response
 
     def check_index(self):
         """
-        Check if the index exists in Elastic Search
+        Check in the cached index catalog if the index is known to be missing in Elastic Search
         returns error 500 if the index does not exists.
+        The catalog is refreshed in background, a 404 in the search invalidates it.
         """
-        if not self.es.indices.exists(index=self.config.es_project_index):
-            response = self.app.response_class(
-                response=self.json.dumps(
-                    {"msg": f"Internal error, index {self.config.es_project_index} not found in Elastic Search"}),
-                status=500,
-                mimetype='application/json'
-            )
-            return response
+        if self.index_catalog.exists(self.config.es_project_index) is False:
+            return self.index_error()
         return None
 
     @endpoint('/siiu/project', methods=['GET'])
@@ -56,6 +183,8 @@ class SIIU(HunabkuPluginBase):
                         The search by keyword perform a search in teh fields of text
                         NOMBRE_CORTO, NOMBRE_COMPLETO, PALABRAS_CLAVES, descriptive_text.TEXTO_INGRESADO
                         lots of text where indexed for this search.
+                        The parameters can be combined, the projects returned match all of them,
+                        if only CODIGO, group_code and participant_id are passed the query is done in MongoDB.
 
         @apiParam {String} apikey  Credential for authentication
         @apiParam {String} search  keyword for text search.
@@ -83,148 +212,64 @@ class SIIU(HunabkuPluginBase):
             curl -i https://apis.colav.co/siiu/project?apikey=XXXX&participant_name="Diego Alejandro Restrepo Quintero"
             # An projects given a participant id
             curl -i https://apis.colav.co/siiu/project?apikey=XXXX&participant_id="xxxx"
+            # Projects of a participant in a given group about a keyword
+            curl -i https://apis.colav.co/siiu/project?apikey=XXXX&group_code=COL0008423&participant_name="Diego Alejandro Restrepo Quintero"&search=keyword
 
         """
         if self.valid_apikey():
 
-            keyword = self.request.args.get('search')
-            codigo = self.request.args.get('CODIGO')
-            grp_codigo = self.request.args.get('group_code')
-            group_name = self.request.args.get('group_name')
-            participant_name = self.request.args.get('participant_name')
-            participant_id = self.request.args.get('participant_id')
+            with phase('validation'):
+                keyword = self.request.args.get('search')
+                group_name = self.request.args.get('group_name')
+                participant_name = self.request.args.get('participant_name')
+                exact = {}
+                for param, field in PROJECT_EXACT_FIELDS.items():
+                    value = self.request.args.get(param)
+                    if value:
+                        exact[field] = value
 
-            if keyword:
-                check = self.check_index()
+            if keyword or group_name or participant_name:
+                with phase('catalog'):
+                    check = self.check_index()
                 if check is not None:
                     return check
 
-                body = {"query": {
-                    "bool": {
-                        "should": [
-                            {"match": {"NOMBRE_CORTO": keyword}},
-                            {"match": {"NOMBRE_COMPLETO": keyword}},
-                            {"match": {"PALABRAS_CLAVES": keyword}},
-                            {"match": {"descriptive_text.TEXTO_INGRESADO": keyword}}
-                        ]
-                    }
-                }
-                }
-                # get the start time
-                st = time.time()
-                s = Search(using=self.es, index=self.config.es_project_index)
-                s = s.update_from_dict(body)
-                s = s.extra(track_total_hits=True)
-                s.execute()
-                data = [hit.to_dict() for hit in s.scan()]
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=200,
-                    mimetype='application/json'
-                )
-                # get the end time
-                et = time.time()
-                # get the execution time
-                elapsed_time = et - st
-                print(f'Search for "{keyword}" Execution time:',
-                      elapsed_time, 'seconds')
-                return response
-            if codigo:
-                data = list(self.dbclient[self.config.mdb_name]
-                            ["project"].find({'CODIGO': codigo}, {'_id': 0, }))
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=200,
-                    mimetype='application/json'
-                )
-                return response
-            if grp_codigo:
-                data = list(self.dbclient[self.config.mdb_name]
-                            ["project"].find({"project_participant.group.CODIGO_COLCIENCIAS": grp_codigo}, {"_id": 0}))
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=200,
-                    mimetype='application/json'
-                )
-                return response
-            if participant_id:
-                data = list(self.dbclient[self.config.mdb_name]
-                            ["project"].find({"project_participant.PERSONA_NATURAL": participant_id}, {"_id": 0}))
-                response = self.app.response_class(
-                    response=self.json.dumps(data),
-                    status=200,
-                    mimetype='application/json'
-                )
-                return response
-
-            if group_name:
-                check = self.check_index()
-                if check is not None:
-                    return check
-                body = {
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"match_phrase": {
-                                    "project_participant.group.NOMBRE_COMPLETO": group_name}},
-                            ]
-                        }
-                    }
-                }
-
-                # get the start time
-                st = time.time()
-                s = Search(using=self.es, index=self.config.es_project_index)
-                s = s.update_from_dict(body)
-                s = s.extra(track_total_hits=True)
-                s.execute()
-                data = [hit.to_dict() for hit in s.scan()]
+                try:
+                    with phase('es_query'):
+                        term_fields = self.load_term_fields() if exact else None
+                        body = self.project_es_query(
+                            keyword, group_name, participant_name, exact, term_fields)
+                        s = Search(using=self.es, index=self.config.es_project_index)
+                        s = s.update_from_dict(body)
+                        s = s.extra(track_total_hits=True)
+                        data = [hit.to_dict() for hit in s.scan()]
+                except NotFoundError:
+                    self.index_catalog.invalidate(self.config.es_project_index)
+                    # the index can be created again with another mapping
+                    self.term_fields = None
+                    return self.index_error()
+                note_query(self.config.es_project_index, body, len(data))
+                with phase('serialization'):
+                    body = self.json.dumps(data)
                 response = self.app.response_class(
-                    response=self.json.dumps(data),
+                    response=body,
                     status=200,
                     mimetype='application/json'
                 )
-                # get the end time
-                et = time.time()
-                # get the execution time
-                elapsed_time = et - st
-                print(f'Search for "{group_name}" Execution time:',
-                      elapsed_time, 'seconds')
                 return response
 
-            if participant_name:
-                check = self.check_index()
-                if check is not None:
-                    return check
-                body = {
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"match_phrase": {
-                                    "project_participant.NOMBRE_COMPLETO": participant_name}},
-                            ]
-                        }
-                    }
-                }
-
-                # get the start time
-                st = time.time()
-                s = Search(using=self.es, index=self.config.es_project_index)
-                s = s.update_from_dict(body)
-                s = s.extra(track_total_hits=True)
-                s.execute()
-                data = [hit.to_dict() for hit in s.scan()]
+            if exact:
+                with phase('mongo_query'):
+                    data = list(self.dbclient[self.config.mdb_name]
+                                ["project"].find(exact, {'_id': 0}))
+                note_query(f'{self.config.mdb_name}.project', exact, len(data))
+                with phase('serialization'):
+                    body = self.json.dumps(data)
                 response = self.app.response_class(
-                    response=self.json.dumps(data),
+                    response=body,
                     status=200,
                     mimetype='application/json'
                 )
-                # get the end time
-                et = time.time()
-                # get the execution time
-                elapsed_time = et - st
-                print(f'Search for "{group_name}" Execution time:',
-                      elapsed_time, 'seconds')
                 return response
 
             data = {
@@ -240,6 +285,7 @@ class SIIU(HunabkuPluginBase):
             return self.apikey_error()
 
     @endpoint('/siiu/info', methods=['GET'])
+    @coalesce
     def config_end(self):
         """
         @api {get} /siiu/info Info
@@ -266,3 +312,35 @@ class SIIU(HunabkuPluginBase):
             mimetype='application/json'
         )
         return response
+
+    @endpoint('/siiu/indexes', methods=['GET'])
+    def siiu_indexes(self):
+        """
+        @api {get} /siiu/indexes Indexes
+        @apiName Indexes
+        @apiGroup SIIU
+        @apiDescription Allows to check the MongoDB indexes of the project collection,
+                        returns the managed fields without index and the plan of every query shape
+                        of /siiu/project (indexed false means the query scans the whole collection).
+
+        @apiParam {String} apikey  Credential for authentication
+
+        @apiSuccess {Object}  missing_indexes and query_plans.
+
+        @apiError (Error 401) msg  The HTTP 401 Unauthorized invalid authentication apikey for the target resource.
+
+        @apiExample {curl} Example usage:
+            curl -i https://apis.colav.co/siiu/indexes?apikey=XXXX
+        """
+        if not self.valid_apikey():
+            return self.apikey_error()
+
+        collection = self.dbclient[self.config.mdb_name]["project"]
+        data = {"missing_indexes": missing_indexes(collection),
+                "query_plans": query_plans(collection)}
+        response = self.app.response_class(
+            response=self.json.dumps(data),
+            status=200,
+            mimetype='application/json'
+        )
+        return response
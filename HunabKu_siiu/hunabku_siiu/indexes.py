@@ -0,0 +1,64 @@
+# fields of the project collection used by the exact lookups of /siiu/project,
+# project_participant is an array of embedded documents then the indexes are multikey.
+PROJECT_INDEXES = ['CODIGO',
+                   'project_participant.group.CODIGO_COLCIENCIAS',
+                   'project_participant.PERSONA_NATURAL']
+
+# query shapes of /siiu/project served by MongoDB, the values are only used to get the plans.
+QUERY_SHAPES = {
+    'CODIGO': {'CODIGO': ''},
+    'group_code': {'project_participant.group.CODIGO_COLCIENCIAS': ''},
+    'participant_id': {'project_participant.PERSONA_NATURAL': ''},
+}
+
+
+def ensure_indexes(collection) -> list:
+    """
+    Creates (if missing) the indexes of the project collection.
+
+    Returns:
+        list: names of the indexes.
+    """
+    return [collection.create_index(field) for field in PROJECT_INDEXES]
+
+
+def missing_indexes(collection) -> list:
+    """
+    Returns the managed fields that are not the first key of any index.
+    """
+    first_keys = {index['key'][0][0] for index in collection.index_information().values()}
+    return [field for field in PROJECT_INDEXES if field not in first_keys]
+
+
+def plan_stages(plan) -> list:
+    """
+    Returns all the stages found in a plan returned by explain.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def query_plans(collection, shapes: dict = QUERY_SHAPES) -> dict:
+    """
+    Gets the winning plan of every query shape.
+
+    Returns:
+        dict: shape name to a dict with the stages of the plan and
+        a flag indexed, False if the query scans the whole collection.
+    """
+    plans = {}
+    for name, query in shapes.items():
+        explain = collection.find(query).explain()
+        stages = plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {}))
+        plans[name] = {'filter': list(query.keys()),
+                       'stages': stages,
+                       'indexed': 'COLLSCAN' not in stages}
+    return plans
@@ -86,6 +86,7 @@ def main():
             'pymongo',
             'elasticsearch',
             'elasticsearch_dsl',
+            'hunabku_common',
         ],
     )
 
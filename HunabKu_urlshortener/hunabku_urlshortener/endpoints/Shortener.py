@@ -2,6 +2,7 @@ from hunabku.HunabkuBase import HunabkuPluginBase, endpoint
 from hunabku.Config import Config, Param
 from flask import redirect
 from pymongo import MongoClient, errors
+from hunabku_common.auth import check_apikey
 import validators
 import datetime
 import base62
@@ -31,6 +32,13 @@ class Shortener(HunabkuPluginBase):
         self.db = self.dbclient[self.config.db_name]
         self.collection = self.db[self.config.collection_name]
 
+    def valid_apikey(self):
+        """
+        Checks the apikey with the key store of hunabku_common.auth,
+        the apikey of /create can also be sent in the form of POST requests.
+        """
+        return check_apikey()
+
     def validate_url(self, url):
         validation = validators.url(url)
         if validation:
@@ -80,6 +80,7 @@ def main():
         # put you packages here
         install_requires=[
             'hunabku',
+            'hunabku_common',
             'validators',
             'pymongo',
             'pybase62'
@@ -0,0 +1,77 @@
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from hunabku_common.auth import KeyStore, check_apikey, digest, same_key
+
+
+class TestKeyStore(unittest.TestCase):
+    """
+    Class to test the API keys indexed by their digest
+    """
+
+    def setUp(self):
+        self.store = KeyStore()
+
+    def test_config_keys(self):
+        self.store.add('secret', name='client', rate=2)
+        self.assertEqual(self.store.lookup('secret'), {'name': 'client', 'rate': 2})
+        self.assertIsNone(self.store.lookup('secreT'))
+        self.assertIsNone(self.store.lookup(''))
+        self.assertIsNone(self.store.lookup(None))
+        # only the digest is kept
+        self.assertEqual(list(self.store.config_keys), [digest('secret')])
+
+    def test_load(self):
+        docs = [{'_id': 1, 'apikey': 'plain', 'name': 'plain'},
+                {'_id': 2, 'apikey_sha256': digest('hashed').hex(), 'admin': True},
+                {'_id': 3, 'apikey': 'disabled', 'enabled': False},
+                {'_id': 4, 'name': 'without key'}]
+        self.store.load = lambda: docs
+        self.store.refresh()
+        self.assertEqual(self.store.lookup('plain'), {'name': 'plain'})
+        self.assertEqual(self.store.lookup('hashed'), {'admin': True, 'name': digest('hashed').hex()[:12]})
+        self.assertIsNone(self.store.lookup('disabled'))
+        self.assertEqual(len(self.store.keys), 2)
+
+    def test_failed_load(self):
+        self.store.load = lambda: [{'apikey': 'old'}]
+        self.store.refresh()
+
+        def load():
+            raise RuntimeError('MongoDB is down')
+        self.store.load = load
+        with self.assertLogs('hunabku_common.auth', 'WARNING'):
+            self.store.refresh()
+        # the old keys are kept
+        self.assertIsNotNone(self.store.lookup('old'))
+
+    def test_reload_in_background(self):
+        load = mock.Mock(return_value=[])
+        with mock.patch('hunabku_common.auth.Thread') as thread:
+            self.store.configure(load, ttl=60)
+            self.store.lookup('secret')
+        # a single refresh in flight
+        self.assertEqual(thread.call_count, 1)
+        self.assertTrue(self.store.refreshing)
+
+    def test_same_key(self):
+        self.assertTrue(same_key('secret', 'secret'))
+        self.assertFalse(same_key('secret', 'other'))
+        self.assertFalse(same_key(None, None))
+
+    def test_check_apikey(self):
+        self.store.add('secret', name='client')
+        app = Flask(__name__)
+        self.assertFalse(check_apikey(self.store))
+        with app.test_request_context('/?apikey=secret'):
+            self.assertTrue(check_apikey(self.store))
+        with app.test_request_context('/', method='POST', data={'apikey': 'secret'}):
+            self.assertTrue(check_apikey(self.store))
+        with app.test_request_context('/?apikey=other'):
+            self.assertFalse(check_apikey(self.store))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import json
+import unittest
+from threading import Event, Lock
+from unittest import mock
+
+from flask import Flask
+from pymongo.errors import OperationFailure
+
+from hunabku_dspace.endpoints import DSpace as dspace_plugin
+from hunabku_dspace.endpoints.DSpace import DSpace
+from hunabku_dspace.records import DATESTAMP, INDEX_NOT_FOUND, changed_after, decode_token, encode_token, get_datestamp
+
+
+class Cursor(list):
+    """
+    Cursor over records already sorted, only skip and limit are applied.
+    """
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def skip(self, count):
+        return Cursor(self[count:])
+
+    def limit(self, count):
+        return Cursor(self[:count])
+
+
+def record(record_id, datestamp):
+    return {'_id': record_id, 'OAI-PMH': {'GetRecord': {'record': {'header': {'datestamp': datestamp}}}}}
+
+
+def dspace(records):
+    """
+    DSpace plugin without the server, every query of the collection dspace_udea_records returns the records.
+    """
+    plugin = DSpace.__new__(DSpace)
+    plugin.app = Flask(__name__)
+    plugin.json = json
+    plugin.collection = mock.Mock()
+    plugin.collection.find.side_effect = lambda *args, **kwargs: Cursor(records)
+    plugin.db = {'dspace_udea_records': plugin.collection}
+    return plugin
+
+
+class TestDSpaceTokens(unittest.TestCase):
+    """
+    Class to test the change tokens of the incremental harvesting
+    """
+
+    def test_token(self):
+        token = encode_token('2021-01-01T00:00:00Z', 'oai:x:1')
+        self.assertEqual(decode_token(token), ('2021-01-01T00:00:00Z', 'oai:x:1'))
+        for token in ['abc', encode_token('2021-01-01', 'x')[:-4], 'WzEsIDJd']:
+            with self.assertRaises(ValueError):
+                decode_token(token)
+
+    def test_changed_after(self):
+        self.assertEqual(changed_after('2021-01-01', 'oai:x:1'),
+                         {'$or': [{DATESTAMP: {'$gt': '2021-01-01'}}, {DATESTAMP: '2021-01-01', '_id': {'$gt': 'oai:x:1'}}]})
+
+    def test_get_datestamp(self):
+        self.assertEqual(get_datestamp(record('a', '2021-01-01')), '2021-01-01')
+        self.assertIsNone(get_datestamp({'OAI-PMH': 'x'}))
+
+
+class TestDSpacePages(unittest.TestCase):
+    """
+    Class to test the pages of the records by _id (after) and by datestamp (since and token)
+    """
+
+    def setUp(self):
+        self.records = [record(f'oai:x:{i}', f'2021-01-0{i + 1}') for i in range(5)]
+        self.plugin = dspace(self.records)
+
+    def test_pagination_parameters(self):
+        self.assertEqual(self.plugin.check_pagination({'format': 'ndjson', 'max_results': '3'})[:2], ('ndjson', 3))
+        self.assertEqual(self.plugin.check_pagination({})[:2], ('json', 0))
+        for args in [{'format': 'xml'}, {'max_results': '0'}, {'max_results': 'x'}]:
+            self.assertEqual(self.plugin.check_pagination(args)[2].status_code, 400)
+
+    def test_after(self):
+        with self.plugin.app.test_request_context():
+            records, headers = self.plugin.page_records('dspace_udea_records', 'oai:x:0', 2)
+            self.assertEqual([r['_id'] for r in records], ['oai:x:0', 'oai:x:1'])
+        self.assertEqual(self.plugin.collection.find.call_args[0][0], {'_id': {'$gt': 'oai:x:0'}})
+        # the last id of the page
+        self.assertEqual(headers, {'X-Next-After': 'oai:x:1'})
+
+    def test_last_page(self):
+        with self.plugin.app.test_request_context():
+            records, headers = self.plugin.page_records('dspace_udea_records', None, 5)
+        self.assertEqual(headers, {})
+
+    def test_since(self):
+        with self.plugin.app.test_request_context():
+            response = self.plugin.changed_records('dspace_udea_records', '2021-01-01', None, 'json', 2)
+            self.assertEqual(len(json.loads(response.get_data(as_text=True))), 2)
+        self.assertEqual(self.plugin.collection.find.call_args_list[0][0][0], changed_after('2021-01-01', ''))
+        # the position of the last record of the page
+        self.assertEqual(decode_token(response.headers['X-Next-Token']), ('2021-01-02', 'oai:x:1'))
+
+    def test_token(self):
+        token = encode_token('2021-01-02', 'oai:x:1')
+        with self.plugin.app.test_request_context():
+            response = self.plugin.changed_records('dspace_udea_records', None, token, 'ndjson', 0)
+            response.get_data()
+        self.assertEqual(self.plugin.collection.find.call_args_list[0][0][0], changed_after('2021-01-02', 'oai:x:1'))
+        # without pagination the token has the position of the last change, read with a single record
+        self.assertEqual(self.plugin.collection.find.call_args_list[1][0][1], {DATESTAMP: 1, '_id': 1})
+        self.assertIn('X-Next-Token', response.headers)
+
+    def test_invalid(self):
+        with self.plugin.app.test_request_context():
+            self.assertEqual(self.plugin.changed_records('dspace_udea_records', 'yesterday', None, 'json', 0).status_code, 400)
+            self.assertEqual(self.plugin.changed_records('dspace_udea_records', None, 'abc', 'json', 0).status_code, 400)
+
+
+class TestDSpaceIds(unittest.TestCase):
+    """
+    Class to test the batch lookup of records by id
+    """
+
+    def setUp(self):
+        self.records = {f'oai:x:{i}': record(f'oai:x:{i}', '2021-01-01') for i in range(5)}
+        self.plugin = dspace([])
+        self.plugin.collection.find.side_effect = lambda query, *args: [
+            self.records[pid] for pid in sorted(query['_id']['$in']) if pid in self.records]
+
+    def test_order(self):
+        ids = ['oai:x:3', 'missing', 'oai:x:1', 'oai:x:4']
+        with mock.patch.object(self.plugin.config, 'mdb_batch_size', 2):
+            found = list(self.plugin.find_ids('dspace_udea_records', ids))
+        # in the order of the ids, a query every mdb_batch_size ids
+        self.assertEqual([r['_id'] for r in found], ['oai:x:3', 'oai:x:1', 'oai:x:4'])
+        self.assertEqual([call[0][0] for call in self.plugin.collection.find.call_args_list],
+                         [{'_id': {'$in': ['oai:x:3', 'missing']}}, {'_id': {'$in': ['oai:x:1', 'oai:x:4']}}])
+
+
+class TestDSpaceSearch(unittest.TestCase):
+    """
+    Class to test the text search of the records
+    """
+
+    def setUp(self):
+        self.plugin = dspace([record('oai:x:1', '2021-01-01')])
+
+    def search(self, page=None, fields=None, max_results=0):
+        with self.plugin.app.test_request_context():
+            response = self.plugin.search_records('dspace_udea_records', 'tesis', page, fields, 'json', max_results)
+            response.get_data()
+        return response
+
+    def test_search(self):
+        response = self.search(page='3', fields='OAI-PMH.GetRecord.record.header', max_results=10)
+        self.assertEqual(response.status_code, 200)
+        args, kwargs = self.plugin.collection.find.call_args
+        self.assertEqual(args, ({'$text': {'$search': 'tesis'}},
+                                {'OAI-PMH.GetRecord.record.header': 1, 'score': {'$meta': 'textScore'}}))
+        self.assertEqual(kwargs, {'skip': 20, 'limit': 10})
+
+    def test_invalid(self):
+        self.assertEqual(self.search(page='0').status_code, 400)
+        self.assertEqual(self.search(fields='$where').status_code, 400)
+
+    def test_index_not_found(self):
+        self.plugin.collection.find.side_effect = OperationFailure('text index required', INDEX_NOT_FOUND)
+        self.plugin.build_text_index = mock.Mock()
+        response = self.search()
+        # the request does not wait for the index
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.plugin.build_text_index.assert_called_with('dspace_udea_records')
+
+    def test_build_once(self):
+        self.plugin.building = set()
+        self.plugin.building_lock = Lock()
+        self.plugin.logger = mock.Mock()
+        started, release = Event(), Event()
+
+        def build(*args):
+            started.set()
+            release.wait(5)
+        with mock.patch.object(dspace_plugin, 'ensure_text_index', side_effect=build) as ensure:
+            self.plugin.build_text_index('dspace_udea_records')
+            started.wait(5)
+            # the index is being built, the second search does not start another build
+            self.plugin.build_text_index('dspace_udea_records')
+            release.set()
+        self.assertEqual(ensure.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
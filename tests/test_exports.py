@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Event
+
+from hunabku_common.exports import Export, ExportJobs
+
+
+def wait(jobs, job_id, states=('done', 'failed')):
+    for i in range(100):
+        status = jobs.get(job_id)
+        if status['status'] in states:
+            return status
+        time.sleep(0.05)
+    return status
+
+
+class TestExportJobs(unittest.TestCase):
+    """
+    Class to test the export jobs written to a temporary directory
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.jobs = ExportJobs(self.path, workers=1, timeout=0.4)
+        self.records = [{'_id': i} for i in range(3)]
+        self.export = Export('test', ['institution'], lambda params: self.records, lambda params: len(self.records))
+
+    def tearDown(self):
+        self.jobs.executor.shutdown(wait=True)
+        shutil.rmtree(self.path)
+
+    def test_done(self):
+        job_id = self.jobs.submit(self.export, {'institution': 'udea'})
+        status = wait(self.jobs, job_id)
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['records'], 3)
+        with gzip.open(self.jobs.file_path(job_id), 'rt') as f:
+            self.assertEqual([json.loads(line) for line in f], self.records)
+
+    def test_reused_until_data_changes(self):
+        job_id = self.jobs.submit(self.export, {'institution': 'udea'})
+        wait(self.jobs, job_id)
+        self.assertEqual(self.jobs.submit(self.export, {'institution': 'udea'}), job_id)
+        self.assertNotEqual(self.jobs.submit(self.export, {'institution': 'uec'}), job_id)
+        self.records.append({'_id': 3})
+        self.assertNotEqual(self.jobs.submit(self.export, {'institution': 'udea'}), job_id)
+
+    def test_failed(self):
+        def run(params):
+            yield {'_id': 0}
+            raise RuntimeError('connection lost')
+        export = Export('test', [], run, lambda params: 0)
+        status = wait(self.jobs, self.jobs.submit(export, {}))
+        self.assertEqual(status['status'], 'failed')
+        self.assertEqual(status['error'], 'connection lost')
+        self.assertEqual(os.listdir(self.path), [f"{status['job_id']}.json"])
+
+    def test_invalid_parameters(self):
+        def version(params):
+            raise ValueError('invalid institution')
+        with self.assertRaises(ValueError):
+            self.jobs.submit(Export('test', ['institution'], list, version), {'institution': 'x'})
+
+    def test_queued_not_failed(self):
+        # the single worker is busy, the second job waits longer than the timeout
+        release = Event()
+
+        def run(params):
+            release.wait(5)
+            return []
+        first = self.jobs.submit(Export('slow', [], run, lambda params: 0), {})
+        second = self.jobs.submit(self.export, {'institution': 'udea'})
+        time.sleep(1)
+        self.assertEqual(self.jobs.get(first)['status'], 'running')
+        self.assertEqual(self.jobs.get(second)['status'], 'queued')
+        release.set()
+        self.assertEqual(wait(self.jobs, second)['status'], 'done')
+
+    def test_interrupted(self):
+        job_id = self.jobs.submit(self.export, {'institution': 'udea'})
+        wait(self.jobs, job_id)
+        # a pending job of a process that stopped
+        os.remove(self.jobs.file_path(job_id))
+        self.jobs._write_status(job_id, {'job_id': job_id, 'status': 'running'})
+        past = time.time() - 1
+        os.utime(self.jobs.status_path(job_id), (past, past))
+        self.assertEqual(self.jobs.get(job_id)['status'], 'failed')
+        self.assertEqual(self.jobs.submit(self.export, {'institution': 'udea'}), job_id)
+        self.assertEqual(wait(self.jobs, job_id)['status'], 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import json
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event
+from unittest import mock
+
+from pymongo.errors import DuplicateKeyError
+
+from hunabku_kamunu.cache import NegativeCache, ResolutionCache, normalize_query
+from hunabku_kamunu.endpoints.kamunu_plugin import Kamunu, record_projection
+from hunabku_kamunu.jobs import JobQueue
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    """
+    Class to test the cache key of the organization names
+    """
+
+    def test_normalize(self):
+        self.assertEqual(normalize_query('  Universidad de  Antióquia '), 'universidad de antioquia')
+        self.assertEqual(normalize_query('UdeA', 'Colombia'), 'udea|colombia')
+        self.assertEqual(normalize_query('UdeA', 'Colombia'), normalize_query('udea ', 'COLOMBIA'))
+
+
+class TestResolutionCache(unittest.TestCase):
+    """
+    Class to test the cache of the resolved names, MongoDB is replaced by a mock collection
+    """
+
+    def setUp(self):
+        self.collection = mock.Mock()
+        self.cache = ResolutionCache(self.collection, maxsize=2)
+
+    def test_get(self):
+        self.collection.find_one.return_value = {'_id': 'udea', 'record_id': 1}
+        self.assertEqual(self.cache.get('UdeA'), 1)
+        # the second lookup is answered by the LRU
+        self.assertEqual(self.cache.get('udea'), 1)
+        self.assertEqual(self.collection.find_one.call_count, 1)
+        self.collection.find_one.return_value = None
+        self.assertIsNone(self.cache.get('unal'))
+
+    def test_lru_size(self):
+        for name in ['a', 'b', 'c']:
+            self.cache.set(name, None, name.upper())
+        self.assertEqual(list(self.cache.lru), ['b', 'c'])
+
+    def test_get_many(self):
+        self.cache.set('a', None, 'A')
+        self.collection.find.return_value = [{'_id': 'b', 'record_id': 'B'}]
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 'A', 'b': 'B'})
+        # only the keys missing in the LRU are queried
+        self.assertEqual(self.collection.find.call_args[0][0], {'_id': {'$in': ['b', 'c']}})
+
+    def test_evict(self):
+        self.cache.set('UdeA', 'colombia', 1)
+        self.cache.evict('udea', 'Colombia')
+        self.assertEqual(self.cache.lru, {})
+        self.collection.delete_one.assert_called_with({'_id': 'udea|colombia'})
+
+
+class TestNegativeCache(unittest.TestCase):
+    """
+    Class to test the cache of the names that kamunu could not resolve
+    """
+
+    def setUp(self):
+        self.collection = mock.Mock()
+        self.cache = NegativeCache(self.collection, ttl=60)
+
+    def test_add(self):
+        self.cache.add('foo', None, 'api', 'not_inserted_id')
+        self.assertTrue(self.cache.contains('FOO ', None, 'api'))
+        self.collection.find_one.assert_not_called()
+        # the source is part of the key
+        self.collection.find_one.return_value = None
+        self.assertFalse(self.cache.contains('foo', None, 'other'))
+
+    def test_expired(self):
+        self.cache.add('foo', None, 'api', 'not_inserted_id')
+        self.collection.find_one.return_value = None
+        with mock.patch.object(time, 'time', return_value=time.time() + 61):
+            self.assertFalse(self.cache.contains('foo', None, 'api'))
+        self.assertEqual(self.cache.lru, {})
+
+    def test_from_collection(self):
+        # cached 50 seconds ago by another process, 10 seconds left
+        self.collection.find_one.return_value = {'cached': datetime.utcnow() - timedelta(seconds=50)}
+        self.assertTrue(self.cache.contains('foo', None, 'api'))
+        self.assertAlmostEqual(self.cache.lru['foo|api'] - time.time(), 10, delta=1)
+
+
+def kamunu():
+    """
+    Kamunu plugin without the server nor MongoDB, nothing is cached and no record is found.
+    """
+    plugin = Kamunu.__new__(Kamunu)
+    plugin.json = json
+    plugin.resolution_cache = mock.Mock()
+    plugin.resolution_cache.get_many.return_value = {}
+    plugin.find_batch_records = mock.Mock(return_value=[])
+    plugin.batch_executor = ThreadPoolExecutor(max_workers=1)
+    return plugin
+
+
+class TestKamunuBatch(unittest.TestCase):
+    """
+    Class to test the resolution of a batch of organizations
+    """
+
+    def setUp(self):
+        self.plugin = kamunu()
+        self.resolved = []
+
+        def resolve_name(query, source, country, projection):
+            self.resolved.append(query)
+            if query == 'error':
+                raise RuntimeError('kamunu failed')
+            return {'_id': query} if query.startswith('udea') else None
+        self.plugin.resolve_name = resolve_name
+
+    def tearDown(self):
+        self.plugin.batch_executor.shutdown(wait=True)
+
+    def test_order_and_repeated(self):
+        queries = [('udea', None), ('foo', None), ('UdeA ', None), ('error', None)]
+        lines = [json.loads(line) for line in self.plugin.resolve_batch(queries, 'api', 'dehydrated')]
+        self.assertEqual([line['query'] for line in lines], ['udea', 'foo', 'UdeA ', 'error'])
+        self.assertEqual([line['status'] for line in lines], [200, 404, 200, 500])
+        self.assertEqual(lines[2]['result'], {'_id': 'udea'})
+        # the repeated names are resolved once
+        self.assertEqual(self.resolved, ['udea', 'foo', 'error'])
+
+    def test_found_not_resolved(self):
+        self.plugin.resolution_cache.get_many.return_value = {'udea': 'udea_id'}
+        self.plugin.find_batch_records.return_value = [({'_id': 'udea_id'}, {'_id': 'udea_id'})]
+        lines = [json.loads(line) for line in self.plugin.resolve_batch([('UdeA', None)], 'api', 'dehydrated')]
+        self.assertEqual(lines[0]['result'], {'_id': 'udea_id'})
+        self.assertEqual(self.resolved, [])
+
+    def test_window(self):
+        self.plugin.batch_executor = mock.Mock(wraps=self.plugin.batch_executor)
+        queries = [(f'name {i}', None) for i in range(100)]
+        with mock.patch.object(self.plugin.config, 'batch_workers', 1):
+            lines = self.plugin.resolve_batch(queries, 'api', 'dehydrated')
+            self.assertEqual(self.plugin.batch_executor.submit.call_count, 0)
+            # the names are submitted 4 times batch_workers ahead of the lines sent
+            next(lines)
+            self.assertEqual(self.plugin.batch_executor.submit.call_count, 4)
+            next(lines)
+            self.assertEqual(self.plugin.batch_executor.submit.call_count, 5)
+            lines.close()
+        self.assertEqual(self.plugin.batch_executor.submit.call_count, 5)
+
+
+class TestKamunuShape(unittest.TestCase):
+    """
+    Class to test the fields fetched and returned for every return option
+    """
+
+    def setUp(self):
+        self.plugin = kamunu()
+        self.record = {'_id': 1, 'names': 'UdeA', 'ids': {'ror': 'https://ror.org/03bp5hc83'},
+                       'records': {'ror': {'id': 'https://ror.org/03bp5hc83'}}}
+
+    def tearDown(self):
+        self.plugin.batch_executor.shutdown(wait=True)
+
+    def test_projection(self):
+        self.assertEqual(record_projection('ids'), {'ids': 1})
+        self.assertEqual(record_projection('dehydrated'), {'records': 0, 'validation': 0})
+        self.assertEqual(record_projection('full'), {'validation': 0})
+        self.assertEqual(record_projection('custom', 'records.ror'), {'records.ror': 1})
+
+    def test_shape(self):
+        self.assertEqual(self.plugin.shape_record(self.record, 'ids'), (200, self.record['ids']))
+        self.assertEqual(self.plugin.shape_record(self.record, 'full'), (200, self.record))
+        self.assertEqual(self.plugin.shape_record(self.record, 'custom', 'records.ror'),
+                         (200, self.record['records']['ror']))
+        self.assertEqual(self.plugin.shape_record(self.record, 'custom', 'names'), (200, 'UdeA'))
+        status, data = self.plugin.shape_record(self.record, 'custom', 'records.wikidata')
+        self.assertEqual(status, 400)
+
+
+class TestJobQueue(unittest.TestCase):
+    """
+    Class to test the background resolutions, MongoDB is replaced by a mock collection
+    """
+
+    def setUp(self):
+        self.collection = mock.Mock()
+        # the upsert creates the job
+        self.collection.find_one_and_update.side_effect = lambda query, update, **kwargs: {
+            '_id': update['$setOnInsert']['_id']}
+        self.jobs = JobQueue(self.collection, workers=1, timeout=0.2)
+
+    def tearDown(self):
+        self.jobs.executor.shutdown(wait=True)
+
+    def finished(self):
+        return [call[0][1]['$set'] for call in self.collection.update_one.call_args_list
+                if 'finished' in call[0][1]['$set']]
+
+    def test_submit(self):
+        job_id = self.jobs.submit('udea', {'query': 'UdeA'}, lambda params: 'record_id')
+        self.jobs.executor.shutdown(wait=True)
+        self.assertEqual(self.finished()[0]['status'], 'done')
+        self.assertEqual(self.finished()[0]['record_id'], 'record_id')
+        self.assertEqual(self.collection.update_one.call_args[0][0], {'_id': job_id})
+        self.assertEqual(self.jobs.pending, set())
+
+    def test_pending_reused(self):
+        self.collection.find_one_and_update.side_effect = None
+        self.collection.find_one_and_update.return_value = {'_id': 'pending_job'}
+        function = mock.Mock()
+        self.assertEqual(self.jobs.submit('udea', {}, function), 'pending_job')
+        self.jobs.executor.shutdown(wait=True)
+        function.assert_not_called()
+
+    def test_created_at_the_same_time(self):
+        self.collection.find_one_and_update.side_effect = [DuplicateKeyError('udea'), {'_id': 'other_job'}]
+        self.assertEqual(self.jobs.submit('udea', {}, mock.Mock()), 'other_job')
+
+    def test_failed(self):
+        def function(params):
+            raise RuntimeError('kamunu failed')
+        self.jobs.submit('udea', {}, function)
+        self.jobs.executor.shutdown(wait=True)
+        self.assertEqual(self.finished()[0]['status'], 'failed')
+        self.assertEqual(self.finished()[0]['error'], 'kamunu failed')
+
+    def test_interrupted(self):
+        self.collection.find_one.return_value = {'_id': 'job', 'status': 'queued', 'pending': True,
+                                                 'updated': datetime.utcnow() - timedelta(seconds=1)}
+        self.assertEqual(self.jobs.get('job')['status'], 'failed')
+
+    def test_heartbeat(self):
+        release = Event()
+        job_id = self.jobs.submit('udea', {}, lambda params: release.wait(5))
+        time.sleep(0.3)
+        # the running job is updated by its process
+        query, update = self.collection.update_many.call_args[0]
+        self.assertEqual(query, {'_id': {'$in': [job_id]}, 'pending': True})
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import math
+import unittest
+from unittest import mock
+
+from flask import Flask
+from pymongo.errors import DuplicateKeyError
+
+from hunabku_common import limits
+from hunabku_common.auth import API_KEYS
+from hunabku_common.limits import LIMITER, SharedWindows, TokenBucket, set_cost
+
+
+class TestTokenBucket(unittest.TestCase):
+    """
+    Class to test the token bucket of an API key
+    """
+
+    def test_refill(self):
+        with mock.patch.object(limits.time, 'monotonic', return_value=100.0) as monotonic:
+            bucket = TokenBucket(rate=2, burst=10)
+            self.assertEqual(bucket.take(10), 0)
+            # empty, 4 tokens are missing and the rate is 2 per second
+            self.assertEqual(bucket.take(4), 2)
+            monotonic.return_value = 101.0
+            self.assertEqual(bucket.take(2), 0)
+            self.assertEqual(bucket.take(2), 1)
+            # never refilled over the burst
+            monotonic.return_value = 1000.0
+            self.assertEqual(bucket.take(10), 0)
+            self.assertGreater(bucket.take(1), 0)
+
+    def test_cost_over_burst(self):
+        LIMITER.configure(1, 10, 0)
+        try:
+            with mock.patch.object(limits.time, 'monotonic', return_value=100.0):
+                # the request could never be paid, it is rejected without spending tokens
+                with self.assertLogs(limits.__name__, 'WARNING'):
+                    self.assertEqual(LIMITER.take('client', 50, 1, 10), math.inf)
+                self.assertEqual(LIMITER.take('client', 10, 1, 10), 0)
+        finally:
+            LIMITER.configure(0, 60, 0)
+
+
+class TestSharedWindows(unittest.TestCase):
+    """
+    Class to test the rate limit shared in a MongoDB collection
+    """
+
+    def setUp(self):
+        self.windows = SharedWindows(mock.Mock())
+
+    def test_take(self):
+        collection = self.windows.collection
+        with mock.patch.object(limits.time, 'time', return_value=1005.0):
+            self.assertEqual(self.windows.take('client', 6, 1, 10), 0)
+            query, update = collection.find_one_and_update.call_args[0]
+            # the window of 10 seconds started at 1000, the cost is added only if it fits
+            self.assertEqual(query, {'_id': 'client:1000', 'cost': {'$lte': 4}})
+            self.assertEqual(update['$inc'], {'cost': 6})
+
+    def test_rejected_not_counted(self):
+        collection = self.windows.collection
+        collection.find_one_and_update.side_effect = DuplicateKeyError('client:1000')
+        collection.find_one.return_value = {'_id': 'client:1000', 'cost': 6}
+        with mock.patch.object(limits.time, 'time', return_value=1005.0):
+            self.assertEqual(self.windows.take('client', 6, 1, 10), 5)
+        collection.update_one.assert_not_called()
+
+
+class TestLimits(unittest.TestCase):
+    """
+    Class to test the limits applied to the requests of a Flask app
+    """
+
+    def setUp(self):
+        API_KEYS.add('test-client', name='test-client')
+        API_KEYS.add('test-admin', name='test-admin', admin=True)
+        LIMITER.configure(1, 5, 1)
+        self.app = Flask(__name__)
+        limits.install(self.app)
+        set_cost('/limited', 3)
+
+        @self.app.route('/limited')
+        def limited():
+            return 'ok'
+
+        @self.app.route('/stream')
+        def stream():
+            return self.app.response_class(iter(['a', 'b']))
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        LIMITER.configure(0, 60, 0)
+        limits.COSTS.pop('/limited', None)
+
+    def test_too_many_requests(self):
+        response = self.client.get('/limited?apikey=test-client')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/limited?apikey=test-client')
+        self.assertEqual(response.status_code, 429)
+        # 2 tokens left, the third one in 1 second
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(response.get_json()['error'], 'Too Many Requests')
+
+    def test_cost_over_burst(self):
+        set_cost('/limited', 10)
+        response = self.client.get('/limited?apikey=test-client')
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('Retry-After', response.headers)
+        self.assertEqual(LIMITER.running, {})
+
+    def test_admin_not_limited(self):
+        for i in range(5):
+            self.assertEqual(self.client.get('/limited?apikey=test-admin').status_code, 200)
+
+    def test_invalid_apikey_not_counted(self):
+        self.assertEqual(self.client.get('/limited?apikey=unknown').status_code, 200)
+        self.assertEqual(LIMITER.running, {})
+
+    def test_release_on_close(self):
+        response = self.client.get('/stream?apikey=test-client', buffered=False)
+        self.assertEqual(LIMITER.running, {'test-client': 1})
+        # a single request at the same time
+        second = self.client.get('/stream?apikey=test-client')
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second.headers['Retry-After'], '1')
+        self.assertEqual(response.get_data(as_text=True), 'ab')
+        response.close()
+        self.assertEqual(LIMITER.running, {})
+        response = self.client.get('/stream?apikey=test-client')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
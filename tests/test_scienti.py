@@ -0,0 +1,152 @@
+import json
+import re
+import unittest
+
+from flask import Flask
+
+from hunabku_common.mongo import NameCatalog
+from hunabku_scienti.endpoints.Scienti import Scienti
+from hunabku_scienti.entities import ENTITIES
+
+
+DATABASES = ['admin', 'scienti_udea_2022', 'scienti_udea_2023', 'scienti_uec_2022', 'scienti_other']
+
+
+def scienti():
+    """
+    Scienti plugin without the server nor the databases, only the catalog of databases.
+    """
+    plugin = Scienti.__new__(Scienti)
+    plugin.app = Flask(__name__)
+    plugin.json = json
+    plugin.db_catalog = NameCatalog(lambda: DATABASES, 60)
+    return plugin
+
+
+class TestScientiTargets(unittest.TestCase):
+    """
+    Class to test the databases requested by institution and model_year
+    """
+
+    def setUp(self):
+        self.plugin = scienti()
+
+    def test_single(self):
+        targets, response = self.plugin.scienti_targets('udea', '2022')
+        self.assertIsNone(response)
+        self.assertEqual(targets, [('udea', '2022')])
+
+    def test_lists(self):
+        targets, response = self.plugin.scienti_targets('uec,udea', '2023, 2022')
+        self.assertIsNotNone(response)
+        self.assertEqual(response.status_code, 400)
+        targets, response = self.plugin.scienti_targets('uec,udea', '2022')
+        self.assertIsNone(response)
+        self.assertEqual(targets, [('udea', '2022'), ('uec', '2022')])
+
+    def test_all(self):
+        targets, response = self.plugin.scienti_targets('all', 'all')
+        self.assertIsNone(response)
+        self.assertEqual(targets, [('udea', '2022'), ('uec', '2022'), ('udea', '2023')])
+        targets, response = self.plugin.scienti_targets('udea', 'all')
+        self.assertEqual(targets, [('udea', '2022'), ('udea', '2023')])
+        targets, response = self.plugin.scienti_targets('all', '2023')
+        self.assertEqual(targets, [('udea', '2023')])
+
+    def test_not_found(self):
+        targets, response = self.plugin.scienti_targets('all', '1999')
+        self.assertEqual(targets, [])
+        self.assertEqual(response.status_code, 400)
+        targets, response = self.plugin.scienti_targets('unknown', '2022')
+        self.assertEqual(targets, [])
+        self.assertEqual(response.status_code, 400)
+
+
+class TestScientiRecords(unittest.TestCase):
+    """
+    Class to test the records merged from several institutions
+    """
+
+    def setUp(self):
+        self.plugin = scienti()
+        self.entity = ENTITIES['product']
+
+    def records(self):
+        return [(('udea', '2022'), {'COD_RH': '1', 'COD_PRODUCTO': '10'}),
+                (('uec', '2022'), {'COD_RH': '1', 'COD_PRODUCTO': '10'}),
+                (('uec', '2022'), {'COD_RH': '1', 'COD_PRODUCTO': '11'}),
+                (('udea', '2023'), {'COD_RH': '1', 'COD_PRODUCTO': '10'}),
+                (('uec', '2022'), {'COD_RH': '2'})]
+
+    def test_tag_records(self):
+        records = list(self.plugin.tag_records(self.entity, self.records()))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[1]['institution'], 'uec')
+        self.assertEqual(records[1]['model_year'], '2022')
+
+    def test_tag_records_dedupe(self):
+        records = list(self.plugin.tag_records(self.entity, self.records(), dedupe=True))
+        # the repeated product of the same year is returned once, from the first institution
+        self.assertEqual([(record['institution'], record['model_year'], record.get('COD_PRODUCTO')) for record in records],
+                         [('udea', '2022', '10'), ('uec', '2022', '11'), ('udea', '2023', '10'), ('uec', '2022', None)])
+
+    def test_stream_error(self):
+        def records():
+            yield {'COD_RH': '1'}
+            raise RuntimeError('connection lost')
+        body = self.plugin.json_stream(records()).response
+        sent = [next(body), next(body)]
+        # the error reaches the server, the array is never closed
+        with self.assertRaises(RuntimeError):
+            next(body)
+        with self.assertRaises(ValueError):
+            json.loads(''.join(sent))
+
+
+class TestScientiFields(unittest.TestCase):
+    """
+    Class to test the parameter fields against the fields allowed for the entities
+    """
+
+    def setUp(self):
+        self.plugin = scienti()
+        self.entity = ENTITIES['product']
+
+    def test_all_fields(self):
+        fields, projection, response = self.plugin.check_fields(self.entity, {})
+        self.assertIsNone(fields)
+        self.assertEqual(projection, self.entity.projection)
+        self.assertIsNone(response)
+
+    def test_allowed(self):
+        fields, projection, response = self.plugin.check_fields(self.entity, {'fields': 'COD_RH, COD_PRODUCTO'})
+        self.assertIsNone(response)
+        self.assertEqual(fields, ['COD_PRODUCTO', 'COD_RH'])
+        self.assertEqual(projection, {'COD_PRODUCTO': 1, 'COD_RH': 1, '_id': 0})
+
+    def test_parent_removes_children(self):
+        allowed = self.entity.allowed_fields
+        parent = next(field for field in sorted(allowed) if any(other.startswith(field + '.') for other in allowed))
+        child = next(field for field in sorted(allowed) if field.startswith(parent + '.'))
+        fields, projection, response = self.plugin.check_fields(self.entity, {'fields': f'{child},{parent}'})
+        self.assertIsNone(response)
+        self.assertEqual(fields, [parent])
+
+    def test_not_allowed(self):
+        fields, projection, response = self.plugin.check_fields(self.entity, {'fields': 'COD_RH,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.get_json()['message'])
+
+    def test_documented_examples(self):
+        # the example of the parameter fields in the docs of every entity is valid for it
+        for name, entity in ENTITIES.items():
+            doc = getattr(Scienti, f'scienti_{name}').__doc__
+            match = re.search(r'@apiParam \{String\} fields .*?ex: ([\w.,]+)\.', doc, re.S)
+            if match is None:
+                continue
+            fields, projection, response = self.plugin.check_fields(entity, {'fields': match.group(1)})
+            self.assertIsNone(response, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
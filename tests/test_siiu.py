@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+from hunabku_siiu.endpoints.SIIU import SIIU
+
+
+def siiu(mappings):
+    """
+    SIIU plugin without the server, the project index has the fields of mappings.
+    """
+    plugin = SIIU.__new__(SIIU)
+    plugin.es = mock.Mock()
+    plugin.es.indices.get_field_mapping.return_value = {'siiu_project': {'mappings': {
+        field: {'full_name': field, 'mapping': {}} for field in mappings}}}
+    plugin.term_fields = None
+    return plugin
+
+
+class TestSIIUQuery(unittest.TestCase):
+    """
+    Class to test the Elastic Search query of /siiu/project
+    """
+
+    def test_term_fields(self):
+        # CODIGO is text with a keyword subfield, PERSONA_NATURAL a number
+        plugin = siiu(['CODIGO', 'CODIGO.keyword', 'project_participant.PERSONA_NATURAL'])
+        term_fields = plugin.load_term_fields()
+        self.assertEqual(term_fields['CODIGO'], 'CODIGO.keyword')
+        self.assertEqual(term_fields['project_participant.PERSONA_NATURAL'], 'project_participant.PERSONA_NATURAL')
+        # loaded once
+        plugin.load_term_fields()
+        self.assertEqual(plugin.es.indices.get_field_mapping.call_count, 1)
+
+    def test_text_and_exact(self):
+        plugin = siiu(['CODIGO', 'CODIGO.keyword', 'project_participant.PERSONA_NATURAL'])
+        exact = {'CODIGO': '2013-86', 'project_participant.PERSONA_NATURAL': '1234'}
+        body = plugin.project_es_query('agua', None, 'Diego', exact, plugin.load_term_fields())
+        query = body['query']['bool']
+        self.assertEqual(len(query['must']), 2)
+        self.assertEqual(query['must'][1], {'match_phrase': {'project_participant.NOMBRE_COMPLETO': 'Diego'}})
+        self.assertEqual(query['filter'], [{'term': {'CODIGO.keyword': '2013-86'}},
+                                           {'term': {'project_participant.PERSONA_NATURAL': '1234'}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
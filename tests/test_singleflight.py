@@ -0,0 +1,123 @@
+import time
+import unittest
+from threading import Event, Thread
+
+from flask import Flask, request
+
+from hunabku_common.singleflight import SingleFlight, coalesce
+
+
+class Plugin:
+    """
+    Endpoints of a plugin, the first call waits for release.
+    """
+
+    def __init__(self):
+        self.app = Flask(__name__)
+        self.calls = 0
+        self.started = Event()
+        self.release = Event()
+        self.app.add_url_rule('/info', 'info', lambda: self.info())
+        self.app.add_url_rule('/public', 'public', lambda: self.public())
+
+    def valid_apikey(self):
+        return request.args.get('apikey') == 'secret'
+
+    def apikey_error(self):
+        return self.app.response_class(response='unauthorized', status=401)
+
+    @coalesce(apikey=True)
+    def info(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.app.response_class(response=f'call {self.calls}', status=200)
+
+    @coalesce
+    def public(self):
+        self.calls += 1
+        return self.app.response_class(response='public', status=200)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Class to test the calls that share the result of the call in flight
+    """
+
+    def test_shared(self):
+        flights = SingleFlight()
+        started, release = Event(), Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'result'
+        leader = Thread(target=lambda: results.append(flights.do('key', slow)))
+        leader.start()
+        started.wait(5)
+        follower = Thread(target=lambda: results.append(flights.do('key', lambda: 'other')))
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(sorted(results), [('result', False), ('result', True)])
+        # nothing is cached
+        self.assertEqual(flights.do('key', lambda: 'other'), ('other', False))
+
+    def test_error(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise RuntimeError('connection lost')
+        with self.assertRaises(RuntimeError):
+            flights.do('key', fail)
+        self.assertEqual(flights.calls, {})
+
+
+class TestCoalesce(unittest.TestCase):
+    """
+    Class to test the identical requests coalesced by the endpoints
+    """
+
+    def setUp(self):
+        self.plugin = Plugin()
+        self.client = self.plugin.app.test_client()
+
+    def concurrent(self, first, second):
+        responses = {}
+        leader = Thread(target=lambda: responses.update(first=self.client.get(first)))
+        leader.start()
+        self.plugin.started.wait(5)
+        follower = Thread(target=lambda: responses.update(second=self.client.get(second)))
+        follower.start()
+        time.sleep(0.1)
+        self.plugin.release.set()
+        leader.join()
+        follower.join()
+        return responses['first'], responses['second']
+
+    def test_identical(self):
+        first, second = self.concurrent('/info?apikey=secret&a=1', '/info?a=1&apikey=secret')
+        self.assertEqual(self.plugin.calls, 1)
+        self.assertEqual(first.get_data(as_text=True), 'call 1')
+        self.assertEqual(second.get_data(as_text=True), 'call 1')
+
+    def test_different(self):
+        first, second = self.concurrent('/info?apikey=secret&a=1', '/info?apikey=secret&a=2')
+        self.assertEqual(self.plugin.calls, 2)
+
+    def test_apikey(self):
+        # the apikey is checked before joining the request in flight
+        first, second = self.concurrent('/info?apikey=secret', '/info?apikey=other')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 401)
+
+    def test_public(self):
+        self.assertEqual(self.client.get('/public').status_code, 200)
+        self.assertEqual(self.plugin.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()